@@ -1,4 +1,5 @@
 import request from '@/utils/request'
+import { useAuthStore } from '@/store/auth'
 
 // 获取所有交易日
 export function getTradeDates() {
@@ -18,9 +19,10 @@ export function getSseDailySummary(date: string) {
 }
 
 // 兼容旧的 StockHistory 视图导入：若后端未实现 /stocks/history 则会返回 404
-export function getStockHistory(params: { code: string; start_date?: string; end_date?: string; adjust?: string; source?: string }) {
+export function getStockHistory(params: { code: string; start_date?: string; end_date?: string; adjust?: string; source?: string; format?: 'records' | 'columnar' }) {
   // adjust: '' (不复权), 'qfq' (前复权), 'hfq' (后复权)
   // source: 'eastmoney' | 'sina' | 'tencent'
+  // format: 'records'（默认，记录数组） | 'columnar'（{ count, columns, data: { 列名: [...] }, constants }）
   return request({
     url: '/stocks/history',
     method: 'get',
@@ -28,6 +30,27 @@ export function getStockHistory(params: { code: string; start_date?: string; end
   })
 }
 
+// Arrow IPC 格式的历史行情（二进制），可用 apache-arrow 的 tableFromIPC 解码
+export function getStockHistoryArrow(params: { code: string; start_date?: string; end_date?: string; adjust?: string; source?: string }) {
+  return request({
+    url: '/stocks/history',
+    method: 'get',
+    params: { ...params, format: 'arrow' },
+    responseType: 'arraybuffer'
+  })
+}
+
+
+// 服务端计算的技术指标，按日期与 getStockHistory 的结果对齐
+// indicators: 逗号分隔，如 'ma5,ma20,macd,rsi14,boll'
+export function getStockIndicators(params: { code: string; indicators: string; start_date?: string; end_date?: string; adjust?: string; source?: string }) {
+  return request({
+    url: '/stocks/indicators',
+    method: 'get',
+    params,
+  })
+}
+
 
 // 搜索股票建议（用于 autocomplete）
 export function searchStocks(q: string, limit: number = 20) {
@@ -47,6 +70,15 @@ export function getCompanyProfile(q: string) {
   })
 }
 
+// 批量获取公司概况（一次请求、一次查询），返回 data 以传入的代码为键；fields 为空时返回全部字段
+export function getCompanyProfiles(codes: string[], fields?: string[]) {
+  return request({
+    url: '/stocks/company_profiles',
+    method: 'post',
+    data: fields && fields.length ? { codes, fields } : { codes }
+  })
+}
+
 // 按行业等条件搜索公司列表（分页）
 export function searchCompanies(q: string, page: number = 1, page_size: number = 50, industry?: string) {
   const params: any = { q, page, page_size }
@@ -58,3 +90,79 @@ export function searchCompanies(q: string, page: number = 1, page_size: number =
   })
 }
 
+
+// 按行业等条件搜索公司列表（游标分页，适合顺序遍历全部结果，如导出）
+export function searchCompaniesByCursor(q: string, cursor?: string, page_size: number = 200, industry?: string, with_total: boolean = false) {
+  const params: any = { q, page_size, paginate: 'cursor', with_total }
+  if (cursor) params.cursor = cursor
+  if (industry) params.industry = industry
+  return request({
+    url: '/stocks/search_companies',
+    method: 'get',
+    params
+  })
+}
+
+
+// 条件选股：filters 形如 [{ field: 'pe', op: 'between', value: [0, 30] }, { field: 'industry', op: 'in', value: ['半导体'] }]
+export function screenStocks(body: { filters: Array<{ field: string; op: string; value: any }>; sort?: { field: string; order?: 'desc' | 'asc' }; limit?: number; offset?: number }) {
+  return request({
+    url: '/stocks/screen',
+    method: 'post',
+    data: body
+  })
+}
+
+
+// 多股票策略回测；传入 sweep（参数网格）时返回每组参数的指标
+export function runBacktest(body: { codes: string[]; strategy?: 'buy_hold' | 'ma_cross' | 'momentum'; params?: Record<string, any>; sweep?: Record<string, any[]>; start_date?: string; end_date?: string; adjust?: string; source?: string; cost?: number }) {
+  return request({
+    url: '/stocks/backtest',
+    method: 'post',
+    data: body,
+    timeout: 300000
+  })
+}
+
+
+// 批量获取多只股票历史行情：后端按完成顺序逐行返回 NDJSON，每收到一只股票即回调 onItem
+// 返回最后的汇总行 { status: 'done', total, succeeded, failed }
+export async function streamStockHistoryBatch(
+  body: { codes: string[]; start_date?: string; end_date?: string; adjust?: string; source?: string; format?: 'records' | 'columnar' },
+  onItem: (item: { code: string; status: 'ok' | 'error'; count?: number; data?: any[]; message?: string }) => void
+) {
+  const authStore = useAuthStore()
+  const headers: Record<string, string> = { 'Content-Type': 'application/json' }
+  if (authStore.token) headers['Authorization'] = `Bearer ${authStore.token}`
+  const resp = await fetch('/api/stocks/history/batch', { method: 'POST', headers, body: JSON.stringify(body) })
+  if (!resp.ok || !resp.body) {
+    throw new Error((await resp.json().catch(() => ({}))).message || `请求失败: ${resp.status}`)
+  }
+  const reader = resp.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let summary: any = null
+  for (;;) {
+    const { done, value } = await reader.read()
+    if (value) buffer += decoder.decode(value, { stream: !done })
+    let nl: number
+    while ((nl = buffer.indexOf('\n')) >= 0) {
+      const line = buffer.slice(0, nl).trim()
+      buffer = buffer.slice(nl + 1)
+      if (!line) continue
+      const item = JSON.parse(line)
+      if (item.status === 'done') summary = item
+      else onItem(item)
+    }
+    if (done) break
+  }
+  return summary
+}
+
+// 订阅实时行情推送（SSE）：连接建立后先推送一次当前行情，之后只推送有变化的股票；返回取消订阅函数
+export function subscribeQuotes(codes: string[], onQuotes: (quotes: any[]) => void, onError?: (e: Event) => void) {
+  const source = new EventSource(`/api/stocks/quotes/stream?codes=${encodeURIComponent(codes.join(','))}`)
+  source.addEventListener('quotes', (e) => onQuotes(JSON.parse((e as MessageEvent).data)))
+  if (onError) source.onerror = onError
+  return () => source.close()
+}
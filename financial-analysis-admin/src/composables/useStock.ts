@@ -6,6 +6,7 @@ import { ref, Ref } from 'vue'
 import { 
   searchStocks, 
   getStockHistory,
+  subscribeQuotes,
   type StockSearchResult,
   type StockHistoryParams 
 } from '@/api/stock'
@@ -124,7 +125,25 @@ export function useStockRealtime() {
     }
   }
 
+  // 订阅服务端推送，收到的行情按代码合并到 realtimeData；再次调用会替换之前的订阅
+  let unsubscribeQuotes: (() => void) | null = null
+  const subscribe = (codes: string[]) => {
+    unsubscribe()
+    if (!codes.length) return
+    unsubscribeQuotes = subscribeQuotes(codes, (quotes) => {
+      for (const q of quotes) {
+        realtimeData.value[q['代码']] = { ...realtimeData.value[q['代码']], ...q }
+      }
+    })
+  }
+
+  const unsubscribe = () => {
+    unsubscribeQuotes?.()
+    unsubscribeQuotes = null
+  }
+
   const reset = () => {
+    unsubscribe()
     realtimeData.value = {}
     error.value = null
     loading.value = false
@@ -135,6 +154,8 @@ export function useStockRealtime() {
     loading,
     error,
     fetchRealtime,
+    subscribe,
+    unsubscribe,
     updatePrice,
     reset
   }
@@ -1,81 +1,191 @@
 from typing import Optional, Any, Dict, List
+import asyncio
+import json
 import traceback
+from urllib.parse import quote
 
-from fastapi import APIRouter, Query, HTTPException, Depends, Body
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Query, HTTPException, Depends, Body, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import iterate_in_threadpool
 
-from app.services import stock_service
-from app.core.database import get_db
-from sqlalchemy.orm import Session
+from app.services import backtest, quote_stream, stock_service, symbol_search
+from app.core.executor import UpstreamTimeout, await_shared, run_blocking
+from app.core.database import get_async_db, get_pool_stats
+from app.utils.dataframe_utils import ARROW_STREAM_MEDIA_TYPE, iter_dataframe_json
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
 
 
 @router.get("/trade_dates", summary="获取交易日历")
-async def trade_dates() -> JSONResponse:
+async def trade_dates(request: Request) -> JSONResponse:
     try:
-        dates = stock_service.get_trade_dates() or []
+        dates = await run_blocking(stock_service.get_trade_dates, upstream='sina', request=request) or []
         # For backward compatibility return the raw array (frontend expects an array)
         return JSONResponse(content=jsonable_encoder(dates))
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/realtime", summary="获取单个股票实时行情")
-async def get_stock_realtime(code: str = Query(..., description="股票代码（6位数字）")) -> JSONResponse:
+async def get_stock_realtime(request: Request, code: str = Query(..., description="股票代码（6位数字）")) -> JSONResponse:
     """获取单个股票的实时行情数据
     
     - 使用 AKShare 的 stock_individual_info_em 接口
     - 速度快，直接查询单股票
+    - 同一代码的并发请求只回源一次，REALTIME_INFO_TTL 秒内的重复请求直接复用结果
     - 示例: /api/stocks/realtime?code=000001
     """
     try:
-        result = stock_service.get_stock_realtime_info(code)
+        claim = stock_service.claim_stock_realtime_info(code)
+        if claim is None:
+            result = stock_service.get_stock_realtime_info(code)
+        elif claim[2]:
+            code_clean, future, _ = claim
+            try:
+                result = await run_blocking(stock_service.fill_stock_realtime_info, code_clean, future, upstream='eastmoney', request=request)
+            except BaseException as e:
+                # 排队超时、客户端断开或请求被取消时回源可能尚未开始，释放该代码，避免等待方一直挂起；
+                # 已开始的回源 abandon 不做处理，由其自行完成
+                error = e if isinstance(e, Exception) else HTTPException(status_code=503, detail="实时行情请求已取消，请重试")
+                stock_service.abandon_stock_realtime_info(code_clean, future, error)
+                raise
+        else:
+            result = await await_shared(claim[1], upstream='eastmoney', request=request)
         
         if result['status'] == 'error':
             return JSONResponse(
-                content=jsonable_encoder(result),
+                content=result,
                 status_code=400
             )
         
-        return JSONResponse(content=jsonable_encoder(result))
+        return JSONResponse(content=result)
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/realtime/stats", summary="单股实时行情合并统计")
+async def realtime_stats() -> JSONResponse:
+    """/realtime 的新鲜命中、合并等待与实际回源次数。"""
+    return JSONResponse(content=stock_service.get_realtime_info_stats())
+
+
 @router.post("/realtime/batch", summary="批量获取多个股票实时行情")
-async def get_stock_realtime_batch(codes: List[str] = Body(..., description="股票代码列表")) -> JSONResponse:
+async def get_stock_realtime_batch(request: Request, codes: List[str] = Body(..., description="股票代码列表")) -> JSONResponse:
     """批量获取多个股票的实时行情数据
     
     - 从全量市场数据中筛选指定股票
+    - 全量市场数据为进程内共享快照，MARKET_SNAPSHOT_TTL 秒内的请求不会重复下载
     - 适合批量查询
     - 示例: POST /api/stocks/realtime/batch
       Body: ["000001", "600000", "300750"]
     """
     try:
-        result = stock_service.get_stock_realtime_batch(codes)
+        result = await run_blocking(stock_service.get_stock_realtime_batch, codes, upstream='eastmoney', request=request)
         
         if result['status'] == 'error' and result['total'] == 0:
             return JSONResponse(
-                content=jsonable_encoder(result),
+                content=result,
                 status_code=400
             )
         
-        return JSONResponse(content=jsonable_encoder(result))
+        return JSONResponse(content=result)
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
+@router.get("/quotes/stream", summary="实时行情推送（SSE）")
+async def stream_quotes(
+    request: Request,
+    codes: str = Query(..., description="订阅的股票代码，逗号分隔，如 000001,600000")
+) -> Response:
+    """以 Server-Sent Events 推送所订阅股票的行情变化，替代轮询 /realtime 与 /realtime/batch。
+
+    - 连接建立后先推送一次当前行情，之后只推送发生变化的股票（event: quotes，data 为行情数组）
+    - 后台只有一个轮询任务刷新全市场快照，上游请求量与连接数无关
+    - 长时间无更新时发送注释行心跳，保持连接不被代理断开
+    - 示例: /api/stocks/quotes/stream?codes=000001,600000,300750
+    """
+    try:
+        sub = stock_service.subscribe_quotes(codes.split(','))
+    except ValueError as e:
+        return JSONResponse(content={'status': 'error', 'message': str(e)}, status_code=400)
+
+    async def events():
+        try:
+            yield 'retry: 3000\n\n'
+            while not await request.is_disconnected():
+                batch = await sub.next_batch(quote_stream.QUOTE_STREAM_HEARTBEAT)
+                if batch is None:
+                    yield ': ping\n\n'
+                    continue
+                yield f"event: quotes\ndata: {json.dumps(batch, ensure_ascii=False)}\n\n"
+        finally:
+            stock_service.unsubscribe_quotes(sub)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return StreamingResponse(events(), media_type='text/event-stream', headers=headers)
+
+
+@router.get("/quotes/stream/stats", summary="实时行情推送状态")
+async def quote_stream_stats() -> JSONResponse:
+    """当前订阅连接数、订阅的代码数、轮询次数与推送批次数。"""
+    return JSONResponse(content=stock_service.get_quote_stream_stats())
+
+
+@router.post("/screen", summary="条件选股")
+async def screen_stocks(
+    request: Request,
+    filters: List[Dict[str, Any]] = Body([], description="筛选条件列表：[{field, op, value}]"),
+    sort: Optional[Dict[str, Any]] = Body(None, description="排序：{field, order: 'desc' | 'asc'}"),
+    limit: int = Body(50, ge=1, le=500, description="返回数量"),
+    offset: int = Body(0, ge=0, description="偏移量")
+) -> JSONResponse:
+    """基于全市场快照的条件选股
+
+    - 字段支持 pe / pb / pct_chg / turnover / total_mv / industry / region 等别名，也可直接使用快照中文列名
+    - 运算符: > >= < <= == != between（数值）；== != in not_in contains（文本）
+    - 不在请求中访问上游，快照过期时后台刷新
+    - 示例: POST /api/stocks/screen
+      Body: {"filters": [{"field": "pe", "op": "between", "value": [0, 30]}, {"field": "industry", "op": "in", "value": ["半导体"]}],
+             "sort": {"field": "pct_chg", "order": "desc"}, "limit": 50}
+    """
+    try:
+        result = await run_blocking(stock_service.screen_stocks, filters, sort=sort, limit=limit, offset=offset, upstream='screener', request=request)
+        if result['status'] == 'error':
+            return JSONResponse(content=result, status_code=503)
+        return JSONResponse(content=result)
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/search", summary="搜索股票（代码/名称）")
-async def search_stocks(q: Optional[str] = Query(None, description="查询关键字(代码或名称)"), limit: Optional[int] = Query(20, description="返回数量上限")) -> JSONResponse:
+async def search_stocks(request: Request, q: Optional[str] = Query(None, description="查询关键字(代码或名称)"), limit: Optional[int] = Query(20, description="返回数量上限")) -> JSONResponse:
     try:
-        items = stock_service.search_stocks(q or "", limit=limit or 20) or []
+        # 索引就绪后为纯内存查询，直接在事件循环中执行；首次构建索引需要访问数据库/上游，放到线程池
+        if symbol_search.get_index_if_ready() is not None:
+            items = stock_service.search_stocks(q or "", limit=limit or 20) or []
+        else:
+            items = await run_blocking(stock_service.search_stocks, q or "", limit=limit or 20, upstream='search', request=request) or []
         return JSONResponse(content=jsonable_encoder(items))
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
@@ -83,26 +193,31 @@ async def search_stocks(q: Optional[str] = Query(None, description="查询关键
 
 
 @router.get("/trade_dates_with_status", summary="获取交易日历（含每日状态）")
-async def trade_dates_with_status() -> JSONResponse:
+async def trade_dates_with_status(request: Request) -> Response:
     try:
-        dates_with_status = stock_service.get_trade_dates_with_status() or []
-        return JSONResponse(content=jsonable_encoder(dates_with_status))
+        # 序列化结果按自然日缓存，直接返回字节串
+        body = await run_blocking(stock_service.get_trade_dates_with_status_json, upstream='sina', request=request)
+        return Response(content=body, media_type='application/json')
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/sse_daily_summary", summary="上海证券交易所-每日概况")
-async def sse_daily_summary(date: Optional[str] = Query(None, description="交易日期 YYYYMMDD")) -> JSONResponse:
+async def sse_daily_summary(request: Request, date: Optional[str] = Query(None, description="交易日期 YYYYMMDD")) -> JSONResponse:
     try:
-        summary: Dict[str, Any] = stock_service.get_sse_daily_summary(date) or {}
+        summary: Dict[str, Any] = await run_blocking(stock_service.get_sse_daily_summary, date, upstream='sse', request=request) or {}
         # ensure last_open_date field exists for client convenience
         if 'last_open_date' not in summary:
             try:
                 summary['last_open_date'] = stock_service.get_last_open_date()
             except Exception:
                 summary['last_open_date'] = None
-        return JSONResponse(content=jsonable_encoder(summary))
+        return JSONResponse(content=summary)
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
@@ -110,27 +225,254 @@ async def sse_daily_summary(date: Optional[str] = Query(None, description="交
 
 @router.get("/history", summary="获取个股历史行情")
 async def get_stock_history(
+    request: Request,
+    code: str,
+    start_date: Optional[str] = Query(None, description="开始日期 YYYYMMDD"),
+    end_date: Optional[str] = Query(None, description="结束日期 YYYYMMDD"),
+    adjust: Optional[str] = Query('', description="调整类型: '' 不复权, 'qfq' 前复权, 'hfq' 后复权"),
+    source: Optional[str] = Query('eastmoney', description="数据源: eastmoney | sina | tencent"),
+    stream: Optional[str] = Query(None, description="流式返回: ndjson（每行一条记录） | array（分块输出的 JSON 数组）；不传则一次性返回"),
+    fmt: Optional[str] = Query('records', alias='format', description="输出格式: records（记录数组，默认） | columnar（按列 JSON） | arrow（Arrow IPC 二进制流）")
+) -> Response:
+    """获取个股日线。
+
+    - 默认一次性返回 JSON 数组；
+    - stream=array 时立即输出 '[' 再逐块输出记录，结构与默认模式相同，适合不指定 start_date 的全历史请求；
+    - stream=ndjson 时以 application/x-ndjson 逐行输出；
+    - format=columnar 返回 {count, columns, data: {列名: [...]}, constants: {股票代码: ...}}，列名只出现一次；
+    - format=arrow 返回 Arrow IPC 流（application/vnd.apache.arrow.stream），可用 apache-arrow 等库直接解码。
+    """
+    try:
+        try:
+            source, adjust = stock_service.check_history_params(source, adjust)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        fmt = fmt or 'records'
+        if fmt not in stock_service.HISTORY_FORMATS:
+            raise HTTPException(status_code=400, detail=f"format 仅支持 {' / '.join(stock_service.HISTORY_FORMATS)}")
+        if stream:
+            if stream not in ('ndjson', 'array'):
+                raise HTTPException(status_code=400, detail="stream 仅支持 ndjson 或 array")
+            if fmt != 'records':
+                raise HTTPException(status_code=400, detail="stream 仅支持 format=records")
+            return _stream_history(code, start_date, end_date, adjust or "", source, stream)
+        body = await run_blocking(stock_service.get_stock_history_bytes, code=code, start_date=start_date, end_date=end_date, adjust=adjust or "", source=source, fmt=fmt, upstream='history', request=request)
+        # records 格式保持返回原始数组以兼容旧前端；body 已是序列化后的字节串
+        media_type = ARROW_STREAM_MEDIA_TYPE if fmt == 'arrow' else 'application/json'
+        return Response(content=body, media_type=media_type)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _stream_history(code: str, start_date: Optional[str], end_date: Optional[str], adjust: str, source: str, fmt: str) -> StreamingResponse:
+    """流式返回历史日线：数据就绪后按块序列化输出，不在内存中拼出完整响应体。"""
+    async def body():
+        if fmt == 'array':
+            # 先输出首字节，客户端无需等待上游与序列化全部完成
+            yield b'['
+        try:
+            df = await run_blocking(stock_service.get_stock_history_frame_or_empty, code, start_date=start_date, end_date=end_date, adjust=adjust, source=source, upstream='history')
+        except HTTPException as e:
+            # 响应头已发出，无法再改状态码；与非流式模式出错时一样返回空数据
+            print(f"stream history {code}: {e.detail}")
+            df = None
+        async for chunk in iterate_in_threadpool(iter_dataframe_json(df, fmt=fmt, open_bracket=False)):
+            yield chunk
+
+    media_type = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return StreamingResponse(body(), media_type=media_type)
+
+
+async def _history_batch_arrow(codes: List[str], start_date: Optional[str], end_date: Optional[str], adjust: str, source: str) -> Response:
+    """批量接口的 Arrow 输出：并发获取后合并为一个 IPC 流。"""
+    async def fetch_one(code: str):
+        try:
+            return await run_blocking(
+                stock_service.get_stock_history_batch_frame, code, start_date=start_date, end_date=end_date, adjust=adjust, source=source,
+                upstream='history', timeout=stock_service.HISTORY_BATCH_TIMEOUT_SECONDS
+            )
+        except HTTPException as e:
+            return False, str(e.detail)
+
+    results = await asyncio.gather(*(fetch_one(c) for c in codes))
+    frames = [df for ok, df in results if ok]
+    failed = [code for code, (ok, _) in zip(codes, results) if not ok]
+    body = await run_blocking(stock_service.history_frames_to_arrow, frames, upstream='serialize')
+    # 响应头只能是 latin-1：代码逐个百分号编码（普通股票代码原样保留），客户端按逗号拆分后 decodeURIComponent
+    return Response(content=body, media_type=ARROW_STREAM_MEDIA_TYPE, headers={'X-Failed-Codes': ','.join(quote(c, safe='') for c in failed)})
+
+
+@router.post("/history/batch", summary="批量获取多只股票历史行情（NDJSON 流式返回）")
+async def get_stock_history_batch(
+    codes: List[str] = Body(..., description="股票代码列表"),
+    start_date: Optional[str] = Body(None, description="开始日期 YYYYMMDD"),
+    end_date: Optional[str] = Body(None, description="结束日期 YYYYMMDD"),
+    adjust: Optional[str] = Body('', description="调整类型: '' 不复权, 'qfq' 前复权, 'hfq' 后复权"),
+    source: Optional[str] = Body('eastmoney', description="数据源: eastmoney | sina | tencent"),
+    fmt: Optional[str] = Body('records', alias='format', description="输出格式: records | columnar | arrow")
+):
+    """并发获取多只股票的日线，每完成一只即输出一行 JSON（application/x-ndjson）：
+
+    - {"code": "000001", "status": "ok", "count": N, "data": [...]}（format=columnar 时 data 为按列组织的对象）
+    - {"code": "600000", "status": "error", "message": "..."}（单只失败不影响其他股票）
+    - 最后一行为汇总：{"status": "done", "total": N, "succeeded": K, "failed": [...]}
+
+    format=arrow 时等全部完成后返回一个 Arrow IPC 流（以 股票代码 列区分），失败的代码放在响应头 X-Failed-Codes 中（逗号分隔，各代码经百分号编码）。
+
+    回源并发受数据源并发上限控制（UPSTREAM_LIMITS），总耗时约为最慢的一只而非逐只相加。
+    """
+    codes = list(dict.fromkeys(str(c).strip() for c in (codes or []) if str(c).strip()))
+    if not codes:
+        return JSONResponse(content={"status": "error", "message": "股票代码列表不能为空"}, status_code=400)
+    if len(codes) > stock_service.HISTORY_BATCH_MAX_CODES:
+        return JSONResponse(content={"status": "error", "message": f"股票数量超过上限 {stock_service.HISTORY_BATCH_MAX_CODES}"}, status_code=400)
+    try:
+        source, adjust = stock_service.check_history_params(source, adjust)
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    fmt = fmt or 'records'
+    if fmt not in stock_service.HISTORY_FORMATS:
+        return JSONResponse(content={"status": "error", "message": f"format 仅支持 {' / '.join(stock_service.HISTORY_FORMATS)}"}, status_code=400)
+    if fmt == 'arrow':
+        return await _history_batch_arrow(codes, start_date, end_date, adjust or "", source)
+
+    async def fetch_one(code: str):
+        try:
+            ok, line = await run_blocking(
+                stock_service.get_stock_history_batch_line, code, start_date=start_date, end_date=end_date, adjust=adjust or "", source=source, fmt=fmt,
+                upstream='history', timeout=stock_service.HISTORY_BATCH_TIMEOUT_SECONDS
+            )
+            return code, ok, line
+        except HTTPException as e:
+            return code, False, stock_service.history_batch_error_line(code, str(e.detail))
+
+    async def stream():
+        tasks = [asyncio.ensure_future(fetch_one(c)) for c in codes]
+        failed: List[str] = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                code, ok, line = await next_done
+                if not ok:
+                    failed.append(code)
+                yield line
+            summary = {"status": "done", "total": len(codes), "succeeded": len(codes) - len(failed), "failed": failed}
+            yield json.dumps(summary, ensure_ascii=False).encode('utf-8') + b'\n'
+        finally:
+            # 客户端断开时停止等待尚未完成的股票
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(stream(), media_type='application/x-ndjson')
+
+
+@router.get("/history/sources", summary="历史行情数据源状态")
+async def history_sources() -> JSONResponse:
+    """各数据源最近请求的耗时（p50 / p95）、错误率，以及对冲请求与故障转移次数。"""
+    return JSONResponse(content=stock_service.get_history_source_stats())
+
+
+@router.get("/upstream/stats", summary="上游访问层状态")
+async def upstream_stats() -> JSONResponse:
+    """各上游服务商的请求数、合并的重复请求数、限流等待/拒绝次数与熔断器状态。"""
+    return JSONResponse(content=stock_service.get_upstream_stats())
+
+
+@router.get("/db/pool", summary="数据库连接池状态")
+async def db_pool_stats() -> JSONResponse:
+    """同步/异步连接池的配置、当前借出数与累计的借出、等待、超时、重连次数。"""
+    return JSONResponse(content=get_pool_stats())
+
+
+@router.get("/indicators", summary="获取个股技术指标")
+async def get_stock_indicators(
+    request: Request,
     code: str,
+    indicators: str = Query('ma5,ma10,ma20,macd', description="指标列表，逗号分隔：ma{n} / ema{n} / macd[{fast}_{slow}_{signal}] / rsi{n} / boll[{n}_{k}]，如 ma5,ma20,macd,rsi14,boll"),
     start_date: Optional[str] = Query(None, description="开始日期 YYYYMMDD"),
     end_date: Optional[str] = Query(None, description="结束日期 YYYYMMDD"),
     adjust: Optional[str] = Query('', description="调整类型: '' 不复权, 'qfq' 前复权, 'hfq' 后复权"),
     source: Optional[str] = Query('eastmoney', description="数据源: eastmoney | sina | tencent")
+) -> Response:
+    """服务端计算技术指标，返回与 /history 按日期对齐的数组，前端无需再自行计算。
+
+    - 示例: /api/stocks/indicators?code=000001&indicators=ma5,ma20,macd,rsi14,boll&adjust=qfq
+    """
+    try:
+        source, adjust = stock_service.check_history_params(source, adjust)
+        body = await run_blocking(stock_service.get_stock_indicators_json, code=code, indicator_spec=indicators, start_date=start_date, end_date=end_date, adjust=adjust or "", source=source, upstream='history', request=request)
+        return Response(content=body, media_type='application/json')
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/backtest", summary="多股票策略回测")
+async def run_backtest(
+    request: Request,
+    codes: List[str] = Body(..., description="股票池代码列表"),
+    strategy: str = Body('ma_cross', description="策略: buy_hold | ma_cross | momentum"),
+    params: Optional[Dict[str, Any]] = Body(None, description="策略参数，如 {\"fast\": 5, \"slow\": 20}"),
+    sweep: Optional[Dict[str, List[Any]]] = Body(None, description="参数网格，如 {\"fast\": [5, 10], \"slow\": [20, 60]}，传入时并行回测每组参数"),
+    start_date: Optional[str] = Body(None, description="开始日期 YYYYMMDD"),
+    end_date: Optional[str] = Body(None, description="结束日期 YYYYMMDD"),
+    adjust: str = Body('qfq', description="调整类型: '' 不复权, 'qfq' 前复权, 'hfq' 后复权"),
+    source: str = Body('eastmoney', description="数据源: eastmoney | sina | tencent"),
+    cost: float = Body(0.001, ge=0, description="单边交易费率")
 ) -> JSONResponse:
+    """向量化回测：股票池日线对齐为面板后整体计算持仓与收益，返回净值曲线、回撤、换手率与汇总指标。
+
+    - 示例: POST /api/stocks/backtest
+      Body: {"codes": ["000001", "600000"], "strategy": "ma_cross", "params": {"fast": 5, "slow": 20}, "start_date": "20150101"}
+    """
     try:
-        records = stock_service.get_stock_history_data(code=code, start_date=start_date, end_date=end_date, adjust=adjust or "", source=(source or 'eastmoney'))
-        # return raw array for backward compatibility
-        return JSONResponse(content=jsonable_encoder(records))
+        source, adjust = stock_service.check_history_params(source, adjust)
+        result = await run_blocking(
+            stock_service.run_stock_backtest, codes, strategy, params=params, sweep=sweep, start_date=start_date, end_date=end_date,
+            adjust=adjust, source=source, cost=cost,
+            upstream='backtest', timeout=backtest.BACKTEST_TIMEOUT_SECONDS, request=request
+        )
+        if result['status'] == 'error':
+            return JSONResponse(content=result, status_code=400)
+        return JSONResponse(content=result)
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _run_profile_query(db: AsyncSession, queries: List[str], fn, *args):
+    """db.run_sync 中只访问进程内缓存；Redis 读写是阻塞 IO，在其前后放到线程池执行，失败或超时不影响本次查询。"""
+    if stock_service.company_profile_shared_cache_enabled():
+        try:
+            await run_blocking(stock_service.prefetch_company_profiles, queries, upstream='redis')
+        except UpstreamTimeout:
+            pass
+    try:
+        return await db.run_sync(fn, *args)
+    finally:
+        if stock_service.company_profile_cache_has_pending():
+            try:
+                await run_blocking(stock_service.flush_company_profile_cache, upstream='redis')
+            except UpstreamTimeout:
+                pass
+
+
 @router.get('/company_profile', summary='获取公司基本资料')
-async def company_profile(q: Optional[str] = Query(None, description='股票代码或公司名称'), db: Session = Depends(get_db)) -> JSONResponse:
+async def company_profile(q: Optional[str] = Query(None, description='股票代码或公司名称'), db: AsyncSession = Depends(get_async_db)) -> JSONResponse:
     try:
         if not q:
             return JSONResponse(content=jsonable_encoder({"status": "error", "message": "请提供查询关键字 q（股票代码或公司名称）"}), status_code=400)
-        profile = stock_service.get_company_profile(db, q)
+        profile = await _run_profile_query(db, [q], stock_service.get_company_profile, q)
         if not profile:
             return JSONResponse(content=jsonable_encoder({"status": "not_found", "message": f"暂无 {q} 公司数据"}), status_code=200)
         return JSONResponse(content=jsonable_encoder({"status": "ok", "data": profile}))
@@ -139,13 +481,50 @@ async def company_profile(q: Optional[str] = Query(None, description='股票代
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post('/company_profiles', summary='批量获取公司基本资料')
+async def company_profiles(
+    codes: List[str] = Body(..., description='股票代码列表（也可以是公司名称）'),
+    fields: Optional[List[str]] = Body(None, description='返回字段，默认全部；列表页建议不取 company_intro / business_scope'),
+    db: AsyncSession = Depends(get_async_db)
+) -> JSONResponse:
+    """一次请求取回多家公司的资料，数据库侧只执行一次 WHERE stock_code IN (...) 查询（缓存命中的不查库）
+
+    - 返回 data 以请求中的代码为键，查不到的代码列在 not_found 中
+    - 示例: POST /api/stocks/company_profiles
+      Body: {"codes": ["000001", "600000", "SZ300750"], "fields": ["company_name", "eastmoney_industry", "region"]}
+    """
+    try:
+        result = await _run_profile_query(db, codes, stock_service.get_company_profiles, codes, fields)
+        return JSONResponse(content=jsonable_encoder({"status": "ok", **result}))
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get('/company_profile/stats', summary='公司资料缓存状态')
+async def company_profile_stats() -> JSONResponse:
+    """缓存命中率、条目数、别名索引规模与 stock_basic_info 表版本。"""
+    return JSONResponse(content=stock_service.get_company_profile_cache_stats())
+
+
+# paginate 的可选值；page 是 offset 的别名
+_PAGINATE_MODES = ('offset', 'page', 'cursor')
+
+
 @router.get('/search_companies', summary='按行业等条件搜索公司列表（分页）')
 async def search_companies(
     q: Optional[str] = Query('', description='搜索关键词（股票代码、公司名称等）'),
     industry: Optional[str] = Query(None, description='行业筛选（逗号分隔，支持多个，如：电子,计算机,通信）'),
     page: Optional[int] = Query(1, ge=1, description='页码（从1开始）'),
     page_size: Optional[int] = Query(50, ge=1, le=200, description='每页数量（1-200）'),
-    db: Session = Depends(get_db)
+    paginate: Optional[str] = Query('offset', description='分页方式: offset（按页码，也可写作 page） | cursor（游标，适合顺序遍历全部结果）；其他取值返回 400'),
+    cursor: Optional[str] = Query(None, description='游标分页：上一页返回的 next_cursor，传入即启用游标分页'),
+    with_total: Optional[bool] = Query(False, description='游标分页时是否返回 total（需要额外的 COUNT 查询）'),
+    db: AsyncSession = Depends(get_async_db)
 ) -> JSONResponse:
     try:
         # q 和 industry 至少需要一个
@@ -158,13 +537,32 @@ async def search_companies(
                 status_code=400
             )
         
-        result = stock_service.search_companies_by_industry(
-            db, 
-            q=q or '', 
-            industry=industry, 
-            page=page or 1, 
-            page_size=page_size or 50
-        )
+        if paginate not in _PAGINATE_MODES:
+            return JSONResponse(
+                content=jsonable_encoder({
+                    "status": "error",
+                    "message": f"无效的分页方式 paginate: {paginate}，可选值: offset（或 page） | cursor"
+                }),
+                status_code=400
+            )
+
+        if paginate == 'cursor' or cursor:
+            result = await db.run_sync(
+                stock_service.search_companies_keyset,
+                q=q or '',
+                industry=industry,
+                page_size=page_size or 50,
+                cursor=cursor,
+                with_total=bool(with_total)
+            )
+        else:
+            result = await db.run_sync(
+                stock_service.search_companies_by_industry,
+                q=q or '',
+                industry=industry, 
+                page=page or 1, 
+                page_size=page_size or 50
+            )
         
         if 'error' in result:
             return JSONResponse(
@@ -176,6 +574,8 @@ async def search_companies(
             )
         
         return JSONResponse(content=jsonable_encoder({"status": "ok", **result}))
+    except ValueError as e:
+        return JSONResponse(content=jsonable_encoder({"status": "error", "message": str(e)}), status_code=400)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db
 from app.services.auth_service import get_current_user, AuthService
 from app.models.user import User
 from app.schemas.user_schema import UserOut, AvatarUpdate, ProfileUpdate, PasswordChange
@@ -15,20 +15,20 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
 @router.put("/me/avatar", response_model=UserOut)
 async def update_avatar(
     avatar_data: AvatarUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """更新用户头像"""
     current_user.avatar = avatar_data.avatar
     db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
     return current_user
 
 @router.put("/me/profile", response_model=UserOut)
 async def update_profile(
     profile_data: ProfileUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """更新用户资料"""
@@ -43,14 +43,14 @@ async def update_profile(
         current_user.signature = profile_data.signature
     
     db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
     return current_user
 
 @router.post("/me/password")
 async def change_password(
     password_data: PasswordChange,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """修改密码"""
@@ -61,6 +61,6 @@ async def change_password(
     # 更新密码
     current_user.hashed_password = AuthService.get_password_hash(password_data.new_password)
     db.add(current_user)
-    db.commit()
+    await db.commit()
     
     return {"message": "密码修改成功"}
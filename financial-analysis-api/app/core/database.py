@@ -1,8 +1,13 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, exc as sa_exc, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
+from typing import Any, Dict, Optional
 import os
+import threading
+import time
 
 load_dotenv()
 
@@ -12,25 +17,230 @@ DATABASE_HOST = os.getenv("DATABASE_HOST")
 DATABASE_PORT = os.getenv("DATABASE_PORT")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 
-# 先连接到 MySQL 服务器，不指定数据库
-server_url = f"mysql+pymysql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}"
-server_engine = create_engine(server_url)
+# 连接池配置（同步、异步引擎各自一个池，配置相同）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# 池满时等待空闲连接的最长秒数，超时抛 sqlalchemy.exc.TimeoutError
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# 连接最长复用秒数，须小于 MySQL 的 wait_timeout，避免复用已被服务端断开的空闲连接
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# 借出连接前先 ping 一次，失效则透明重连（长时间空闲后的第一批请求不再报错）
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no")
+# 异步驱动：aiomysql / asyncmy；置空则不创建异步引擎，异步会话退化为线程池中的同步会话
+DB_ASYNC_DRIVER = os.getenv("DB_ASYNC_DRIVER", "aiomysql").strip()
 
-# 尝试创建数据库
-with server_engine.connect() as connection:
-    connection.execute(text(f"CREATE DATABASE IF NOT EXISTS {DATABASE_NAME}"))
+# MySQL 服务器地址（不指定数据库），建库时使用
+server_url = f"mysql+pymysql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}"
 
-# 现在连接到新创建的数据库
 SQLALCHEMY_DATABASE_URL = f"{server_url}/{DATABASE_NAME}"
+ASYNC_DATABASE_URL = f"mysql+{DB_ASYNC_DRIVER}://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
+
+
+class PoolMetrics:
+    """连接池计数：借出、等待（借出时池已满）、等待耗时、超时、新建连接与失效连接。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+
+    def record_checkout(self, waited: bool, seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_seconds += seconds
+                self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self, *args) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidate(self, *args) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self, pool: Optional[QueuePool]) -> Dict[str, Any]:
+        with self._lock:
+            data = {
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 4),
+                'avg_wait_ms': round(self.wait_seconds / self.waits * 1000, 2) if self.waits else 0.0,
+                'max_wait_ms': round(self.max_wait_seconds * 1000, 2),
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+            }
+        if pool is not None:
+            data.update({
+                'size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow(),
+            })
+        return data
+
+
+class _MeteredPoolMixin:
+    """在 QueuePool._do_get 外计时：借出时池已满（需要等待其他请求归还）记为一次等待，等待超时记为一次超时。"""
+
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        exhausted = self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except sa_exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(exhausted, time.perf_counter() - started)
+        return record
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+class MeteredQueuePool(_MeteredPoolMixin, QueuePool):
+    metrics = PoolMetrics()
+
+
+class MeteredAsyncPool(_MeteredPoolMixin, AsyncAdaptedQueuePool):
+    metrics = PoolMetrics()
+
+
+def _listen_pool(pool) -> None:
+    """新建连接与连接失效（含 pre-ping 发现的断连）计数；监听器在 pool.recreate() 时随之复制。"""
+    event.listen(pool, 'connect', pool.metrics.record_connect)
+    event.listen(pool, 'invalidate', pool.metrics.record_invalidate)
+
+
+def _pool_options() -> Dict[str, Any]:
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+
+
+# create_engine 不会立即连接，首次执行查询时才建立连接；导入本模块不依赖 MySQL 可用
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=MeteredQueuePool, **_pool_options())
+_listen_pool(engine.pool)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _create_async_engine():
+    """创建异步引擎；未配置异步驱动或驱动/greenlet 未安装时返回 None。"""
+    if not DB_ASYNC_DRIVER:
+        return None
+    try:
+        import greenlet  # noqa: F401
+        from sqlalchemy.ext.asyncio import create_async_engine
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=MeteredAsyncPool, **_pool_options())
+        _listen_pool(async_engine.sync_engine.pool)
+        return async_engine
+    except Exception as e:
+        print(f"async database engine unavailable ({DB_ASYNC_DRIVER}): {e}")
+        return None
+
+
+async_engine = _create_async_engine()
+if async_engine is not None:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+    # 提交后不使对象过期：异步会话中访问过期属性会触发隐式 IO 而报错
+    AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+else:
+    AsyncSessionLocal = None
+
 Base = declarative_base()
 
+
+def provision_database() -> None:
+    """一次性初始化：创建数据库（若不存在）和所有 ORM 模型对应的表。
+
+    部署时通过 migrations/provision_database.py 显式执行（或设置 DB_PROVISION_ON_STARTUP=1），不在每个 worker 启动时运行。
+    """
+    server_engine = create_engine(server_url)
+    try:
+        with server_engine.connect() as connection:
+            connection.execute(text(f"CREATE DATABASE IF NOT EXISTS {DATABASE_NAME}"))
+    finally:
+        server_engine.dispose()
+
+    # 导入模型，使其注册到 Base.metadata
+    from app.models import user  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+class ThreadedSession:
+    """异步驱动不可用时的退化实现：包装同步 Session，所有 IO 操作放到线程池执行，不阻塞事件循环。
+
+    只实现路由中用到的 AsyncSession 接口子集（run_sync / add / commit / refresh / rollback / close）。
+    """
+
+    def __init__(self):
+        self._session = SessionLocal()
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self._session, *args, **kwargs)
+
+    def add(self, instance) -> None:
+        self._session.add(instance)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self._session.commit)
+
+    async def refresh(self, instance) -> None:
+        await run_in_threadpool(self._session.refresh, instance)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self._session.rollback)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self._session.close)
+
+
+async def get_async_db():
+    """异步会话依赖：优先使用异步引擎的 AsyncSession，否则退化为 ThreadedSession。
+
+    现有的同步查询函数（接收 Session 参数）通过 `await db.run_sync(fn, *args)` 调用，两种实现行为一致。
+    """
+    db = AsyncSessionLocal() if AsyncSessionLocal is not None else ThreadedSession()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """同步与异步连接池的配置、当前占用与累计计数。"""
+    return {
+        'config': {
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'pool_timeout': DB_POOL_TIMEOUT,
+            'pool_recycle': DB_POOL_RECYCLE,
+            'pool_pre_ping': DB_POOL_PRE_PING,
+            'async_driver': DB_ASYNC_DRIVER if async_engine is not None else None,
+        },
+        'sync': MeteredQueuePool.metrics.snapshot(engine.pool),
+        'async': MeteredAsyncPool.metrics.snapshot(async_engine.sync_engine.pool) if async_engine is not None else None,
+    }
@@ -0,0 +1,163 @@
+"""阻塞调用执行层
+
+akshare 请求与 pandas 计算都是同步阻塞的，直接在 async 路由里调用会卡住整个事件循环。
+本模块把这类调用放到有界线程池中执行：
+- 全局线程池大小 UPSTREAM_POOL_SIZE；
+- 按数据源（eastmoney / sina / tencent / sse ...）限制并发，UPSTREAM_LIMITS="eastmoney=4,sina=4"，
+  未配置的数据源使用 UPSTREAM_LIMIT_DEFAULT；名称不在 UPSTREAM_NAMES / UPSTREAM_LIMITS 中的一律归入 default，
+  信号量个数固定，不随调用方传入的名称增长；
+- 超时 UPSTREAM_TIMEOUT_SECONDS（含排队时间），超时返回 504；
+- 传入 request 时监听客户端断开，断开后立即停止等待并返回 499。
+
+实际数据源要到工作线程里才确定的调用（历史行情经 source_router 故障转移 / 对冲）不在路由层按数据源计数：
+路由层只占用 history 的名额，真正请求某个数据源时再在工作线程里用 upstream_slot(数据源) 占用该数据源的名额。
+线程侧名额与路由层 run_blocking 的名额分开计数（上限取值相同），同一数据源两条路径的并发合计最多为上限的两倍；
+按服务商的请求速率另由 app.core.upstream 统一限制。
+
+线程无法被强制终止：超时或断开后，已在执行的调用会在后台跑完，其占用的并发名额在真正结束时才释放，
+因此并发上限对上游始终有效。
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+
+load_dotenv()
+
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "32"))
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_SECONDS", "30"))
+UPSTREAM_LIMIT_DEFAULT = int(os.getenv("UPSTREAM_LIMIT_DEFAULT", "8"))
+# 客户端断开检测间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+def _parse_limits(raw: str) -> Dict[str, int]:
+    limits: Dict[str, int] = {}
+    for item in raw.split(','):
+        if '=' not in item:
+            continue
+        name, value = item.split('=', 1)
+        try:
+            limits[name.strip()] = max(1, int(value))
+        except ValueError:
+            print(f"executor: ignore invalid UPSTREAM_LIMITS item '{item}'")
+    return limits
+
+
+UPSTREAM_LIMITS = _parse_limits(os.getenv("UPSTREAM_LIMITS", "eastmoney=8,sina=4,tencent=4,sse=2"))
+# 允许独立限流的上游名称（数据源与本地重计算任务），其余名称共用 default 的并发名额
+UPSTREAM_NAMES = frozenset(('default', 'eastmoney', 'sina', 'tencent', 'sse', 'redis', 'search', 'screener', 'serialize', 'backtest', 'history')) | frozenset(UPSTREAM_LIMITS)
+
+
+class UpstreamTimeout(HTTPException):
+    def __init__(self, source: str):
+        super().__init__(status_code=504, detail=f"上游数据源 {source} 响应超时，请稍后重试")
+
+
+class ClientDisconnected(HTTPException):
+    def __init__(self):
+        # 499: 客户端在响应前关闭连接（nginx 约定）
+        super().__init__(status_code=499, detail="客户端已断开连接")
+
+
+_executor = ThreadPoolExecutor(max_workers=UPSTREAM_POOL_SIZE, thread_name_prefix="upstream")
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def _upstream_name(source: str) -> str:
+    return source if source in UPSTREAM_NAMES else "default"
+
+
+def _semaphore(source: str) -> asyncio.Semaphore:
+    source = _upstream_name(source)
+    sem = _semaphores.get(source)
+    if sem is None:
+        sem = _semaphores[source] = asyncio.Semaphore(UPSTREAM_LIMITS.get(source, UPSTREAM_LIMIT_DEFAULT))
+    return sem
+
+
+_thread_slots: Dict[str, threading.BoundedSemaphore] = {}
+_thread_slots_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def upstream_slot(source: str, timeout: Optional[float] = None) -> Iterator[None]:
+    """在工作线程中占用 source 的并发名额，等待超过 timeout 秒抛出 UpstreamTimeout；不能在事件循环线程中调用。"""
+    source = _upstream_name(source)
+    with _thread_slots_lock:
+        slot = _thread_slots.get(source)
+        if slot is None:
+            slot = _thread_slots[source] = threading.BoundedSemaphore(UPSTREAM_LIMITS.get(source, UPSTREAM_LIMIT_DEFAULT))
+    if not slot.acquire(timeout=UPSTREAM_TIMEOUT_SECONDS if timeout is None else timeout):
+        raise UpstreamTimeout(source)
+    try:
+        yield
+    finally:
+        slot.release()
+
+
+async def _wait_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, upstream: str = "default", timeout: Optional[float] = None,
+                       request: Optional[Request] = None, **kwargs: Any) -> Any:
+    """在线程池中执行 func(*args, **kwargs)，受 upstream 数据源的并发上限、超时与客户端断开控制。"""
+    timeout = UPSTREAM_TIMEOUT_SECONDS if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    loop = asyncio.get_running_loop()
+    upstream = _upstream_name(upstream)
+    sem = _semaphore(upstream)
+
+    try:
+        await asyncio.wait_for(sem.acquire(), timeout)
+    except asyncio.TimeoutError:
+        raise UpstreamTimeout(upstream)
+
+    def _on_done(f: asyncio.Future) -> None:
+        sem.release()
+        # 调用方已放弃等待时，取走异常避免 "exception was never retrieved" 告警
+        if not f.cancelled():
+            f.exception()
+
+    future = loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    future.add_done_callback(_on_done)
+    return await _wait(future, deadline, upstream, request)
+
+
+async def await_shared(future: concurrent.futures.Future, upstream: str = "default", timeout: Optional[float] = None,
+                       request: Optional[Request] = None) -> Any:
+    """等待其他调用已发起的共享结果（如单飞请求），不占用线程池与并发名额；超时与断开处理同 run_blocking。"""
+    if future.done():
+        return future.result()
+    upstream = _upstream_name(upstream)
+    timeout = UPSTREAM_TIMEOUT_SECONDS if timeout is None else timeout
+    wrapped = asyncio.wrap_future(future)
+    wrapped.add_done_callback(lambda f: f.cancelled() or f.exception())
+    return await _wait(wrapped, time.monotonic() + timeout, upstream, request)
+
+
+async def _wait(future: asyncio.Future, deadline: float, upstream: str, request: Optional[Request]) -> Any:
+    watcher = asyncio.ensure_future(_wait_disconnect(request)) if request is not None else None
+    waiters = {future} if watcher is None else {future, watcher}
+    try:
+        done, _ = await asyncio.wait(waiters, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+    if future in done:
+        return future.result()
+    if watcher is not None and watcher in done:
+        raise ClientDisconnected()
+    raise UpstreamTimeout(upstream)
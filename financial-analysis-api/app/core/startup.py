@@ -0,0 +1,28 @@
+"""启动阶段计时
+
+main.py 最先导入本模块，以导入时刻为起点，依次记录各阶段（模块导入、create_app、startup 事件等）的耗时，
+全部启动事件执行完后打印一行汇总，便于定位 worker 启动慢的原因。
+"""
+
+import time
+from typing import List, Tuple
+
+STARTED_AT = time.perf_counter()
+
+_phases: List[Tuple[str, float]] = []
+_last = STARTED_AT
+
+
+def mark(name: str) -> None:
+    """记录从上一个阶段结束到现在的耗时，作为阶段 name 的耗时。"""
+    global _last
+    now = time.perf_counter()
+    _phases.append((name, now - _last))
+    _last = now
+
+
+def ready() -> None:
+    """注册为最后一个 startup 事件：记录启动事件耗时并打印汇总。"""
+    mark('startup_handlers')
+    parts = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in _phases)
+    print(f"startup: ready in {_last - STARTED_AT:.2f}s ({parts})")
@@ -0,0 +1,409 @@
+"""上游 HTTP 访问层
+
+akshare 的各个接口内部都通过 requests 发起 HTTP 请求，且每次调用新建连接、彼此没有任何协调。
+install() 在 requests 层统一接管这些请求，所有 ak.* 调用无需改动即自动经过。
+
+作用范围是整个进程：install() 替换的是 requests.Session.request 与 requests.api.request，本进程内任何使用 requests
+的库（不只是 akshare）的请求都会经过限流、合并与熔断，并计入按域名的统计；不希望如此时设置 UPSTREAM_HTTP_ENABLED=0。
+
+- 连接池：requests.get / requests.post 等模块级调用改走一个共享的 keep-alive Session
+  （UPSTREAM_POOL_CONNECTIONS / UPSTREAM_POOL_MAXSIZE）；
+- 限流：按服务商（域名后缀）令牌桶限速，UPSTREAM_RATE_LIMITS="eastmoney.com=8/16,..."（每秒速率/桶容量），
+  未配置的域名使用 UPSTREAM_RATE_DEFAULT；令牌不足时等待，超过 UPSTREAM_RATE_MAX_WAIT 秒则放弃；
+- 合并：同一时刻完全相同的 GET 请求（同一 Session、URL、参数、请求头与 Cookie）只发出一次，其余调用等待，
+  各自得到该响应的一份副本；带认证、代理、证书等其他选项的请求不合并；
+- 熔断：某服务商连续失败（连接错误 / 超时 / 5xx / 429）达到 UPSTREAM_BREAKER_FAILURES 次后熔断
+  UPSTREAM_BREAKER_COOLDOWN 秒，期间直接失败；冷却后放行一个试探请求，成功即恢复；
+- 未显式指定超时的请求使用 UPSTREAM_HTTP_TIMEOUT。
+
+限流与熔断时抛出 requests.exceptions.ConnectionError 的子类，与上游真实的连接错误走同一条错误处理路径
+（如 source_router 的故障转移）。本地检查见 scripts/check_upstream_layer.py。
+
+akshare 本身导入需要数秒，各模块通过本模块的 ak 延迟导入：首次访问属性（或做真值判断）时才导入，
+导入前自动 install()；未安装 akshare 时 ak 为假值，调用方按「akshare 未安装」处理。
+"""
+
+try:
+    import requests
+    import requests.api
+    from requests.adapters import HTTPAdapter
+except Exception:
+    requests = None
+
+import copy
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UPSTREAM_HTTP_ENABLED = os.getenv("UPSTREAM_HTTP_ENABLED", "1").lower() not in ("0", "false", "no")
+UPSTREAM_HTTP_TIMEOUT = float(os.getenv("UPSTREAM_HTTP_TIMEOUT", "15"))
+UPSTREAM_POOL_CONNECTIONS = int(os.getenv("UPSTREAM_POOL_CONNECTIONS", "16"))
+UPSTREAM_POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", "32"))
+UPSTREAM_RATE_DEFAULT = os.getenv("UPSTREAM_RATE_DEFAULT", "10/20")
+UPSTREAM_RATE_MAX_WAIT = float(os.getenv("UPSTREAM_RATE_MAX_WAIT", "10"))
+UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+UPSTREAM_BREAKER_COOLDOWN = float(os.getenv("UPSTREAM_BREAKER_COOLDOWN", "30"))
+
+
+def _parse_rate(raw: str) -> Tuple[float, float]:
+    rate, _, burst = raw.partition('/')
+    rate = float(rate)
+    return rate, float(burst) if burst else max(1.0, rate)
+
+
+def _parse_rate_limits(raw: str) -> Dict[str, Tuple[float, float]]:
+    limits: Dict[str, Tuple[float, float]] = {}
+    for item in raw.split(','):
+        if '=' not in item:
+            continue
+        host, value = item.split('=', 1)
+        try:
+            limits[host.strip().lower()] = _parse_rate(value.strip())
+        except ValueError:
+            print(f"upstream: ignore invalid UPSTREAM_RATE_LIMITS item '{item}'")
+    return limits
+
+
+UPSTREAM_RATE_LIMITS = _parse_rate_limits(os.getenv(
+    "UPSTREAM_RATE_LIMITS", "eastmoney.com=8/16,sina.com.cn=4/8,sinajs.cn=4/8,gtimg.cn=4/8,qq.com=4/8,sse.com.cn=2/4"
+))
+
+_base_exception = requests.exceptions.ConnectionError if requests is not None else Exception
+
+
+class UpstreamRateLimited(_base_exception):
+    pass
+
+
+class UpstreamCircuitOpen(_base_exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait: float) -> float:
+        """取一个令牌，返回等待的秒数；需要等待的时间超过 max_wait 时抛出 UpstreamRateLimited。"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            if wait > max_wait:
+                self._tokens += 1
+                raise UpstreamRateLimited(f"upstream rate limit: would wait {wait:.1f}s")
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """closed -> (连续失败 N 次) -> open -> (冷却) -> half_open（放行一个试探请求）-> closed / open"""
+
+    def __init__(self, failures: int, cooldown: float):
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before(self, key: str) -> None:
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    raise UpstreamCircuitOpen(f"upstream circuit open for {key}")
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open':
+                if self._probing:
+                    raise UpstreamCircuitOpen(f"upstream circuit half-open for {key}, probe in flight")
+                self._probing = True
+
+    def release(self) -> None:
+        """请求未真正发出（如被限流拒绝）：释放半开状态下占用的试探名额，不计成败。"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._probing = False
+            if ok:
+                self.state = 'closed'
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.max_failures:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class _HostState:
+    def __init__(self, key: str, rate: Tuple[float, float]):
+        self.key = key
+        self.bucket = TokenBucket(*rate)
+        self.breaker = CircuitBreaker(UPSTREAM_BREAKER_FAILURES, UPSTREAM_BREAKER_COOLDOWN)
+        self.requests = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.rejected = 0
+        self.throttled_seconds = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'throttled_seconds': round(self.throttled_seconds, 3),
+            'rate': self.bucket.rate,
+            'burst': self.bucket.burst,
+            'breaker': self.breaker.state,
+        }
+
+
+class UpstreamLayer:
+    def __init__(self, rate_limits: Dict[str, Tuple[float, float]], default_rate: Tuple[float, float]):
+        self.rate_limits = rate_limits
+        self.default_rate = default_rate
+        self._hosts: Dict[str, _HostState] = {}
+        self._inflight: Dict[tuple, _InFlight] = {}
+        self._lock = threading.Lock()
+        self._original_request = None
+        self._original_api_request = None
+        self.session = None
+
+    # ---- 服务商识别 ----
+
+    def _host_key(self, url: str) -> str:
+        host = (urlsplit(url).hostname or '').lower()
+        for suffix in self.rate_limits:
+            if host == suffix or host.endswith('.' + suffix):
+                return suffix
+        return host
+
+    def _host(self, key: str) -> _HostState:
+        with self._lock:
+            state = self._hosts.get(key)
+            if state is None:
+                state = self._hosts[key] = _HostState(key, self.rate_limits.get(key, self.default_rate))
+            return state
+
+    def _count(self, state: _HostState, name: str, amount: float = 1) -> None:
+        with self._lock:
+            setattr(state, name, getattr(state, name) + amount)
+
+    # ---- 请求处理 ----
+
+    # 允许合并的请求参数；出现其他参数（auth / proxies / cert / verify / hooks / files 等）时不合并
+    _COALESCE_KWARGS = frozenset(('params', 'headers', 'cookies', 'timeout', 'allow_redirects'))
+
+    @classmethod
+    def _coalesce_key(cls, session, method: str, url: str, kwargs: Dict[str, Any]) -> Optional[tuple]:
+        """合并键：Session、URL、参数、合并后的请求头与 Cookie；无法可靠比较的请求返回 None（不合并）。"""
+        if method.upper() != 'GET' or any(v is not None for k, v in kwargs.items() if k not in cls._COALESCE_KWARGS):
+            return None
+        if getattr(session, 'auth', None) is not None:
+            return None
+        try:
+            params = kwargs.get('params')
+            encoded = urlencode(sorted(params.items()) if isinstance(params, dict) else (params or []), doseq=True)
+            headers = {str(k).lower(): str(v) for k, v in (getattr(session, 'headers', None) or {}).items()}
+            headers.update((str(k).lower(), str(v)) for k, v in (kwargs.get('headers') or {}).items())
+            cookies = [(c.domain, c.path, c.name, c.value) for c in getattr(session, 'cookies', None) or []]
+            request_cookies = kwargs.get('cookies') or {}
+            if not isinstance(request_cookies, dict):
+                request_cookies = {c.name: c.value for c in request_cookies}
+            return (
+                id(session), url, encoded,
+                tuple(sorted((k, v) for k, v in headers.items() if v != 'None')),
+                tuple(sorted(cookies)), tuple(sorted((str(k), str(v)) for k, v in request_cookies.items())),
+                kwargs.get('allow_redirects', True),
+            )
+        except Exception:
+            return None
+
+    @staticmethod
+    def _clone(response):
+        """合并请求的等待方各自拿到一份副本（响应体字节串共享，其余可变属性复制），互不影响。"""
+        clone = copy.copy(response)
+        clone.headers = copy.copy(response.headers)
+        clone.cookies = copy.copy(response.cookies)
+        clone.history = list(response.history)
+        return clone
+
+    @staticmethod
+    def _is_failure(response) -> bool:
+        return response.status_code >= 500 or response.status_code == 429
+
+    def _send(self, state: _HostState, session, method: str, url: str, kwargs: Dict[str, Any]):
+        state.breaker.before(state.key)
+        try:
+            waited = state.bucket.acquire(UPSTREAM_RATE_MAX_WAIT)
+        except UpstreamRateLimited:
+            self._count(state, 'rejected')
+            state.breaker.release()
+            raise
+        self._count(state, 'throttled_seconds', waited)
+        kwargs.setdefault('timeout', UPSTREAM_HTTP_TIMEOUT)
+        self._count(state, 'requests')
+        try:
+            response = self._original_request(session, method, url, **kwargs)
+        except Exception:
+            self._count(state, 'errors')
+            state.breaker.record(False)
+            raise
+        failed = self._is_failure(response)
+        if failed:
+            self._count(state, 'errors')
+        state.breaker.record(not failed)
+        if not kwargs.get('stream'):
+            # 读取响应体，连接归还连接池；合并请求的等待方共享该响应
+            _ = response.content
+        return response
+
+    def request(self, session, method: str, url: str, **kwargs):
+        state = self._host(self._host_key(url))
+        key = self._coalesce_key(session, method, url, kwargs)
+        if key is None:
+            return self._send(state, session, method, url, kwargs)
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _InFlight()
+            else:
+                flight.waiters += 1
+        if not leader:
+            self._count(state, 'coalesced')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return self._clone(flight.response)
+
+        try:
+            flight.response = self._send(state, session, method, url, kwargs)
+            return flight.response
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    # ---- 安装 ----
+
+    def install(self) -> bool:
+        """接管 requests：Session.request 经过限流 / 合并 / 熔断，模块级 requests.get 等改用共享 Session。"""
+        if requests is None or self._original_request is not None:
+            return False
+        layer = self
+        self._original_request = requests.Session.request
+        self._original_api_request = requests.api.request
+
+        def session_request(session, method, url, **kwargs):
+            return layer.request(session, method, url, **kwargs)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=UPSTREAM_POOL_CONNECTIONS, pool_maxsize=UPSTREAM_POOL_MAXSIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        def api_request(method, url, **kwargs):
+            return layer.session.request(method=method, url=url, **kwargs)
+
+        requests.Session.request = session_request
+        requests.api.request = api_request
+        return True
+
+    def uninstall(self) -> None:
+        if self._original_request is None:
+            return
+        requests.Session.request = self._original_request
+        requests.api.request = self._original_api_request
+        self._original_request = self._original_api_request = None
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'installed': self._original_request is not None,
+                'inflight': len(self._inflight),
+                'hosts': {h.key: h.snapshot() for h in self._hosts.values()},
+            }
+
+
+upstream_layer = UpstreamLayer(UPSTREAM_RATE_LIMITS, _parse_rate(UPSTREAM_RATE_DEFAULT))
+
+
+def install() -> bool:
+    """安装上游访问层（幂等）；UPSTREAM_HTTP_ENABLED=0 或未安装 requests 时不做任何事。"""
+    if not UPSTREAM_HTTP_ENABLED:
+        return False
+    return upstream_layer.install()
+
+
+class LazyAkshare:
+    """akshare 的延迟导入代理：`if not ak` 判断是否可用，`ak.xxx(...)` 调用接口。"""
+
+    def __init__(self):
+        self._module = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None and not self._failed:
+            with self._lock:
+                if self._module is None and not self._failed:
+                    install()
+                    started = time.perf_counter()
+                    try:
+                        import akshare
+                        self._module = akshare
+                        print(f"upstream: akshare imported in {time.perf_counter() - started:.2f}s")
+                    except Exception as e:
+                        self._failed = True
+                        print(f"upstream: akshare unavailable: {e}")
+        return self._module
+
+    def __bool__(self) -> bool:
+        return self.load() is not None
+
+    @property
+    def failed(self) -> bool:
+        """是否已确认无法导入；不触发导入、不等待正在进行的导入，可在事件循环线程上调用。"""
+        return self._failed
+
+    def __getattr__(self, name: str):
+        module = self.load()
+        if module is None:
+            raise AttributeError(f"akshare 未安装，无法调用 {name}")
+        return getattr(module, name)
+
+
+ak = LazyAkshare()
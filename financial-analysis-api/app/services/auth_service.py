@@ -69,11 +69,12 @@ class AuthService:
 
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
-from app.core.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -87,7 +88,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except jwt.PyJWTError:
         raise credentials_exception
     
-    user = AuthService.get_user_by_username(db, username=username)
+    # 与路由共用同一个请求级会话（FastAPI 依赖缓存），返回的 user 可直接在路由中修改并提交
+    user = await db.run_sync(AuthService.get_user_by_username, username)
     if user is None:
         raise credentials_exception
     return user
@@ -0,0 +1,274 @@
+"""向量化多股票回测
+
+流程：
+1. load_panels：并发读取股票池中每只股票的日线（优先本地 history_store），对齐为 日期 × 股票 的收盘价/成交量面板；
+2. 策略函数在整张面板上生成目标权重（同为 日期 × 股票），不逐日、逐股票循环；
+3. run_backtest：权重滞后一天持仓，组合收益 = Σ 权重 × 个股日收益 − 换手 × 手续费，
+   输出净值曲线、回撤、换手率与汇总指标；
+4. run_sweep：参数网格中的各组参数互相独立，按进程数分块后分发到模块级共享的进程池并行计算，
+   每块只传递一次面板。进程池以 forkserver（不可用时 spawn）方式启动子进程，不从多线程的 worker 中 fork。
+
+本模块只依赖 numpy / pandas，子进程导入时不会连接数据库或访问上游。
+"""
+
+import itertools
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BACKTEST_MAX_SYMBOLS = int(os.getenv("BACKTEST_MAX_SYMBOLS", "500"))
+BACKTEST_MAX_COMBINATIONS = int(os.getenv("BACKTEST_MAX_COMBINATIONS", "200"))
+BACKTEST_LOAD_WORKERS = int(os.getenv("BACKTEST_LOAD_WORKERS", "8"))
+BACKTEST_PROCESSES = int(os.getenv("BACKTEST_PROCESSES", str(os.cpu_count() or 2)))
+# 进程池子进程的启动方式：forkserver / spawn（不建议 fork，见 _process_pool）
+BACKTEST_START_METHOD = os.getenv("BACKTEST_START_METHOD", "forkserver")
+BACKTEST_TIMEOUT_SECONDS = float(os.getenv("BACKTEST_TIMEOUT_SECONDS", "300"))
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+# ---- 面板加载 ----
+
+def load_panels(codes: List[str], frame_loader: Callable[[str], pd.DataFrame]) -> Tuple[pd.DataFrame, pd.DataFrame, List[str]]:
+    """并发加载并对齐面板，返回 (close, volume, 加载失败的代码)。
+
+    frame_loader(code) 返回标准化日线（含 '日期' / '收盘' / '成交量' 列）。
+    """
+    def load(code: str) -> Tuple[str, Optional[pd.Series], Optional[pd.Series]]:
+        try:
+            df = frame_loader(code)
+        except Exception as e:
+            print(f"backtest: failed to load {code}: {e}")
+            return code, None, None
+        if df is None or df.empty or '日期' not in df.columns or '收盘' not in df.columns:
+            return code, None, None
+        index = pd.Index(df['日期'].to_numpy())
+        keep = ~index.duplicated(keep='last')
+        close = pd.Series(pd.to_numeric(df['收盘'], errors='coerce').to_numpy()[keep], index=index[keep])
+        volume = None
+        if '成交量' in df.columns:
+            volume = pd.Series(pd.to_numeric(df['成交量'], errors='coerce').to_numpy()[keep], index=index[keep])
+        return code, close, volume
+
+    close: Dict[str, pd.Series] = {}
+    volume: Dict[str, pd.Series] = {}
+    missing: List[str] = []
+    # 数据大多来自本地 Parquet，线程池主要用于重叠少量回源请求的等待时间
+    with ThreadPoolExecutor(max_workers=BACKTEST_LOAD_WORKERS, thread_name_prefix='backtest-load') as pool:
+        for code, c, v in pool.map(load, codes):
+            if c is None:
+                missing.append(code)
+                continue
+            close[code] = c
+            if v is not None:
+                volume[code] = v
+
+    close_panel = pd.DataFrame(close).sort_index()
+    volume_panel = pd.DataFrame(volume).reindex(index=close_panel.index, columns=close_panel.columns)
+    close_panel.index = volume_panel.index = pd.to_datetime(close_panel.index)
+    return close_panel, volume_panel, missing
+
+
+# ---- 策略：输入面板，输出目标权重（每行权重之和 <= 1，只做多） ----
+
+def _equal_weight(selected: pd.DataFrame) -> pd.DataFrame:
+    counts = selected.sum(axis=1).replace(0, np.nan)
+    return selected.div(counts, axis=0).fillna(0.0)
+
+
+def strategy_buy_hold(close: pd.DataFrame, volume: pd.DataFrame) -> pd.DataFrame:
+    """等权持有当日所有有价格的股票。"""
+    return _equal_weight(close.notna().astype(float))
+
+
+def strategy_ma_cross(close: pd.DataFrame, volume: pd.DataFrame, fast: int = 5, slow: int = 20) -> pd.DataFrame:
+    """均线多头：快线在慢线之上时持有，每只股票固定分配 1/N 资金，未持有部分为现金。"""
+    fast, slow = int(fast), int(slow)
+    if fast >= slow:
+        raise ValueError("ma_cross 要求 fast < slow")
+    ma_fast = close.rolling(fast, min_periods=fast).mean()
+    ma_slow = close.rolling(slow, min_periods=slow).mean()
+    signal = (ma_fast > ma_slow).astype(float)
+    return signal / max(1, close.shape[1])
+
+
+def strategy_momentum(close: pd.DataFrame, volume: pd.DataFrame, lookback: int = 20, top_n: int = 10,
+                      rebalance: int = 5, min_volume: float = 0) -> pd.DataFrame:
+    """截面动量：每 rebalance 个交易日按过去 lookback 日收益排序，等权持有前 top_n 只；
+    min_volume > 0 时剔除近 20 日平均成交量低于该值的股票。"""
+    lookback, top_n, rebalance = int(lookback), int(top_n), max(1, int(rebalance))
+    score = close / close.shift(lookback) - 1
+    if min_volume and not volume.empty:
+        score = score.where(volume.rolling(20, min_periods=1).mean() >= float(min_volume))
+    rank = score.rank(axis=1, ascending=False, method='first')
+    selected = (rank <= top_n).astype(float)
+    weights = _equal_weight(selected)
+    # 只在调仓日更新权重，其余交易日沿用上一调仓日的权重
+    is_rebalance = np.arange(len(weights)) % rebalance == 0
+    weights[~is_rebalance] = np.nan
+    return weights.ffill().fillna(0.0)
+
+
+STRATEGIES: Dict[str, Callable[..., pd.DataFrame]] = {
+    'buy_hold': strategy_buy_hold,
+    'ma_cross': strategy_ma_cross,
+    'momentum': strategy_momentum,
+}
+
+
+# ---- 回测计算 ----
+
+def _metrics(returns: np.ndarray, equity: np.ndarray, drawdown: np.ndarray, turnover: np.ndarray) -> Dict[str, Any]:
+    n = len(returns)
+    if n == 0:
+        return {}
+    vol = float(np.std(returns, ddof=1)) * math.sqrt(TRADING_DAYS_PER_YEAR) if n > 1 else 0.0
+    annual_return = float(equity[-1] ** (TRADING_DAYS_PER_YEAR / n) - 1) if equity[-1] > 0 else -1.0
+    mean = float(np.mean(returns)) * TRADING_DAYS_PER_YEAR
+    return {
+        'total_return': float(equity[-1] - 1),
+        'annual_return': annual_return,
+        'annual_volatility': vol,
+        'sharpe': mean / vol if vol > 0 else None,
+        'max_drawdown': float(drawdown.min()),
+        'avg_daily_turnover': float(turnover.mean()),
+        'annual_turnover': float(turnover.mean() * TRADING_DAYS_PER_YEAR),
+        'trading_days': n,
+    }
+
+
+def run_backtest(close: pd.DataFrame, volume: pd.DataFrame, strategy: str, params: Optional[Dict[str, Any]] = None,
+                 cost: float = 0.001, with_curve: bool = True) -> Dict[str, Any]:
+    """在已对齐的面板上执行单组参数回测。
+
+    - 当日收盘生成信号，次日起持仓（权重整体滞后一天），避免未来函数；
+    - 停牌/未上市（价格缺失）的股票收益记为 0 且不可持有；
+    - cost 为单边费率，按换手（权重变化绝对值之和）扣除。
+    """
+    func = STRATEGIES.get(strategy)
+    if func is None:
+        raise ValueError(f"不支持的策略: {strategy}（可选 {' / '.join(STRATEGIES)}）")
+    try:
+        target = func(close, volume, **(params or {}))
+    except TypeError as e:
+        raise ValueError(f"策略参数错误: {e}")
+
+    tradable = close.notna().to_numpy()
+    weights = np.where(tradable, target.to_numpy(dtype=float), 0.0)
+    held = np.vstack([np.zeros((1, weights.shape[1])), weights[:-1]]) if len(weights) else weights
+
+    prices = close.ffill().to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rets = prices[1:] / prices[:-1] - 1
+    rets = np.vstack([np.zeros((1, prices.shape[1])), rets]) if len(prices) else prices
+    rets = np.nan_to_num(rets, nan=0.0, posinf=0.0, neginf=0.0)
+
+    turnover = np.abs(np.diff(held, axis=0, prepend=np.zeros((1, held.shape[1])))).sum(axis=1)
+    port = (held * rets).sum(axis=1) - turnover * cost
+    equity = np.cumprod(1 + port)
+    drawdown = equity / np.maximum.accumulate(equity) - 1 if len(equity) else equity
+
+    result: Dict[str, Any] = {
+        'strategy': strategy,
+        'params': params or {},
+        'metrics': _metrics(port, equity, drawdown, turnover),
+    }
+    if with_curve:
+        result['curve'] = pd.DataFrame({
+            '日期': close.index.strftime('%Y-%m-%d'),
+            'equity': equity,
+            'drawdown': drawdown,
+            'turnover': turnover,
+        })
+    return result
+
+
+# ---- 参数扫描 ----
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool() -> ProcessPoolExecutor:
+    """首次扫描时创建、各请求共享的进程池，进程数固定为 BACKTEST_PROCESSES，并发扫描在池中排队。
+
+    不使用 fork：uvicorn worker 中已有多个后台线程（数据源路由、行情轮询、日历刷新等），fork 时其他线程持有的锁
+    会以加锁状态复制到子进程中，可能导致子进程死锁；forkserver / spawn 的子进程从干净的解释器启动，只预加载本模块。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = BACKTEST_START_METHOD if BACKTEST_START_METHOD in multiprocessing.get_all_start_methods() else 'spawn'
+            context = multiprocessing.get_context(method)
+            if method == 'forkserver':
+                context.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=BACKTEST_PROCESSES, mp_context=context)
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """子进程异常退出后进程池不可再用，丢弃后下次扫描重新创建。"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _run_combo(close: pd.DataFrame, volume: pd.DataFrame, strategy: str, params: Dict[str, Any], cost: float) -> Dict[str, Any]:
+    try:
+        return run_backtest(close, volume, strategy, params, cost, with_curve=False)
+    except ValueError as e:
+        return {'strategy': strategy, 'params': params, 'error': str(e)}
+
+
+def _run_chunk(close: pd.DataFrame, volume: pd.DataFrame, strategy: str, combos: List[Dict[str, Any]], cost: float) -> List[Dict[str, Any]]:
+    return [_run_combo(close, volume, strategy, p, cost) for p in combos]
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """{'fast': [5, 10], 'slow': [20, 60]} -> 4 组参数。"""
+    if not grid:
+        return []
+    names = list(grid)
+    values = [v if isinstance(v, (list, tuple)) else [v] for v in grid.values()]
+    combos = [dict(zip(names, combo)) for combo in itertools.product(*values)]
+    if len(combos) > BACKTEST_MAX_COMBINATIONS:
+        raise ValueError(f"参数组合过多（{len(combos)}），上限 {BACKTEST_MAX_COMBINATIONS}")
+    return combos
+
+
+def run_sweep(close: pd.DataFrame, volume: pd.DataFrame, strategy: str, base_params: Optional[Dict[str, Any]],
+              grid: Dict[str, List[Any]], cost: float = 0.001) -> List[Dict[str, Any]]:
+    """对参数网格逐组回测（进程池并行），按夏普比率降序返回各组的指标。"""
+    if strategy not in STRATEGIES:
+        raise ValueError(f"不支持的策略: {strategy}（可选 {' / '.join(STRATEGIES)}）")
+    combos = [{**(base_params or {}), **c} for c in expand_grid(grid)]
+    if len(combos) <= 1 or BACKTEST_PROCESSES <= 1:
+        results = [_run_combo(close, volume, strategy, p, cost) for p in combos]
+    else:
+        # 按进程数切成连续的块，每块传递一次面板；结果按原参数顺序拼接
+        size = math.ceil(len(combos) / min(BACKTEST_PROCESSES, len(combos)))
+        pool = _process_pool()
+        try:
+            futures = [pool.submit(_run_chunk, close, volume, strategy, combos[i:i + size], cost) for i in range(0, len(combos), size)]
+            results = [r for f in futures for r in f.result()]
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+
+    def sort_key(r: Dict[str, Any]):
+        sharpe = (r.get('metrics') or {}).get('sharpe')
+        return (sharpe is None, -(sharpe or 0.0))
+
+    return sorted(results, key=sort_key)
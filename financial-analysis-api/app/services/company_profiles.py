@@ -0,0 +1,408 @@
+"""公司基本资料（stock_basic_info）缓存与代码解析
+
+stock_basic_info 通常每天最多重新装载一次，而公司资料页是访问量最大的数据库查询：
+- 输入归一化：'SZ000001' / 'sz000001' / '000001.SZ' / '000001' 解析为表中的 stock_code；公司全称、简称、曾用名通过别名索引解析，
+  部分名称在索引内做子串匹配，不再执行 LIKE '%q%' 全表扫描。
+- 两级缓存：进程内 LRU + 可选的 Redis（设置 REDIS_URL 且安装了 redis 包时启用，多个 worker 共享），缓存值为序列化后的 JSON。
+- 失效：以 information_schema.TABLES.UPDATE_TIME 作为表版本，至多每 COMPANY_PROFILE_VERSION_CHECK_SECONDS 秒检查一次；
+  表被重新装载后清空 LRU 与别名索引，Redis 键中带表版本，旧版本的键到期自动删除。
+
+注意：查询函数在 AsyncSession.run_sync 中执行时与事件循环同线程，因此持锁期间不做任何数据库 IO，且只访问进程内 LRU；
+Redis 读写是阻塞网络 IO，由路由在 run_sync 前后通过 run_blocking 调用 prefetch_shared / flush_shared 完成。
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+load_dotenv()
+
+COMPANY_PROFILE_CACHE_SIZE = int(os.getenv("COMPANY_PROFILE_CACHE_SIZE", "2048"))
+COMPANY_PROFILE_CACHE_TTL = float(os.getenv("COMPANY_PROFILE_CACHE_TTL", str(6 * 3600)))
+COMPANY_PROFILE_VERSION_CHECK_SECONDS = float(os.getenv("COMPANY_PROFILE_VERSION_CHECK_SECONDS", "30"))
+REDIS_URL = os.getenv("REDIS_URL", "").strip()
+# Redis 调用在线程池中同步执行，超时要短；出错后暂停使用一段时间
+COMPANY_PROFILE_REDIS_TIMEOUT = float(os.getenv("COMPANY_PROFILE_REDIS_TIMEOUT", "0.1"))
+_REDIS_RETRY_INTERVAL = 30.0
+# 别名索引加载失败后，两次重试之间的最小间隔（秒）
+_ALIAS_RETRY_INTERVAL = 60.0
+
+_CODE_RE = re.compile(r'^(?:(sh|sz|bj)\.?)?(\d{6})(?:\.(sh|sz|bj))?$', re.IGNORECASE)
+_FORMER_NAME_SEP = re.compile(r'->|[,，;；、]')
+
+
+def exchange_of(digits: str) -> str:
+    """按 6 位代码推断交易所：6/9 开头为上交所，0/2/3 开头为深交所，4/8 及 92 开头为北交所。"""
+    if digits.startswith('92') or digits[:1] in ('4', '8'):
+        return 'BJ'
+    if digits[:1] in ('6', '9'):
+        return 'SH'
+    return 'SZ'
+
+
+def normalize_stock_code(q: str) -> Optional[str]:
+    """'sz000001' / '000001.SZ' / '000001' -> 'SZ000001'；不是股票代码格式时返回 None。"""
+    m = _CODE_RE.match(str(q).strip())
+    if not m:
+        return None
+    digits = m.group(2)
+    exchange = (m.group(1) or m.group(3) or exchange_of(digits)).upper()
+    return exchange + digits
+
+
+def _name_key(name: Any) -> str:
+    """名称比较键：全角转半角、去掉空白、小写（东方财富简称中常见 '万  科Ａ' 这类写法）。"""
+    s = unicodedata.normalize('NFKC', str(name or ''))
+    return ''.join(s.split()).lower()
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
+
+
+def dumps_profile(profile: Dict[str, Any]) -> str:
+    return json.dumps(profile, ensure_ascii=False, default=_json_default, separators=(',', ':'))
+
+
+class AliasIndex:
+    """不可变的 名称/代码 -> stock_code 索引，表版本变化时整体重建。"""
+
+    def __init__(self, rows: Iterable[Dict[str, Any]]):
+        self.by_code: Dict[str, str] = {}
+        self.by_digits: Dict[str, str] = {}
+        self.by_name: Dict[str, str] = {}
+        # (可搜索文本, stock_code)，按 6 位代码排序；子串匹配与原 LIKE 查询的字段一致（代码、全称、简称）
+        self._haystack: List[Tuple[str, str]] = []
+        former: List[Tuple[str, str]] = []
+
+        for r in sorted(rows, key=lambda r: str(r.get('a_stock_code') or r['stock_code'] or '')):
+            code = str(r['stock_code'] or '').strip()
+            if not code:
+                continue
+            self.by_code[code.upper()] = code
+            digits = str(r.get('a_stock_code') or '').strip() or code[-6:]
+            if digits.isdigit():
+                self.by_digits.setdefault(digits, code)
+            names = [k for k in (_name_key(r.get('company_name')), _name_key(r.get('a_stock_abbr'))) if k]
+            for k in names:
+                self.by_name.setdefault(k, code)
+            for n in _FORMER_NAME_SEP.split(str(r.get('former_name') or '')):
+                k = _name_key(n)
+                if k:
+                    former.append((k, code))
+            self._haystack.append(('\x00'.join([digits.lower()] + names), code))
+
+        # 曾用名优先级低于现用名：同一名称被其他公司当前使用时不覆盖
+        for k, code in former:
+            self.by_name.setdefault(k, code)
+
+    def __len__(self) -> int:
+        return len(self.by_code)
+
+    def resolve(self, q: str) -> Optional[str]:
+        """精确代码 > 6 位数字代码 > 名称（全称/简称/曾用名）精确匹配 > 代码或名称子串匹配。"""
+        normalized = normalize_stock_code(q)
+        if normalized is not None:
+            return self.by_code.get(normalized) or self.by_digits.get(normalized[2:])
+        key = _name_key(q)
+        if not key:
+            return None
+        code = self.by_code.get(key.upper()) or self.by_name.get(key)
+        if code is not None:
+            return code
+        for haystack, code in self._haystack:
+            if key in haystack:
+                return code
+        return None
+
+
+def _load_aliases(db) -> AliasIndex:
+    sql = text(
+        """
+        SELECT stock_code, a_stock_code, company_name, a_stock_abbr, former_name
+        FROM stock_basic_info
+        WHERE stock_code IS NOT NULL AND stock_code <> ''
+        """
+    )
+    return AliasIndex(db.execute(sql).mappings().fetchall())
+
+
+_TABLE_VERSION_SQL = (
+    "SELECT {hint}UPDATE_TIME FROM information_schema.TABLES "
+    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'stock_basic_info'"
+)
+_stats_expiry_hint = True
+
+
+def _table_version(db) -> str:
+    """stock_basic_info 的最后修改时间（InnoDB 在提交时更新），表未修改过或无法获取时为 'none'。"""
+    global _stats_expiry_hint
+    row = None
+    if _stats_expiry_hint:
+        # MySQL 8 默认缓存 information_schema 统计信息 24 小时；SET_VAR 只对本条语句生效，不改动连接池中连接的会话变量。
+        # 5.7 / MariaDB 忽略该提示；个别服务端拒绝时退回普通查询
+        try:
+            row = db.execute(text(_TABLE_VERSION_SQL.format(hint="/*+ SET_VAR(information_schema_stats_expiry = 0) */ "))).fetchone()
+        except Exception as e:
+            _stats_expiry_hint = False
+            print(f"company profile cache: SET_VAR hint not supported, using plain version query: {e}")
+    if not _stats_expiry_hint:
+        row = db.execute(text(_TABLE_VERSION_SQL.format(hint=""))).fetchone()
+    return str(row[0]) if row and row[0] is not None else 'none'
+
+
+class CompanyProfileCache:
+    def __init__(self, max_entries: int, ttl: float, version_check_interval: float, redis_url: str = ''):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self.redis_url = redis_url
+        self._lru: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._version_checked_at = -version_check_interval
+        self._aliases: Optional[AliasIndex] = None
+        self._alias_loading = threading.Lock()
+        self._alias_failed_at = -_ALIAS_RETRY_INTERVAL
+        self._redis = None
+        self._redis_failed_at = -_REDIS_RETRY_INTERVAL
+        # 等待 flush_shared 写入 Redis 的条目：{Redis 键: JSON}
+        self._pending: Dict[str, str] = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # ---- 失效 ----
+
+    def check_version(self, db) -> None:
+        """距上次检查超过间隔时读取表版本，变化则清空缓存。"""
+        if time.monotonic() - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = time.monotonic()
+        try:
+            version = _table_version(db)
+        except Exception as e:
+            print(f"company profile cache: version check failed: {e}")
+            return
+        previous, self._version = self._version, version
+        if version != previous:
+            if previous is not None:
+                print(f"company profile cache: stock_basic_info changed ({previous} -> {version}), invalidating")
+            self.invalidate()
+
+    def table_version(self, db) -> Optional[str]:
+        """按检查间隔刷新后的 stock_basic_info 表版本；其他以该表为数据源的缓存可把它放进缓存键随表失效。"""
+        self.check_version(db)
+        return self._version
+
+    def invalidate(self) -> None:
+        """清空进程内缓存与别名索引；Redis 中的旧条目因表版本变化不再被读取。"""
+        with self._lock:
+            self._lru.clear()
+            self._pending.clear()
+            self._aliases = None
+            self._alias_failed_at = -_ALIAS_RETRY_INTERVAL
+            self.invalidations += 1
+
+    def generation(self) -> int:
+        """失效计数；读库前取一次，写缓存时传回，期间发生过失效则放弃写入（避免把旧数据写进新版本）。"""
+        return self.invalidations
+
+    # ---- 代码解析 ----
+
+    def aliases(self, db) -> Optional[AliasIndex]:
+        """当前别名索引；首次使用或失效后在调用线程上构建。其他请求正在构建或近期构建失败时返回 None。"""
+        index = self._aliases
+        if index is not None:
+            return index
+        if time.monotonic() - self._alias_failed_at < _ALIAS_RETRY_INTERVAL:
+            return None
+        # 不阻塞等待：同一线程上的另一个协程可能正持有该锁并在等待数据库 IO
+        if not self._alias_loading.acquire(blocking=False):
+            return None
+        try:
+            if self._aliases is None:
+                try:
+                    self._aliases = _load_aliases(db)
+                except Exception as e:
+                    self._alias_failed_at = time.monotonic()
+                    print(f"company profile cache: failed to load alias index: {e}")
+            return self._aliases
+        finally:
+            self._alias_loading.release()
+
+    def resolve(self, db, q: str) -> Tuple[bool, Optional[str]]:
+        """返回 (是否已通过索引解析, stock_code)；索引不可用时为 (False, None)，调用方应退回 SQL 查询。"""
+        index = self.aliases(db)
+        if index is None:
+            return False, None
+        return True, index.resolve(q)
+
+    # ---- 缓存读写 ----
+
+    def _shared_key(self, code: str) -> str:
+        return f"company_profile:{self._version or 'none'}:{code}"
+
+    def shared_enabled(self) -> bool:
+        """配置了 Redis 且不在出错后的暂停期内。"""
+        return bool(self.redis_url) and time.monotonic() - self._redis_failed_at >= _REDIS_RETRY_INTERVAL
+
+    def _shared(self):
+        if not self.shared_enabled():
+            return None
+        if self._redis is None:
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(
+                    self.redis_url,
+                    socket_timeout=COMPANY_PROFILE_REDIS_TIMEOUT,
+                    socket_connect_timeout=COMPANY_PROFILE_REDIS_TIMEOUT,
+                )
+            except Exception as e:
+                self._redis_failed_at = time.monotonic()
+                print(f"company profile cache: redis unavailable: {e}")
+                return None
+        return self._redis
+
+    def _shared_failed(self, e: Exception) -> None:
+        self._redis_failed_at = time.monotonic()
+        print(f"company profile cache: redis error, retry in {_REDIS_RETRY_INTERVAL:.0f}s: {e}")
+
+    def _remember(self, code: str, payload: str) -> None:
+        with self._lock:
+            self._lru[code] = (time.monotonic() + self.ttl, payload)
+            self._lru.move_to_end(code)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _local(self, code: str) -> Optional[str]:
+        with self._lock:
+            entry = self._lru.get(code)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._lru[code]
+                return None
+            self._lru.move_to_end(code)
+            return entry[1]
+
+    def get_many(self, codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """按 stock_code 批量读取进程内缓存，返回命中的部分；不做任何 IO，可在事件循环线程上调用。"""
+        found: Dict[str, Dict[str, Any]] = {}
+        for code in codes:
+            payload = self._local(code)
+            if payload is not None:
+                found[code] = json.loads(payload)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(codes) - len(found)
+        return found
+
+    def prefetch_shared(self, queries: List[str]) -> None:
+        """阻塞调用，需在线程池中执行：把 queries 对应、进程内未命中的资料从 Redis 读入 LRU。
+
+        只用已加载的别名索引解析代码，不访问数据库；本进程尚未读取过表版本时跳过（无法确定 Redis 键）。
+        """
+        if self._version is None:
+            return
+        index = self._aliases
+        codes = [index.resolve(q) if index is not None else normalize_stock_code(q) for q in queries]
+        with self._lock:
+            missing = list(dict.fromkeys(c for c in codes if c and c not in self._lru))
+        shared = self._shared() if missing else None
+        if shared is None:
+            return
+        generation = self.generation()
+        try:
+            values = shared.mget([self._shared_key(c) for c in missing])
+        except Exception as e:
+            self._shared_failed(e)
+            return
+        if generation != self.invalidations:
+            return
+        loaded = 0
+        for code, raw in zip(missing, values):
+            if raw is None:
+                continue
+            self._remember(code, raw.decode('utf-8') if isinstance(raw, bytes) else raw)
+            loaded += 1
+        with self._lock:
+            self.shared_hits += loaded
+
+    def get(self, code: str) -> Optional[Dict[str, Any]]:
+        return self.get_many([code]).get(code)
+
+    def put_many(self, profiles: Dict[str, Dict[str, Any]], generation: Optional[int] = None) -> None:
+        if generation is not None and generation != self.invalidations:
+            return
+        payloads = {code: dumps_profile(p) for code, p in profiles.items()}
+        for code, payload in payloads.items():
+            self._remember(code, payload)
+        if self.redis_url:
+            # 键在此时按当前表版本确定；实际写入由 flush_shared 在线程池中完成
+            with self._lock:
+                self._pending.update((self._shared_key(code), payload) for code, payload in payloads.items())
+                # 调用方未 flush 时不无限积累
+                while len(self._pending) > self.max_entries:
+                    self._pending.pop(next(iter(self._pending)))
+
+    def has_pending_shared(self) -> bool:
+        return bool(self._pending)
+
+    def flush_shared(self) -> None:
+        """阻塞调用，需在线程池中执行：把 put_many 积累的条目写入 Redis；Redis 不可用时丢弃。"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        shared = self._shared() if pending else None
+        if shared is None:
+            return
+        try:
+            pipe = shared.pipeline(transaction=False)
+            for key, payload in pending.items():
+                pipe.set(key, payload, ex=max(1, int(self.ttl)))
+            pipe.execute()
+        except Exception as e:
+            self._shared_failed(e)
+
+    def put(self, code: str, profile: Dict[str, Any], generation: Optional[int] = None) -> None:
+        self.put_many({code: profile}, generation)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._lru),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                # 从 Redis 预取进 LRU 的条目数（随后的命中计入 hits）
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'table_version': self._version,
+                'aliases': len(self._aliases) if self._aliases is not None else None,
+                'shared_cache': bool(self.redis_url) and self._redis is not None,
+                'shared_pending': len(self._pending),
+            }
+
+
+profile_cache = CompanyProfileCache(
+    COMPANY_PROFILE_CACHE_SIZE, COMPANY_PROFILE_CACHE_TTL, COMPANY_PROFILE_VERSION_CHECK_SECONDS, REDIS_URL
+)
@@ -0,0 +1,367 @@
+"""历史行情本地列式存储
+
+特性：
+- 按 (source, adjust, code) 分区，将标准化后的日线数据以 Parquet 文件持久化到本地磁盘。
+- 每个分区附带一个 JSON 元数据文件，记录已覆盖的日期区间 [start, end]（YYYYMMDD）。
+- 请求时优先读取本地数据，只对缺失的日期区间回源；当日（未收盘）数据不落盘，每次实时获取。
+- 回源返回空数据时不扩展已覆盖区间（限流 / 临时故障常表现为空结果），除非交易日历确认该区间内没有交易日。
+- 回源时与已存储数据重叠一根 K 线做校验，若收盘价不一致（如前复权因子变化）则整个分区重建。
+- 前复权（qfq）分区即使已完整覆盖请求区间，每天首次读取时也重新获取最后一根 K 线校验一次，除权除息后及时重建。
+- 数据文件按版本号命名，元数据记录当前版本；先写新版本数据文件、再原子替换元数据，读方看到的数据与元数据始终成对。
+- 分区只保存其数据源自身的数据：回源被路由到备用数据源（故障转移 / 对冲）时，结果直接返回、不落盘，
+  避免不同数据源的列与单位（如成交量 手 / 股）混入同一分区。
+- 未安装 pyarrow 时自动降级为直接回源，不影响原有行为。
+"""
+
+import os
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from dotenv import load_dotenv
+
+try:
+    import pyarrow  # noqa: F401  pandas 的 to_parquet/read_parquet 依赖 pyarrow
+except Exception:
+    pyarrow = None
+
+load_dotenv()
+
+_API_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HISTORY_STORE_DIR = os.getenv("HISTORY_STORE_DIR") or os.path.join(_API_ROOT, "data", "history")
+HISTORY_STORE_ENABLED = os.getenv("HISTORY_STORE_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# 分区目录只允许以下取值：source / adjust / code 来自请求参数，不能直接拼进文件路径
+HISTORY_SOURCES = ('eastmoney', 'sina', 'tencent')
+HISTORY_ADJUSTS = ('', 'qfq', 'hfq')
+
+# 未指定开始日期时使用的最早日期（早于 A 股首个交易日）
+DEFAULT_START_DATE = "19900101"
+
+# fetcher(start_date, end_date) -> (实际返回数据的数据源, 标准化后的 DataFrame（日期列为 'YYYY-MM-DD'）)；回源失败时应抛出异常
+HistoryFetcher = Callable[[str, str], Tuple[str, pd.DataFrame]]
+# has_trading_days(start, end) -> [start, end]（YYYYMMDD）内是否有交易日；日历不可用或未覆盖该区间时返回 None
+TradingDaysCheck = Callable[[str, str], Optional[bool]]
+# usable(df, start, end) -> 回源结果能否计入覆盖区间
+_Usable = Callable[[pd.DataFrame, str, str], bool]
+
+
+def _to_ymd(d: str) -> str:
+    return str(d).replace("-", "")[:8]
+
+
+def _to_iso(d: str) -> str:
+    d = _to_ymd(d)
+    return f"{d[:4]}-{d[4:6]}-{d[6:8]}"
+
+
+def _shift_ymd(d: str, days: int) -> str:
+    return (datetime.strptime(d, "%Y%m%d") + timedelta(days=days)).strftime("%Y%m%d")
+
+
+class _ForeignSourceResult(Exception):
+    """回源结果来自备用数据源：中止落盘，由 read() 直接返回备用数据源的数据。"""
+
+    def __init__(self, source: str, start: str, end: str, df: Optional[pd.DataFrame]):
+        super().__init__(source)
+        self.source = source
+        self.start = start
+        self.end = end
+        self.df = df
+
+
+def normalize_code(code: str) -> str:
+    """'sh600000' / 'SZ000001' / '000001' -> 6 位数字代码，用作分区名。"""
+    s = str(code).strip().lower()
+    if s[:2] in ("sh", "sz", "bj"):
+        s = s[2:]
+    return s[-6:] if len(s) >= 6 else s.zfill(6)
+
+
+class HistoryStore:
+    """基于 Parquet 的历史行情分区存储。"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    # ---- 分区文件 ----
+
+    @staticmethod
+    def _check(code: str, source: str, adjust: str) -> str:
+        """校验分区参数，返回 6 位代码；不在白名单内时抛出 ValueError。"""
+        if source not in HISTORY_SOURCES:
+            raise ValueError(f"unsupported history source: {source!r}")
+        if adjust not in HISTORY_ADJUSTS:
+            raise ValueError(f"unsupported adjust: {adjust!r}")
+        code6 = normalize_code(code)
+        if not code6.isdigit():
+            raise ValueError(f"invalid stock code: {code!r}")
+        return code6
+
+    def _partition_dir(self, source: str, adjust: str) -> str:
+        return os.path.join(self.root, source, adjust or "none")
+
+    def _base(self, code: str, source: str, adjust: str) -> str:
+        return os.path.join(self._partition_dir(source, adjust), self._check(code, source, adjust))
+
+    @staticmethod
+    def _data_path(base: str, version: Optional[str]) -> str:
+        # 无版本号的元数据来自旧格式分区，对应 <code>.parquet
+        return f"{base}.{version}.parquet" if version else base + ".parquet"
+
+    @staticmethod
+    def _read_meta(meta_path: str) -> Optional[Dict[str, str]]:
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write_meta(meta_path: str, meta: Dict[str, str]) -> None:
+        tmp_meta = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, meta_path)
+
+    def _lock(self, code: str, source: str, adjust: str) -> threading.Lock:
+        key = (normalize_code(code), source, adjust)
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def _load(self, code: str, source: str, adjust: str) -> Tuple[pd.DataFrame, Optional[Dict[str, str]]]:
+        base = self._base(code, source, adjust)
+        meta_path = base + ".meta.json"
+        # 读元数据与读数据之间可能被其他 worker 切换到新版本（旧版本数据文件随即删除），此时重读一次元数据
+        for _ in range(2):
+            try:
+                meta = self._read_meta(meta_path)
+                if meta is None:
+                    return pd.DataFrame(), None
+                return pd.read_parquet(self._data_path(base, meta.get("version"))), meta
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                print(f"history store: failed to load partition {base}: {e}")
+                return pd.DataFrame(), None
+        return pd.DataFrame(), None
+
+    def _save(self, code: str, source: str, adjust: str, df: pd.DataFrame, start: str, end: str) -> None:
+        base = self._base(code, source, adjust)
+        meta_path = base + ".meta.json"
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        previous = self._read_meta(meta_path)
+        version = uuid.uuid4().hex
+        data_path = self._data_path(base, version)
+        # 数据写到新版本的文件名，不覆盖读方可能正在读取的旧版本；再原子替换元数据切换到新版本
+        tmp_data = data_path + ".tmp"
+        df.reset_index(drop=True).to_parquet(tmp_data, index=False)
+        os.replace(tmp_data, data_path)
+        self._write_meta(meta_path, {
+            "start": start,
+            "end": end,
+            "version": version,
+            "checked": datetime.now().strftime("%Y%m%d"),
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        })
+        if previous is not None:
+            try:
+                os.remove(self._data_path(base, previous.get("version")))
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self, code: str, source: str, adjust: str) -> None:
+        base = self._base(code, source, adjust)
+        meta_path = base + ".meta.json"
+        meta = self._read_meta(meta_path)
+        # 先删元数据：分区随即视为不存在，再清理数据文件
+        for path in [meta_path] + ([self._data_path(base, meta.get("version"))] if meta is not None else []):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    # ---- 读取 / 增量回源 ----
+
+    @staticmethod
+    def _prepare(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+        if df is None or df.empty or "日期" not in df.columns:
+            return pd.DataFrame()
+        return df.drop(columns=["股票代码"], errors="ignore")
+
+    @staticmethod
+    def _slice(df: pd.DataFrame, start: str, end: str) -> pd.DataFrame:
+        if df.empty:
+            return df
+        mask = (df["日期"] >= _to_iso(start)) & (df["日期"] <= _to_iso(end))
+        return df.loc[mask]
+
+    @staticmethod
+    def _same_bar(stored: pd.DataFrame, fetched: pd.DataFrame, date_iso: str) -> bool:
+        """比较重叠的那根 K 线，判断已存储数据是否仍与上游一致。"""
+        if "收盘" not in stored.columns or "收盘" not in fetched.columns:
+            return True
+        a = stored.loc[stored["日期"] == date_iso, "收盘"]
+        b = fetched.loc[fetched["日期"] == date_iso, "收盘"]
+        if a.empty or b.empty:
+            return True
+        try:
+            return abs(float(a.iloc[0]) - float(b.iloc[0])) < 1e-6
+        except Exception:
+            return True
+
+    def _reanchor(self, code: str, source: str, adjust: str, stored: pd.DataFrame, meta: Dict[str, str], fetcher: HistoryFetcher,
+                  usable: _Usable) -> pd.DataFrame:
+        """重新获取已存储的最后一根 K 线做校验：一致则记录当天已校验，不一致（除权除息后前复权价整体变化）则整个分区重建。
+
+        上游不可用（含被路由到备用数据源）时跳过校验，本次仍返回已存储数据，下次读取再校验。
+        """
+        anchor = stored["日期"].iloc[-1]
+        try:
+            latest = self._prepare(fetcher(_to_ymd(anchor), _to_ymd(anchor)))
+        except Exception as e:
+            print(f"history store: skip re-anchoring {code} ({source}/{adjust}): {e!r}")
+            return stored
+        if not usable(latest, _to_ymd(anchor), _to_ymd(anchor)):
+            print(f"history store: skip re-anchoring {code} ({source}/{adjust}): empty response")
+            return stored
+        if self._same_bar(stored, latest, anchor):
+            meta_path = self._base(code, source, adjust) + ".meta.json"
+            # 其他 worker 已切换到新版本时不覆盖其元数据
+            current = self._read_meta(meta_path)
+            if current is not None and current.get("version") == meta.get("version"):
+                self._write_meta(meta_path, {**meta, "checked": datetime.now().strftime("%Y%m%d")})
+            return stored
+        print(f"history store: adjust factors changed for {code} ({source}/{adjust}), rebuilding partition")
+        df = self._prepare(fetcher(meta["start"], meta["end"]))
+        if not usable(df, meta["start"], meta["end"]):
+            print(f"history store: empty response rebuilding {code} ({source}/{adjust}), keeping partition")
+            return stored
+        self._save(code, source, adjust, df, meta["start"], meta["end"])
+        return df
+
+    def _sync(self, code: str, source: str, adjust: str, start: str, end: str, fetcher: HistoryFetcher, usable: _Usable) -> pd.DataFrame:
+        """确保 [start, end] 已落盘并返回该区间数据（调用方需持有分区锁）。
+
+        不可用（空）的回源结果不落盘、不扩展覆盖区间，下次读取时重新回源。
+        """
+        stored, meta = self._load(code, source, adjust)
+        if meta is None:
+            df = self._prepare(fetcher(start, end))
+            if not usable(df, start, end):
+                print(f"history store: empty response for {code} ({source}/{adjust}) {start}-{end}, not stored")
+                return df
+            self._save(code, source, adjust, df, start, end)
+            return self._slice(df, start, end)
+
+        cov_start, cov_end = meta["start"], meta["end"]
+        if start >= cov_start and end <= cov_end:
+            if adjust == "qfq" and not stored.empty and meta.get("checked") != datetime.now().strftime("%Y%m%d"):
+                stored = self._reanchor(code, source, adjust, stored, meta, fetcher, usable)
+            return self._slice(stored, start, end)
+
+        parts = [stored]
+        consistent = True
+        new_start, new_end = cov_start, cov_end
+        # 缺失的前段：多取到已存储的第一根 K 线做一致性校验
+        if start < cov_start:
+            anchor = stored["日期"].iloc[0] if not stored.empty else _to_iso(cov_start)
+            head = self._prepare(fetcher(start, _to_ymd(anchor)))
+            if usable(head, start, _to_ymd(anchor)):
+                consistent = consistent and self._same_bar(stored, head, anchor)
+                parts.insert(0, head)
+                new_start = start
+            else:
+                print(f"history store: empty response for {code} ({source}/{adjust}) {start}-{_to_ymd(anchor)}, coverage unchanged")
+        # 缺失的后段：从已存储的最后一根 K 线开始取
+        if end > cov_end:
+            anchor = stored["日期"].iloc[-1] if not stored.empty else _to_iso(_shift_ymd(cov_end, 1))
+            tail = self._prepare(fetcher(_to_ymd(anchor), end))
+            if usable(tail, _to_ymd(anchor), end):
+                consistent = consistent and self._same_bar(stored, tail, anchor)
+                parts.append(tail)
+                new_end = end
+            else:
+                print(f"history store: empty response for {code} ({source}/{adjust}) {_to_ymd(anchor)}-{end}, coverage unchanged")
+
+        if (new_start, new_end) == (cov_start, cov_end):
+            return self._slice(stored, start, end)
+        if consistent:
+            parts = [p for p in parts if not p.empty]
+            df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+            if not df.empty:
+                df = df.drop_duplicates(subset="日期", keep="last").sort_values("日期", ignore_index=True)
+        else:
+            # 复权因子已变化，旧数据作废，整段重新获取
+            print(f"history store: adjust factors changed for {code} ({source}/{adjust}), rebuilding partition")
+            df = self._prepare(fetcher(new_start, new_end))
+            if not usable(df, new_start, new_end):
+                print(f"history store: empty response rebuilding {code} ({source}/{adjust}), keeping partition")
+                return self._slice(df, start, end)
+        self._save(code, source, adjust, df, new_start, new_end)
+        return self._slice(df, start, end)
+
+    def read(self, code: str, source: str, adjust: str, start_date: Optional[str], end_date: Optional[str], fetcher: HistoryFetcher,
+             has_trading_days: Optional[TradingDaysCheck] = None) -> pd.DataFrame:
+        """读取 [start_date, end_date] 的日线，缺失区间通过 fetcher 回源。
+
+        空的回源结果只有在 has_trading_days 确认区间内没有交易日时才记为已覆盖；未提供日历时空结果一律不落盘。
+
+        source / adjust / code 不在白名单内时抛出 ValueError，不会落到存储目录之外。
+
+        今天及以后的数据视为未最终确认：不写入存储，每次请求直接回源。
+        任一次回源由备用数据源应答时，本次请求整段使用备用数据源的数据且不落盘，同一响应中不混用不同数据源。
+        """
+        source, adjust = source or "eastmoney", adjust or ""
+        self._check(code, source, adjust)
+        today = datetime.now().strftime("%Y%m%d")
+        start = _to_ymd(start_date) if start_date else DEFAULT_START_DATE
+        end = _to_ymd(end_date) if end_date else today
+        if start > end:
+            return pd.DataFrame()
+
+        def usable(df: pd.DataFrame, s: str, e: str) -> bool:
+            return not df.empty or (has_trading_days is not None and has_trading_days(s, e) is False)
+
+        def fetch_own(s: str, e: str) -> pd.DataFrame:
+            actual, df = fetcher(s, e)
+            if actual != source:
+                raise _ForeignSourceResult(actual, s, e, df)
+            return df
+
+        finalized_end = min(end, _shift_ymd(today, -1))
+        parts: List[pd.DataFrame] = []
+        try:
+            if start <= finalized_end:
+                with self._lock(code, source, adjust):
+                    parts.append(self._sync(code, source, adjust, start, finalized_end, fetch_own, usable))
+            if end > finalized_end:
+                parts.append(self._prepare(fetch_own(max(start, today), end)))
+        except _ForeignSourceResult as foreign:
+            print(f"history store: {code} ({source}/{adjust}) served by {foreign.source}, not stored")
+            if foreign.start <= start and foreign.end >= end:
+                df = foreign.df
+            else:
+                _, df = fetcher(start, end)
+            return self._slice(self._prepare(df), start, end).reset_index(drop=True)
+
+        parts = [p for p in parts if not p.empty]
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(parts, ignore_index=True)
+
+
+history_store = HistoryStore(HISTORY_STORE_DIR)
+
+
+def is_enabled() -> bool:
+    return HISTORY_STORE_ENABLED and pyarrow is not None
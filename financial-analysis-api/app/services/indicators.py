@@ -0,0 +1,217 @@
+"""技术指标计算
+
+在标准化后的日线（见 stock_service._standardize_history_columns）上一次性计算所需指标，全部为整列向量运算：
+- MA{n}：简单移动平均
+- EMA{n}：指数移动平均
+- MACD{fast}_{slow}_{signal}：DIF / DEA / MACD 柱（= 2 * (DIF - DEA)，国内行情软件口径），默认 12,26,9
+- RSI{n}：Wilder 平滑的相对强弱指标，默认 14
+- BOLL{n}_{k}：布林带 中轨 / 上轨 / 下轨（总体标准差），默认 20,2
+
+指标规格为逗号分隔的字符串，不区分大小写，如 'ma5,ma20,macd,rsi14,boll'。
+
+结果按 (code, adjust, source, 指标规格) 缓存在进程内 LRU 中。再次请求时若已缓存的 K 线仍是新数据的前缀，
+只计算新增的尾部：移动平均/布林带只需回看窗口长度的收盘价，EMA 类指标以缓存中最后一根的值为种子继续递推，
+与全量计算结果一致。最后一根（盘中未收盘）或首根（前复权因子变化）收盘价不一致时自动退化为部分/全量重算。
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+INDICATOR_CACHE_SIZE = int(os.getenv("INDICATOR_CACHE_SIZE", "256"))
+
+_SPEC_RE = re.compile(r'^([a-z]+)(\d+(?:\.\d+)?(?:_\d+(?:\.\d+)?)*)?$')
+
+# 指标名 -> 默认参数（请求中未给出的参数按位置补齐）
+_DEFAULTS: Dict[str, Tuple[float, ...]] = {
+    'ma': (5,),
+    'ema': (12,),
+    'macd': (12, 26, 9),
+    'rsi': (14,),
+    'boll': (20, 2),
+}
+
+
+def parse_indicators(spec: str) -> List[Tuple[str, Tuple[float, ...]]]:
+    """'ma5,macd,boll20_2' -> [('ma', (5,)), ('macd', (12, 26, 9)), ('boll', (20, 2))]；无法识别时抛出 ValueError。"""
+    items: List[Tuple[str, Tuple[float, ...]]] = []
+    for raw in str(spec or '').split(','):
+        token = raw.strip().lower()
+        if not token:
+            continue
+        m = _SPEC_RE.match(token)
+        if not m or m.group(1) not in _DEFAULTS:
+            raise ValueError(f"不支持的指标: {raw.strip()}（可选 ma / ema / macd / rsi / boll）")
+        name = m.group(1)
+        defaults = _DEFAULTS[name]
+        given = [float(p) for p in m.group(2).split('_')] if m.group(2) else []
+        if len(given) > len(defaults):
+            raise ValueError(f"指标参数过多: {raw.strip()}")
+        params = tuple(given) + defaults[len(given):]
+        # 除布林带倍数外均为周期，必须是正整数
+        periods = params[:1] if name == 'boll' else params
+        if any(p < 1 or p != int(p) for p in periods):
+            raise ValueError(f"指标周期必须为正整数: {raw.strip()}")
+        params = tuple(int(p) if i < len(periods) else p for i, p in enumerate(params))
+        if (name, params) not in items:
+            items.append((name, params))
+    if not items:
+        raise ValueError("请至少指定一个指标，如 indicators=ma5,ma20,macd")
+    return items
+
+
+def _fmt(v: float) -> str:
+    return str(int(v)) if float(v) == int(v) else str(v)
+
+
+def _label(name: str, params: Tuple[float, ...]) -> str:
+    return name.upper() + '_'.join(_fmt(p) for p in params)
+
+
+def output_columns(items: List[Tuple[str, Tuple[float, ...]]]) -> List[str]:
+    """对外输出的列名，顺序与请求一致。"""
+    cols: List[str] = []
+    for name, params in items:
+        label = _label(name, params)
+        if name == 'macd':
+            cols += [f'{label}_DIF', f'{label}_DEA', f'{label}_MACD']
+        elif name == 'boll':
+            cols += [f'{label}_MID', f'{label}_UP', f'{label}_LOW']
+        else:
+            cols.append(label)
+    return cols
+
+
+# ---- 向量化计算：均从位置 start 开始计算到末尾，prev 为 [0, start) 已算好的列 ----
+
+def _rolling(close: np.ndarray, n: int, start: int) -> Tuple[np.ndarray, np.ndarray]:
+    """close[start:] 每个位置的 n 日均值与总体标准差；不足 n 根时为 NaN。"""
+    lo = max(0, start - n + 1)
+    window = pd.Series(close[lo:]).rolling(n)
+    mean = window.mean().to_numpy()[start - lo:]
+    std = window.std(ddof=0).to_numpy()[start - lo:]
+    return mean, std
+
+
+def _ema(values: np.ndarray, alpha: float, seed: Optional[float]) -> np.ndarray:
+    """y_t = alpha * x_t + (1 - alpha) * y_{t-1}；seed 为前一根的 y，None 时以首个值起算。"""
+    if len(values) == 0:
+        return values.astype(float)
+    if seed is None or not np.isfinite(seed):
+        return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    seeded = np.concatenate([[seed], values])
+    return pd.Series(seeded).ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+
+
+def _seed(prev: Optional[Dict[str, np.ndarray]], col: str, start: int) -> Optional[float]:
+    if prev is None or start == 0:
+        return None
+    return float(prev[col][start - 1])
+
+
+def _compute(close: np.ndarray, items: List[Tuple[str, Tuple[float, ...]]], start: int = 0,
+             prev: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+    """返回各列（含以 '_' 开头的内部递推状态列）在 [start, len(close)) 上的值。"""
+    out: Dict[str, np.ndarray] = {}
+    tail = close[start:]
+    for name, params in items:
+        label = _label(name, params)
+        if name == 'ma':
+            out[label], _ = _rolling(close, params[0], start)
+        elif name == 'ema':
+            out[label] = _ema(tail, 2.0 / (params[0] + 1), _seed(prev, label, start))
+        elif name == 'macd':
+            fast, slow, signal = params
+            ema_fast = _ema(tail, 2.0 / (fast + 1), _seed(prev, f'_{label}_FAST', start))
+            ema_slow = _ema(tail, 2.0 / (slow + 1), _seed(prev, f'_{label}_SLOW', start))
+            dif = ema_fast - ema_slow
+            dea = _ema(dif, 2.0 / (signal + 1), _seed(prev, f'{label}_DEA', start))
+            out[f'_{label}_FAST'], out[f'_{label}_SLOW'] = ema_fast, ema_slow
+            out[f'{label}_DIF'], out[f'{label}_DEA'], out[f'{label}_MACD'] = dif, dea, 2 * (dif - dea)
+        elif name == 'rsi':
+            n = params[0]
+            # 第 i 根的涨跌为 close[i] - close[i-1]，首根没有涨跌
+            delta = np.diff(close[max(0, start - 1):])
+            gain, loss = np.where(delta > 0, delta, 0.0), np.where(delta < 0, -delta, 0.0)
+            up = _ema(gain, 1.0 / n, _seed(prev, f'_{label}_UP', start))
+            down = _ema(loss, 1.0 / n, _seed(prev, f'_{label}_DOWN', start))
+            if start == 0:
+                up, down = np.concatenate([[np.nan], up]), np.concatenate([[np.nan], down])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rsi = np.where(up + down > 0, 100.0 * up / (up + down), 50.0)
+            # 前 n 根数据不足
+            rsi[np.arange(start, len(close)) < n] = np.nan
+            out[f'_{label}_UP'], out[f'_{label}_DOWN'], out[label] = up, down, rsi
+        elif name == 'boll':
+            n, k = params
+            mid, std = _rolling(close, int(n), start)
+            out[f'{label}_MID'], out[f'{label}_UP'], out[f'{label}_LOW'] = mid, mid + k * std, mid - k * std
+    return out
+
+
+class IndicatorCache:
+    """按 (code, adjust, source, 指标规格) 缓存全量指标列，新增 K 线时只计算尾部。"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[tuple, Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _reusable_prefix(old_dates: np.ndarray, old_close: np.ndarray, dates: np.ndarray, close: np.ndarray) -> int:
+        """已缓存结果中仍然有效的前缀长度。"""
+        p = min(len(old_dates), len(dates))
+        if p == 0 or dates[0] != old_dates[0] or close[0] != old_close[0]:
+            # 首根不一致：起始日期变化或前复权因子变化，全量重算
+            return 0
+        # 最后一根可能是盘中数据，不一致时回退一根再比较
+        for q in (p, p - 1):
+            if q > 0 and dates[q - 1] == old_dates[q - 1] and close[q - 1] == old_close[q - 1]:
+                return q
+        return 0
+
+    def compute(self, key: tuple, frame: pd.DataFrame, items: List[Tuple[str, Tuple[float, ...]]]) -> pd.DataFrame:
+        """返回与 frame 行对齐的指标 DataFrame（含 '日期' 列）。frame 需按日期升序。"""
+        dates = frame['日期'].astype(str).to_numpy()
+        close = pd.to_numeric(frame['收盘'], errors='coerce').to_numpy(dtype=float)
+
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+
+        start, prev = 0, None
+        if cached is not None:
+            old_dates, old_close, old_cols = cached
+            start = self._reusable_prefix(old_dates, old_close, dates, close)
+            prev = old_cols if start else None
+
+        if prev is not None and start == len(dates):
+            cols = {c: v[:start] for c, v in prev.items()}
+        else:
+            tail = _compute(close, items, start, prev)
+            cols = {c: (np.concatenate([prev[c][:start], v]) if prev is not None else v) for c, v in tail.items()}
+
+        # 只在数据不短于已缓存版本时更新（如带 end_date 的请求不覆盖完整结果）
+        if cached is None or len(dates) >= len(cached[0]):
+            with self._lock:
+                self._entries[key] = (dates, close, cols)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        result = pd.DataFrame({'日期': dates})
+        for c in output_columns(items):
+            result[c] = cols[c]
+        return result
+
+
+indicator_cache = IndicatorCache(INDICATOR_CACHE_SIZE)
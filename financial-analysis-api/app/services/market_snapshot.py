@@ -0,0 +1,112 @@
+"""全市场行情快照缓存
+
+特性：
+- 全市场实时行情（ak.stock_zh_a_spot_em，约 5000 行）在进程内共享，超过 TTL 才重新下载。
+- 单飞（single-flight）刷新：同一刷新窗口内的并发请求只触发一次上游下载，其余请求等待并复用结果。
+- 快照以 '代码' 建立索引，按代码查询走哈希索引，不再整表扫描。
+- 刷新失败时继续返回旧快照，并在一个 TTL 内不再重试，避免失败时打爆上游。
+- peek() 不等待上游：立即返回当前快照（可能已过期），过期时在后台线程单飞刷新。
+"""
+
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from app.core.upstream import ak
+
+load_dotenv()
+
+MARKET_SNAPSHOT_TTL = float(os.getenv("MARKET_SNAPSHOT_TTL", "5"))
+
+
+class MarketSnapshot:
+    """带 TTL 和单飞刷新的行情快照。"""
+
+    def __init__(self, loader: Callable[[], Optional[pd.DataFrame]], ttl: float, key_column: str = '代码'):
+        self._loader = loader
+        self.ttl = ttl
+        self.key_column = key_column
+        self._frame: Optional[pd.DataFrame] = None
+        self._loaded_at = 0.0     # 最近一次成功刷新的时间
+        self._attempted_at = 0.0  # 最近一次尝试刷新的时间（含失败）
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def age(self) -> Optional[float]:
+        return None if self._frame is None else time.monotonic() - self._loaded_at
+
+    def _is_fresh(self, max_age: float) -> bool:
+        return time.monotonic() - self._attempted_at < max_age and self._frame is not None
+
+    def _index(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.copy()
+        df[self.key_column] = df[self.key_column].astype(str)
+        df = df.drop_duplicates(subset=self.key_column, keep='last')
+        return df.set_index(self.key_column, drop=False)
+
+    def refresh(self) -> Optional[pd.DataFrame]:
+        """无条件从上游重新加载；失败时保留旧快照。"""
+        self._attempted_at = time.monotonic()
+        try:
+            df = self._loader()
+            if df is None or df.empty or self.key_column not in df.columns:
+                print("market snapshot: upstream returned empty data, keeping previous snapshot")
+                return self._frame
+            self._frame = self._index(df)
+            self._loaded_at = time.monotonic()
+        except Exception as e:
+            print(f"market snapshot refresh error: {e}")
+        return self._frame
+
+    def get(self, max_age: Optional[float] = None) -> Optional[pd.DataFrame]:
+        """返回不早于 max_age 秒（默认 TTL）的快照，过期时单飞刷新。"""
+        max_age = self.ttl if max_age is None else max_age
+        if self._is_fresh(max_age):
+            return self._frame
+        with self._refresh_lock:
+            # 等锁期间可能已被其他请求刷新
+            if self._is_fresh(max_age):
+                return self._frame
+            return self.refresh()
+
+    def refresh_in_background(self) -> bool:
+        """在后台线程中刷新；已有刷新在进行时直接返回 False。"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+
+        def run() -> None:
+            try:
+                self.refresh()
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=run, name='market-snapshot-refresh', daemon=True).start()
+        return True
+
+    def peek(self, max_age: Optional[float] = None) -> Optional[pd.DataFrame]:
+        """立即返回当前快照（可能已过期，冷启动时为 None），过期时触发后台刷新，调用方不会阻塞在上游请求上。"""
+        max_age = self.ttl if max_age is None else max_age
+        if not self._is_fresh(max_age):
+            self.refresh_in_background()
+        return self._frame
+
+    def lookup(self, codes: List[str], max_age: Optional[float] = None) -> pd.DataFrame:
+        """按代码取行，保持请求顺序，未命中的代码被忽略。"""
+        df = self.get(max_age)
+        if df is None:
+            return pd.DataFrame()
+        hits = [c for c in dict.fromkeys(codes) if c in df.index]
+        return df.loc[hits].reset_index(drop=True)
+
+
+def _load_spot_em() -> Optional[pd.DataFrame]:
+    if not ak:
+        return None
+    return ak.stock_zh_a_spot_em()
+
+
+spot_em_snapshot = MarketSnapshot(_load_spot_em, ttl=MARKET_SNAPSHOT_TTL)
@@ -0,0 +1,188 @@
+"""实时行情推送（Server-Sent Events 扇出）
+
+客户端订阅一组代码后保持一个 SSE 连接，不再轮询 /realtime：
+- 只有一个后台轮询线程，每 QUOTE_PUSH_INTERVAL 秒刷新一次全市场快照（market_snapshot.spot_em_snapshot，
+  与 /realtime/batch、选股共用），上游请求量与在线客户端数量无关；没有订阅者时轮询线程自动退出；
+- 非交易时段（由调用方传入的 is_active 判断）改为每 QUOTE_PUSH_IDLE_INTERVAL 秒轮询一次；
+- 新旧快照按 QUOTE_FIELDS 整列比较，只把发生变化且有人订阅的代码推送给订阅了这些代码的客户端；
+- 每个订阅只保留每个代码的最新一条待发送行情，慢客户端不会积压，只会跳过中间值。
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from app.services import market_snapshot
+from app.utils.dataframe_utils import dataframe_to_records
+
+load_dotenv()
+
+QUOTE_PUSH_INTERVAL = float(os.getenv("QUOTE_PUSH_INTERVAL", "3"))
+QUOTE_PUSH_IDLE_INTERVAL = float(os.getenv("QUOTE_PUSH_IDLE_INTERVAL", "60"))
+QUOTE_STREAM_MAX_CODES = int(os.getenv("QUOTE_STREAM_MAX_CODES", "500"))
+QUOTE_STREAM_HEARTBEAT = float(os.getenv("QUOTE_STREAM_HEARTBEAT", "15"))
+
+# 任一字段变化即视为该股票行情有更新
+QUOTE_FIELDS = ('最新价', '涨跌幅', '涨跌额', '成交量', '成交额', '最高', '最低', '今开', '换手率', '量比')
+
+
+class QuoteSubscription:
+    """单个客户端的订阅；只在事件循环线程中读写。"""
+
+    def __init__(self, codes: List[str]):
+        self.codes = codes
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.event = asyncio.Event()
+
+    def push(self, code: str, record: Dict[str, Any]) -> None:
+        self.pending[code] = record
+
+    async def next_batch(self, timeout: float) -> Optional[List[Dict[str, Any]]]:
+        """等待下一批更新；timeout 秒内没有更新时返回 None（调用方发送心跳）。"""
+        if not self.pending:
+            try:
+                await asyncio.wait_for(self.event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        self.event.clear()
+        batch, self.pending = list(self.pending.values()), {}
+        return batch
+
+
+class QuoteBroadcaster:
+    def __init__(self, snapshot: market_snapshot.MarketSnapshot, interval: float, idle_interval: float,
+                 is_active: Callable[[], bool] = lambda: True):
+        self.snapshot = snapshot
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.is_active = is_active
+        self._by_code: Dict[str, Set[QuoteSubscription]] = {}
+        self._subscribers: Set[QuoteSubscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._values: Optional[pd.DataFrame] = None
+        self._source: Optional[pd.DataFrame] = None
+        self._running = False
+        self._lock = threading.Lock()
+        self.polls = 0
+        self.changed = 0
+        self.pushed = 0
+
+    # ---- 订阅管理（事件循环线程） ----
+
+    def subscribe(self, codes: List[str]) -> QuoteSubscription:
+        """登记订阅，并立即放入当前快照中这些代码的行情（不等待上游）。"""
+        sub = QuoteSubscription(codes)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._subscribers.add(sub)
+            for code in codes:
+                self._by_code.setdefault(code, set()).add(sub)
+            start = not self._running
+            self._running = True
+        if start:
+            threading.Thread(target=self._poll_loop, name='quote-stream-poller', daemon=True).start()
+
+        frame = self.snapshot.peek()
+        if frame is not None:
+            hits = [c for c in codes if c in frame.index]
+            for record in dataframe_to_records(frame.loc[hits].reset_index(drop=True)) if hits else []:
+                sub.push(str(record['代码']), record)
+            if sub.pending:
+                sub.event.set()
+        return sub
+
+    def unsubscribe(self, sub: QuoteSubscription) -> None:
+        with self._lock:
+            self._subscribers.discard(sub)
+            for code in sub.codes:
+                subs = self._by_code.get(code)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._by_code[code]
+
+    def _fan_out(self, updates: Dict[str, Dict[str, Any]]) -> None:
+        touched: Set[QuoteSubscription] = set()
+        for code, record in updates.items():
+            for sub in self._by_code.get(code, ()):
+                sub.push(code, record)
+                touched.add(sub)
+        for sub in touched:
+            sub.event.set()
+        self.pushed += len(touched)
+
+    # ---- 轮询（后台线程） ----
+
+    def _diff(self, frame: pd.DataFrame) -> pd.Index:
+        """与上一份快照相比行情字段有变化（或新出现）的代码。"""
+        cols = [c for c in QUOTE_FIELDS if c in frame.columns]
+        values = frame[cols].apply(pd.to_numeric, errors='coerce')
+        prev, self._values = self._values, values
+        if prev is None:
+            return values.index
+        old = prev.reindex(index=values.index, columns=cols).to_numpy(dtype=float)
+        new = values.to_numpy(dtype=float)
+        same = (old == new) | (np.isnan(old) & np.isnan(new))
+        return values.index[~same.all(axis=1)]
+
+    def _poll_once(self) -> None:
+        frame = self.snapshot.get(max_age=self.interval)
+        self.polls += 1
+        if frame is None or frame.empty or frame is self._source:
+            return
+        self._source = frame
+        changed = self._diff(frame)
+        self.changed += len(changed)
+        with self._lock:
+            watched = [c for c in changed if c in self._by_code]
+            loop = self._loop
+        if not watched or loop is None:
+            return
+        records = dataframe_to_records(frame.loc[watched].reset_index(drop=True))
+        updates = {str(r['代码']): r for r in records}
+        try:
+            loop.call_soon_threadsafe(self._fan_out, updates)
+        except RuntimeError:
+            # 事件循环已关闭（进程退出中）
+            pass
+
+    def _poll_loop(self) -> None:
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._running = False
+                    # 下次有订阅时从头比较，避免用过期的基线漏推
+                    self._values = self._source = None
+                    return
+            started = time.monotonic()
+            try:
+                self._poll_once()
+            except Exception as e:
+                print(f"quote stream poll error: {e}")
+            try:
+                interval = self.interval if self.is_active() else self.idle_interval
+            except Exception:
+                interval = self.interval
+            # 空闲间隔较长时分段等待，订阅者全部离开后及时退出
+            deadline = started + interval
+            while time.monotonic() < deadline and self._subscribers:
+                time.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'running': self._running,
+                'subscribers': len(self._subscribers),
+                'codes': len(self._by_code),
+                'polls': self.polls,
+                'changed_quotes': self.changed,
+                'pushed_batches': self.pushed,
+                'interval': self.interval,
+                'idle_interval': self.idle_interval,
+            }
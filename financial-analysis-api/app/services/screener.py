@@ -0,0 +1,272 @@
+"""条件选股引擎
+
+特性：
+- 全市场行情快照（market_snapshot.spot_em_snapshot）与 stock_basic_info 的行业/地区信息合并为一份列式数据：
+  数值列为 float64 的 numpy 数组，文本列为 object 数组；快照或基础信息变化时整体重建，查询不加锁。
+- 筛选条件逐个求布尔掩码后按位与，排序取前 N 使用 argpartition，5000 只股票规模下为毫秒级；
+  每行的 JSON-safe 记录在重建时一次性生成，返回结果时按下标直接取出。
+- 请求不等待上游：使用 peek() 读取当前快照，过期时后台刷新；冷启动尚无快照时直接返回提示。
+- 行业/地区信息从数据库加载，按 SCREENER_META_REFRESH_SECONDS 定期重新加载；加载失败时按 SCREENER_META_RETRY_SECONDS
+  重试，从未加载成功期间按行业/地区筛选或排序的请求返回错误，而不是静默返回 0 条。
+
+筛选条件格式（POST /api/stocks/screen）：
+{
+  "filters": [
+    {"field": "pe", "op": "between", "value": [0, 30]},
+    {"field": "turnover", "op": ">=", "value": 3},
+    {"field": "industry", "op": "in", "value": ["半导体", "消费电子"]}
+  ],
+  "sort": {"field": "pct_chg", "order": "desc"},
+  "limit": 50,
+  "offset": 0
+}
+字段既可用下方 FIELD_ALIASES 中的英文别名，也可直接使用快照中的中文列名。
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from app.services import market_snapshot
+from app.utils.dataframe_utils import dataframe_to_records
+
+load_dotenv()
+
+SCREENER_SNAPSHOT_MAX_AGE = float(os.getenv("SCREENER_SNAPSHOT_MAX_AGE", "30"))
+SCREENER_META_REFRESH_SECONDS = float(os.getenv("SCREENER_META_REFRESH_SECONDS", str(6 * 3600)))
+SCREENER_META_RETRY_SECONDS = float(os.getenv("SCREENER_META_RETRY_SECONDS", "30"))
+SCREENER_MAX_LIMIT = 500
+
+# 英文别名 -> stock_zh_a_spot_em 列名
+FIELD_ALIASES = {
+    'code': '代码',
+    'name': '名称',
+    'price': '最新价',
+    'pct_chg': '涨跌幅',
+    'change': '涨跌额',
+    'volume': '成交量',
+    'amount': '成交额',
+    'amplitude': '振幅',
+    'high': '最高',
+    'low': '最低',
+    'open': '今开',
+    'pre_close': '昨收',
+    'volume_ratio': '量比',
+    'turnover': '换手率',
+    'pe': '市盈率-动态',
+    'pb': '市净率',
+    'total_mv': '总市值',
+    'circ_mv': '流通市值',
+    'speed': '涨速',
+    'chg_5min': '5分钟涨跌',
+    'chg_60d': '60日涨跌幅',
+    'chg_ytd': '年初至今涨跌幅',
+    'industry': '行业',
+    'region': '地区',
+}
+
+_TEXT_COLUMNS = ('代码', '名称', '行业', '地区')
+# 来自 stock_basic_info 而非行情快照的列
+META_COLUMNS = ('行业', '地区')
+_NUMERIC_OPS = {'>', '>=', '<', '<=', '==', '!=', 'between'}
+_TEXT_OPS = {'==', '!=', 'in', 'not_in', 'contains'}
+_OP_ALIASES = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=', 'eq': '==', 'ne': '!=', '=': '=='}
+
+
+class ScreenUniverse:
+    """不可变的列式全市场数据，由快照和基础信息构造。"""
+
+    def __init__(self, frame: pd.DataFrame, meta: Dict[str, Tuple[str, str]]):
+        frame = frame.reset_index(drop=True)
+        codes = frame['代码'].astype(str).to_numpy(dtype=object)
+        industry = np.array([meta.get(c, ('', ''))[0] for c in codes], dtype=object)
+        region = np.array([meta.get(c, ('', ''))[1] for c in codes], dtype=object)
+        frame = frame.assign(行业=industry, 地区=region)
+
+        self.frame = frame
+        self.size = len(frame)
+        self.records = dataframe_to_records(frame)
+        self.numeric: Dict[str, np.ndarray] = {}
+        self.text: Dict[str, np.ndarray] = {}
+        for col in frame.columns:
+            if col in _TEXT_COLUMNS:
+                self.text[col] = frame[col].fillna('').astype(str).to_numpy(dtype=object)
+            elif col != '序号':
+                values = pd.to_numeric(frame[col], errors='coerce')
+                if values.notna().any():
+                    self.numeric[col] = values.to_numpy(dtype=float)
+
+    def _mask(self, cond: Dict[str, Any]) -> np.ndarray:
+        field = _resolve_field(cond.get('field'))
+        op = _OP_ALIASES.get(str(cond.get('op', '')).lower(), str(cond.get('op', '')).lower())
+        value = cond.get('value')
+
+        if field in self.numeric:
+            if op not in _NUMERIC_OPS:
+                raise ValueError(f"字段 {field} 不支持运算符 {op}")
+            arr = self.numeric[field]
+            # NaN 参与比较结果为 False，缺失数据的股票自然被排除
+            with np.errstate(invalid='ignore'):
+                if op == 'between':
+                    lo, hi = _range(value)
+                    mask = np.ones(self.size, dtype=bool)
+                    if lo is not None:
+                        mask &= arr >= lo
+                    if hi is not None:
+                        mask &= arr <= hi
+                    return mask
+                v = _number(value)
+                return {'>': arr > v, '>=': arr >= v, '<': arr < v, '<=': arr <= v, '==': arr == v, '!=': arr != v}[op]
+
+        if field in self.text:
+            if op not in _TEXT_OPS:
+                raise ValueError(f"字段 {field} 不支持运算符 {op}")
+            arr = self.text[field]
+            values = [str(v) for v in value] if isinstance(value, (list, tuple)) else [str(value)]
+            if op == 'contains':
+                s = pd.Series(arr)
+                mask = np.zeros(self.size, dtype=bool)
+                for v in values:
+                    mask |= s.str.contains(v, regex=False).to_numpy()
+                return mask
+            mask = np.isin(arr, values)
+            return ~mask if op in ('!=', 'not_in') else mask
+
+        raise ValueError(f"不支持的筛选字段: {cond.get('field')}")
+
+    def screen(self, filters: List[Dict[str, Any]], sort: Optional[Dict[str, Any]], limit: int, offset: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """返回 (命中总数, 排序后的第 offset ~ offset+limit 行)。"""
+        mask = np.ones(self.size, dtype=bool)
+        for cond in filters or []:
+            if not isinstance(cond, dict):
+                raise ValueError("filters 中的每一项应为 {field, op, value}")
+            mask &= self._mask(cond)
+        idx = np.flatnonzero(mask)
+        total = len(idx)
+        need = min(total, offset + limit)
+
+        if sort and sort.get('field'):
+            field = _resolve_field(sort['field'])
+            desc = str(sort.get('order', 'desc')).lower() != 'asc'
+            if field in self.numeric:
+                vals = self.numeric[field][idx]
+                # 缺失值始终排在最后
+                key = np.where(np.isnan(vals), np.inf, -vals if desc else vals)
+            elif field in self.text:
+                key = np.argsort(np.argsort(self.text[field][idx], kind='stable'), kind='stable')
+                key = -key if desc else key
+            else:
+                raise ValueError(f"不支持的排序字段: {sort['field']}")
+            if 0 < need < total:
+                part = np.argpartition(key, need - 1)[:need]
+                order = part[np.lexsort((part, key[part]))]
+            else:
+                order = np.lexsort((np.arange(total), key))
+            idx = idx[order]
+
+        return total, [self.records[i] for i in idx[offset:need]]
+
+
+def _resolve_field(name: Any) -> str:
+    name = str(name or '').strip()
+    return FIELD_ALIASES.get(name.lower(), name)
+
+
+def uses_meta(filters: Optional[List[Dict[str, Any]]], sort: Optional[Dict[str, Any]]) -> bool:
+    """筛选或排序是否用到行业/地区列。"""
+    fields = [c.get('field') for c in filters or [] if isinstance(c, dict)]
+    if sort and sort.get('field'):
+        fields.append(sort['field'])
+    return any(_resolve_field(f) in META_COLUMNS for f in fields)
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"筛选值应为数字: {value}")
+
+
+def _range(value: Any) -> Tuple[Optional[float], Optional[float]]:
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError("between 的取值应为 [最小值, 最大值]，不限的一端传 null")
+    return tuple(None if v is None else _number(v) for v in value)
+
+
+def _load_meta() -> Dict[str, Tuple[str, str]]:
+    """代码 -> (行业, 地区)，行业优先使用东方财富行业分类。"""
+    # 延迟导入：app.core.database 在导入时会连接数据库
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        sql = text(
+            """
+            SELECT a_stock_code, eastmoney_industry, regulatory_industry, region
+            FROM stock_basic_info
+            WHERE a_stock_code IS NOT NULL AND a_stock_code <> ''
+            """
+        )
+        rows = db.execute(sql).mappings().fetchall()
+        return {
+            str(r['a_stock_code']).strip(): (
+                str(r['eastmoney_industry'] or r['regulatory_industry'] or '').strip(),
+                str(r['region'] or '').strip(),
+            )
+            for r in rows
+        }
+    finally:
+        db.close()
+
+
+class Screener:
+    def __init__(self, snapshot: market_snapshot.MarketSnapshot, max_age: float, meta_refresh_seconds: float,
+                 meta_retry_seconds: float = SCREENER_META_RETRY_SECONDS):
+        self.snapshot = snapshot
+        self.max_age = max_age
+        self.meta_refresh_seconds = meta_refresh_seconds
+        self.meta_retry_seconds = meta_retry_seconds
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        # 是否至少成功加载过一次；下一次加载时间（成功后按刷新周期，失败后按较短的重试间隔）
+        self.meta_available = False
+        self._meta_next_at = 0.0
+        self._universe: Optional[ScreenUniverse] = None
+        self._source: Optional[pd.DataFrame] = None
+        self._lock = threading.Lock()
+
+    def _refresh_meta(self) -> bool:
+        if time.monotonic() < self._meta_next_at:
+            return False
+        try:
+            self._meta = _load_meta()
+        except Exception as e:
+            # 失败后短间隔重试，不在每个请求上访问数据库；已加载过的旧数据继续使用
+            self._meta_next_at = time.monotonic() + self.meta_retry_seconds
+            print(f"screener: failed to load stock_basic_info, retry in {self.meta_retry_seconds:.0f}s: {e}")
+            return False
+        self._meta_next_at = time.monotonic() + self.meta_refresh_seconds
+        self.meta_available = True
+        return True
+
+    def universe(self) -> Optional[ScreenUniverse]:
+        """当前列式数据；快照或基础信息有更新时重建，冷启动尚无快照时返回 None。"""
+        frame = self.snapshot.peek(self.max_age)
+        if frame is None or frame.empty:
+            return self._universe
+        if frame is self._source and time.monotonic() < self._meta_next_at:
+            return self._universe
+        with self._lock:
+            meta_changed = self._refresh_meta()
+            if frame is not self._source or meta_changed or self._universe is None:
+                self._universe = ScreenUniverse(frame, self._meta)
+                self._source = frame
+        return self._universe
+
+
+screener = Screener(market_snapshot.spot_em_snapshot, SCREENER_SNAPSHOT_MAX_AGE, SCREENER_META_REFRESH_SECONDS)
@@ -0,0 +1,123 @@
+"""按键单飞（single-flight）+ 短时新鲜度缓存
+
+用于单只股票实时信息这类「热点代码被大量用户同时查询」的上游调用：
+- 同一个键同一时刻只有一个上游请求在执行，其余调用等待并共享它的结果（含异常）；
+- 成功结果在 ttl 秒内直接复用，不再回源；缓存条目数超过 max_entries 时按 LRU 淘汰；
+- 统计新鲜命中、合并等待与实际上游调用次数。
+
+同步调用方直接使用 get()。异步路由分两步：先在事件循环上 claim()，拿到领头权的请求再到线程池中 fill()，
+其余请求在事件循环上等待同一个 Future，不占用线程池与上游并发名额；领头请求未能开始执行（如排队超时）时
+调用 abandon() 释放该键，等待方收到同样的错误。
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REALTIME_INFO_TTL = float(os.getenv("REALTIME_INFO_TTL", "3"))
+REALTIME_INFO_CACHE_SIZE = int(os.getenv("REALTIME_INFO_CACHE_SIZE", "2048"))
+
+
+class _Flight(Future):
+    def __init__(self):
+        super().__init__()
+        self.started = False
+
+
+class SingleFlightCache:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.fresh_hits = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.errors = 0
+
+    def claim(self, key: Hashable) -> Tuple[Future, bool]:
+        """返回 (Future, 是否领头)：新鲜结果为已完成的 Future；有在途请求时返回它；否则登记新的在途请求，由调用方 fill()。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.fresh_hits += 1
+                done: Future = Future()
+                done.set_result(entry[0])
+                return done, False
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self._inflight[key] = _Flight()
+            # 标记为运行中：异步等待方超时取消自己的包装 Future 时不会连带取消共享的 Future
+            flight.set_running_or_notify_cancel()
+            self.upstream_calls += 1
+            return flight, True
+
+    def fill(self, key: Hashable, flight: Future, loader: Callable[[], Any], cacheable: Callable[[Any], bool] = lambda v: True) -> Any:
+        """领头方执行 loader() 并把结果交给所有等待方；cacheable(结果) 为假时只共享不缓存。"""
+        with self._lock:
+            if flight.done():
+                # 已被 abandon()
+                return flight.result()
+            flight.started = True
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self.errors += 1
+                self._inflight.pop(key, None)
+            flight.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            if cacheable(value):
+                self._entries[key] = (value, time.monotonic())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        flight.set_result(value)
+        return value
+
+    def abandon(self, key: Hashable, flight: Future, error: BaseException) -> None:
+        """领头方放弃：fill() 尚未开始时释放该键并让等待方收到 error；已开始则等它自行完成。"""
+        with self._lock:
+            if flight.started or flight.done() or self._inflight.get(key) is not flight:
+                return
+            self._inflight.pop(key)
+            self.errors += 1
+        flight.set_exception(error)
+
+    def get(self, key: Hashable, loader: Callable[[], Any], cacheable: Callable[[Any], bool] = lambda v: True) -> Any:
+        """同步调用：新鲜缓存 > 等待在途请求 > 调用 loader()。"""
+        flight, leader = self.claim(key)
+        if leader:
+            return self.fill(key, flight, loader, cacheable)
+        return flight.result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.fresh_hits + self.coalesced + self.upstream_calls
+            return {
+                'requests': total,
+                'fresh_hits': self.fresh_hits,
+                'coalesced': self.coalesced,
+                'upstream_calls': self.upstream_calls,
+                'errors': self.errors,
+                'hit_ratio': (total - self.upstream_calls) / total if total else None,
+                'ttl': self.ttl,
+                'entries': len(self._entries),
+                'inflight': len(self._inflight),
+            }
+
+
+realtime_info_cache = SingleFlightCache(REALTIME_INFO_TTL, REALTIME_INFO_CACHE_SIZE)
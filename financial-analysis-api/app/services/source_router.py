@@ -0,0 +1,248 @@
+"""历史行情数据源路由：故障转移与对冲请求
+
+特性：
+- 按数据源（eastmoney / sina / tencent）统计最近 SOURCE_STATS_WINDOW 次请求的耗时与成败；
+- 调用方指定的数据源优先；其错误率超过 HISTORY_SOURCE_ERROR_THRESHOLD 时视为不健康，排到最后，
+  距最近一次失败超过 HISTORY_SOURCE_COOLDOWN 秒后重新参与排序（探活）；
+- 故障转移：当前数据源抛出异常，或返回的结果未通过调用方的 valid 校验（如区间内有交易日却返回空数据，
+  限流常表现为空结果）时，计为一次失败并改用下一个数据源；所有数据源都只返回无效结果时返回首个无效结果；
+- 对冲请求：首个请求耗时超过该数据源历史耗时的 HISTORY_HEDGE_PERCENTILE 分位数（限定在
+  [HISTORY_HEDGE_MIN_DELAY, HISTORY_HEDGE_MAX_DELAY] 之间）仍未返回时，再向下一个数据源发起同样的请求，
+  取先返回的有效结果；HISTORY_HEDGE_PERCENTILE=0 时关闭对冲。
+
+落后的请求不会被中断，会在后台执行完并计入统计。
+每次调用 fn(source) 前先占用实际请求的数据源的并发名额（executor.upstream_slot），排队时间不计入耗时统计。
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.core.executor import upstream_slot
+from app.services import history_store
+
+load_dotenv()
+
+HISTORY_SOURCES = history_store.HISTORY_SOURCES
+HISTORY_SOURCE_FAILOVER = os.getenv("HISTORY_SOURCE_FAILOVER", "1").lower() not in ("0", "false", "no")
+HISTORY_HEDGE_PERCENTILE = float(os.getenv("HISTORY_HEDGE_PERCENTILE", "95"))
+HISTORY_HEDGE_MIN_DELAY = float(os.getenv("HISTORY_HEDGE_MIN_DELAY", "0.3"))
+HISTORY_HEDGE_MAX_DELAY = float(os.getenv("HISTORY_HEDGE_MAX_DELAY", "5"))
+HISTORY_SOURCE_ERROR_THRESHOLD = float(os.getenv("HISTORY_SOURCE_ERROR_THRESHOLD", "0.5"))
+HISTORY_SOURCE_COOLDOWN = float(os.getenv("HISTORY_SOURCE_COOLDOWN", "30"))
+HISTORY_ROUTER_WORKERS = int(os.getenv("HISTORY_ROUTER_WORKERS", "16"))
+
+SOURCE_STATS_WINDOW = 100
+# 样本数少于该值时不计算分位数 / 错误率
+MIN_SAMPLES = 5
+
+
+class _InvalidResult(Exception):
+    """结果未通过 valid 校验：计为失败，但保留结果供所有数据源都无效时返回。"""
+
+    def __init__(self, result: Any):
+        super().__init__('invalid result')
+        self.result = result
+
+
+class SourceStats:
+    """单个数据源最近若干次请求的耗时与成败。"""
+
+    def __init__(self, window: int = SOURCE_STATS_WINDOW):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.last_error_at = 0.0
+        self.last_error: Optional[str] = None
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.requests += 1
+            self.outcomes.append(ok)
+            if ok:
+                # 只有成功请求的耗时用于对冲阈值，失败往往是快速报错或超时，会扭曲分布
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+                self.last_error_at = time.monotonic()
+                self.last_error = error
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self.latencies) < MIN_SAMPLES:
+                return None
+            return float(np.percentile(np.fromiter(self.latencies, dtype=float), q))
+
+    def error_rate(self) -> Optional[float]:
+        with self._lock:
+            if len(self.outcomes) < MIN_SAMPLES:
+                return None
+            return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def healthy(self, threshold: float, cooldown: float) -> bool:
+        rate = self.error_rate()
+        if rate is None or rate < threshold:
+            return True
+        return time.monotonic() - self.last_error_at >= cooldown
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'error_rate': self.error_rate(),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'last_error': self.last_error,
+        }
+
+
+class SourceRouter:
+    def __init__(self, sources: Tuple[str, ...], failover: bool, hedge_percentile: float, hedge_min_delay: float,
+                 hedge_max_delay: float, error_threshold: float, cooldown: float, max_workers: int):
+        self.sources = sources
+        self.failover = failover
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.stats: Dict[str, SourceStats] = {s: SourceStats() for s in sources}
+        self.hedges = 0
+        self.failovers = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='source-router')
+
+    def order(self, preferred: str) -> List[str]:
+        """候选数据源顺序：首选（健康时）→ 其余健康数据源按中位耗时 → 不健康的数据源。
+
+        未知的数据源按第一个数据源处理（与路由引入前回退到 eastmoney 的行为一致）。
+        """
+        if preferred not in self.stats:
+            preferred = self.sources[0]
+        if not self.failover:
+            return [preferred]
+
+        def p50(s: str) -> float:
+            v = self.stats[s].percentile(50)
+            return float('inf') if v is None else v
+
+        healthy = [s for s in self.sources if self.stats[s].healthy(self.error_threshold, self.cooldown)]
+        others = sorted((s for s in healthy if s != preferred), key=p50)
+        head = [preferred] if preferred in healthy else []
+        tail = [s for s in self.sources if s not in healthy]
+        if preferred in tail:
+            tail.remove(preferred)
+            tail.insert(0, preferred)
+        return head + others + tail
+
+    def _hedge_delay(self, source: str) -> Optional[float]:
+        if self.hedge_percentile <= 0:
+            return None
+        p = self.stats[source].percentile(self.hedge_percentile)
+        if p is None:
+            return self.hedge_max_delay
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, p))
+
+    def _timed(self, source: str, fn: Callable[[str], Any], valid: Optional[Callable[[Any], bool]] = None) -> Any:
+        with upstream_slot(source):
+            started = time.monotonic()
+            try:
+                result = fn(source)
+            except Exception as e:
+                self.stats[source].record(time.monotonic() - started, False, str(e))
+                raise
+        if valid is not None and not valid(result):
+            self.stats[source].record(time.monotonic() - started, False, 'invalid (empty) result')
+            raise _InvalidResult(result)
+        self.stats[source].record(time.monotonic() - started, True)
+        return result
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def fetch(self, preferred: str, fn: Callable[[str], Any], valid: Optional[Callable[[Any], bool]] = None) -> Tuple[str, Any]:
+        """按候选顺序调用 fn(source)，返回 (实际使用的数据源, 结果)。
+
+        valid(结果) 为假的结果视为软失败：计入该数据源的错误并继续尝试其他数据源；没有任何有效结果时返回
+        首个无效结果，全部抛出异常时抛出最后一个异常。
+        """
+        candidates = self.order(preferred)
+        if len(candidates) == 1:
+            try:
+                return candidates[0], self._timed(candidates[0], fn, valid)
+            except _InvalidResult as invalid:
+                return candidates[0], invalid.result
+
+        queue = iter(candidates)
+        pending: Dict[Any, str] = {}
+        hedged = False
+        last_error: Optional[Exception] = None
+        first_invalid: Optional[Tuple[str, Any]] = None
+
+        def launch() -> bool:
+            source = next(queue, None)
+            if source is None:
+                return False
+            pending[self._pool.submit(self._timed, source, fn, valid)] = source
+            return True
+
+        launch()
+        while pending:
+            timeout = None
+            if not hedged and len(pending) == 1:
+                timeout = self._hedge_delay(next(iter(pending.values())))
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # 首个请求超过分位数耗时仍未返回：对冲到下一个数据源
+                hedged = True
+                if launch():
+                    self._count('hedges')
+                continue
+            for future in done:
+                source = pending.pop(future)
+                try:
+                    return source, future.result()
+                except _InvalidResult as invalid:
+                    print(f"source router: {source} returned an invalid (empty) result")
+                    if first_invalid is None:
+                        first_invalid = (source, invalid.result)
+                except Exception as e:
+                    print(f"source router: {source} failed: {e}")
+                    last_error = e
+            if not pending and launch():
+                self._count('failovers')
+        if first_invalid is not None:
+            return first_invalid
+        raise last_error if last_error is not None else RuntimeError('no data source available')
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            hedges, failovers = self.hedges, self.failovers
+        return {
+            'failover': self.failover,
+            'hedge_percentile': self.hedge_percentile,
+            'hedges': hedges,
+            'failovers': failovers,
+            'sources': {s: st.snapshot() for s, st in self.stats.items()},
+        }
+
+
+history_router = SourceRouter(
+    HISTORY_SOURCES,
+    failover=HISTORY_SOURCE_FAILOVER,
+    hedge_percentile=HISTORY_HEDGE_PERCENTILE,
+    hedge_min_delay=HISTORY_HEDGE_MIN_DELAY,
+    hedge_max_delay=HISTORY_HEDGE_MAX_DELAY,
+    error_threshold=HISTORY_SOURCE_ERROR_THRESHOLD,
+    cooldown=HISTORY_SOURCE_COOLDOWN,
+    max_workers=HISTORY_ROUTER_WORKERS,
+)
@@ -0,0 +1,65 @@
+"""上交所每日概况结果缓存
+
+已收盘并统计完成的交易日数据不会再变化，按日期持久化为本地 JSON 文件（SSE_SUMMARY_CACHE_DIR/YYYYMMDD.json），
+进程内再加一层字典缓存。是否可以缓存由调用方判断（见 stock_service.get_sse_daily_summary）。
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_API_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SSE_SUMMARY_CACHE_DIR = os.getenv("SSE_SUMMARY_CACHE_DIR") or os.path.join(_API_ROOT, "data", "sse_summary")
+
+
+class SseSummaryCache:
+    def __init__(self, root: str):
+        self.root = root
+        self._memory: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, date_str: str) -> str:
+        return os.path.join(self.root, f"{date_str}.json")
+
+    def get(self, date_str: str) -> Optional[List[Dict[str, Any]]]:
+        records = self._memory.get(date_str)
+        if records is not None:
+            return records
+        try:
+            with open(self._path(date_str), 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"sse summary cache: failed to read {date_str}: {e}")
+            return None
+        with self._lock:
+            self._memory[date_str] = records
+        return records
+
+    def put(self, date_str: str, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            path = self._path(date_str)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"sse summary cache: failed to write {date_str}: {e}")
+        with self._lock:
+            self._memory[date_str] = records
+
+    def __contains__(self, date_str: str) -> bool:
+        return date_str in self._memory or os.path.exists(self._path(date_str))
+
+
+sse_summary_cache = SseSummaryCache(SSE_SUMMARY_CACHE_DIR)
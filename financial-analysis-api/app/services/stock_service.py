@@ -1,61 +1,38 @@
 """股票数据服务（稳健版）
 
 特性：
-- 封装 akshare 的调用，若环境中未安装 akshare 则降级返回空结构，避免抛出 ImportError。
+- 封装 akshare 的调用（首次使用时才导入，见 app/core/upstream.ak），若环境中未安装 akshare 则降级返回空结构，避免抛出 ImportError。
 - 提供：get_trade_dates(), get_sse_daily_summary(date_str), get_stock_history_data(...), get_stock_realtime_info(...)
-- 输出为 JSON-safe（将 numpy/pandas 类型与 NaN/inf 转为 None 或原生 Python 类型）。
+- 输出为 JSON-safe（将 numpy/pandas 类型与 NaN/inf 转为 None 或原生 Python 类型），清洗按整列进行，见 app/utils/dataframe_utils。
 """
 
-try:
-    import akshare as ak
-except Exception:
-    ak = None
-
 import pandas as pd
 import numpy as np
+import base64
+import json
 import math
+import os
+import time
 import traceback
-from typing import List, Dict, Any, Optional
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
-from sqlalchemy import text
-
-
-def _safe_number(x: Any) -> Any:
-    try:
-        if x is None:
-            return None
-        if isinstance(x, (np.integer,)):
-            return int(x)
-        if isinstance(x, (np.floating,)):
-            if np.isnan(x) or np.isinf(x):
-                return None
-            return float(x)
-        if pd.isna(x):
-            return None
-        return x
-    except Exception:
-        return None
+from sqlalchemy import bindparam, text
+from dotenv import load_dotenv
 
+from app.core import upstream
+from app.core.upstream import ak
+from app.services import backtest, company_profiles, history_store, indicators, market_snapshot, quote_stream, screener, single_flight, source_router, sse_summary_cache, symbol_search, trade_calendar
+from app.utils.dataframe_utils import dataframe_to_arrow_ipc, dataframe_to_columnar_json, dataframe_to_records, dataframe_to_json_bytes
 
-def _clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    if df is None:
-        return pd.DataFrame()
-    if isinstance(df, pd.Series):
-        df = df.to_frame().T
-    df2 = df.copy()
-    for col in df2.columns:
-        df2[col] = df2[col].apply(_safe_number)
-    # format datetime-like columns
-    for col in df2.select_dtypes(include=['datetime64[ns]']).columns:
-        df2[col] = df2[col].dt.strftime('%Y-%m-%d')
-    return df2
+load_dotenv()
 
 
 def get_stock_realtime_info(code: str) -> Dict[str, Any]:
     """获取单个股票的实时行情信息
     
     参数:
-    - code: 股票代码（6位数字，如 '000001', '600000'）
+    - code: 股票代码（6位数字，如 '000001', '600000'，也接受 'sh600000' 形式）
     
     返回:
     {
@@ -63,7 +40,48 @@ def get_stock_realtime_info(code: str) -> Dict[str, Any]:
         'message': str,
         'data': { ... } 或 None
     }
+
+    同一代码的并发请求只回源一次并共享结果，成功结果在 REALTIME_INFO_TTL 秒内直接复用（见 single_flight）。
+    返回的字典在多个调用方之间共享，调用方不应修改。
     """
+    if not code or not str(code).strip():
+        return {'status': 'error', 'message': '股票代码不能为空', 'data': None}
+    code_clean = history_store.normalize_code(code)
+    return single_flight.realtime_info_cache.get(
+        code_clean,
+        lambda: _fetch_stock_realtime_info(code_clean),
+        cacheable=lambda r: r['status'] == 'ok',
+    )
+
+
+def claim_stock_realtime_info(code: str) -> Optional[Tuple[str, Future, bool]]:
+    """异步路由用：返回 (规范化代码, Future, 是否领头)。领头方需在线程池中调用 fill_stock_realtime_info，
+    其余调用方直接等待 Future；代码为空时返回 None。"""
+    if not code or not str(code).strip():
+        return None
+    code_clean = history_store.normalize_code(code)
+    future, leader = single_flight.realtime_info_cache.claim(code_clean)
+    return code_clean, future, leader
+
+
+def fill_stock_realtime_info(code_clean: str, future: Future) -> Dict[str, Any]:
+    return single_flight.realtime_info_cache.fill(
+        code_clean, future,
+        lambda: _fetch_stock_realtime_info(code_clean),
+        cacheable=lambda r: r['status'] == 'ok',
+    )
+
+
+def abandon_stock_realtime_info(code_clean: str, future: Future, error: BaseException) -> None:
+    single_flight.realtime_info_cache.abandon(code_clean, future, error)
+
+
+def get_realtime_info_stats() -> Dict[str, Any]:
+    """单股实时信息的新鲜命中 / 合并等待 / 实际回源次数。"""
+    return single_flight.realtime_info_cache.stats()
+
+
+def _fetch_stock_realtime_info(code_clean: str) -> Dict[str, Any]:
     result = {
         'status': 'error',
         'message': '',
@@ -71,19 +89,10 @@ def get_stock_realtime_info(code: str) -> Dict[str, Any]:
     }
     
     try:
-        if not code:
-            result['message'] = '股票代码不能为空'
-            return result
-            
-        if ak is None:
+        if not ak:
             result['message'] = 'akshare 未安装，无法查询'
             return result
         
-        # 确保股票代码是6位数字
-        code_clean = str(code).strip()
-        if len(code_clean) < 6:
-            code_clean = code_clean.zfill(6)
-        
         # 使用 stock_individual_info_em 接口获取单股票实时信息
         df = ak.stock_individual_info_em(symbol=code_clean)
         
@@ -92,9 +101,7 @@ def get_stock_realtime_info(code: str) -> Dict[str, Any]:
             return result
         
         # 清洗数据
-        cleaned = _clean_dataframe(df)
-        records = cleaned.to_dict(orient='records')
-        safe_records = _to_json_safe(records)
+        safe_records = dataframe_to_records(df)
         
         result['status'] = 'ok'
         result['message'] = '查询成功'
@@ -134,12 +141,12 @@ def get_stock_realtime_batch(codes: List[str]) -> Dict[str, Any]:
             result['message'] = '股票代码列表不能为空'
             return result
             
-        if ak is None:
+        if not ak:
             result['message'] = 'akshare 未安装，无法查询'
             return result
         
-        # 获取所有A股实时数据
-        df = ak.stock_zh_a_spot_em()
+        # 获取所有A股实时数据（进程内共享快照，TTL 内不重复下载）
+        df = market_snapshot.spot_em_snapshot.get()
         
         if df is None or df.empty:
             result['message'] = '获取市场数据失败'
@@ -148,8 +155,8 @@ def get_stock_realtime_batch(codes: List[str]) -> Dict[str, Any]:
         # 清洗代码列表
         codes_clean = [str(c).strip().zfill(6) if len(str(c).strip()) < 6 else str(c).strip() for c in codes]
         
-        # 筛选指定的股票
-        filtered = df[df['代码'].isin(codes_clean)]
+        # 按代码索引取出指定的股票
+        filtered = market_snapshot.spot_em_snapshot.lookup(codes_clean)
         
         if filtered.empty:
             result['message'] = f'未找到任何股票数据'
@@ -157,9 +164,7 @@ def get_stock_realtime_batch(codes: List[str]) -> Dict[str, Any]:
             return result
         
         # 清洗数据
-        cleaned = _clean_dataframe(filtered)
-        records = cleaned.to_dict(orient='records')
-        safe_records = _to_json_safe(records)
+        safe_records = dataframe_to_records(filtered)
         
         result['status'] = 'ok'
         result['message'] = f'成功获取 {len(safe_records)} 只股票的实时数据'
@@ -175,60 +180,139 @@ def get_stock_realtime_batch(codes: List[str]) -> Dict[str, Any]:
 
 
 
-def _to_json_safe(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    out = []
-    for r in records:
-        nr = {}
-        for k, v in r.items():
-            # normalize numpy / pandas scalar types and NaN/inf
-            if v is None:
-                nr[k] = None
-            elif isinstance(v, (np.integer,)):
-                nr[k] = int(v)
-            elif isinstance(v, (np.floating, float)):
-                if np.isnan(v) or np.isinf(v):
-                    nr[k] = None
-                else:
-                    nr[k] = float(v)
-            elif isinstance(v, (int, str, bool)):
-                nr[k] = v
-            else:
-                # fallback: stringify complex objects
-                try:
-                    nr[k] = str(v)
-                except Exception:
-                    nr[k] = None
-        out.append(nr)
-    return out
-
-
-_trade_dates_cache: Optional[List[str]] = None
+def screen_stocks(filters: List[Dict[str, Any]], sort: Optional[Dict[str, Any]] = None, limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+    """条件选股（见 screener）。
+
+    基于进程内的全市场快照计算，不在请求中访问上游；筛选条件不合法时抛出 ValueError。
+    返回:
+    {
+        'status': 'ok' | 'error',
+        'message': str,
+        'total': int,              # 命中总数
+        'snapshot_age': float,     # 行情快照距上次刷新的秒数
+        'meta_available': bool,    # 行业/地区信息是否已加载；为 False 时按行业/地区筛选或排序返回 error
+        'data': [{ ... }, ...]
+    }
+    """
+    result = {
+        'status': 'error',
+        'message': '',
+        'total': 0,
+        'snapshot_age': None,
+        'meta_available': False,
+        'data': []
+    }
+
+    limit = max(1, min(int(limit or 50), screener.SCREENER_MAX_LIMIT))
+    offset = max(0, int(offset or 0))
+
+    universe = screener.screener.universe()
+    if universe is None:
+        result['message'] = '行情快照加载中，请稍后重试'
+        return result
+    result['meta_available'] = screener.screener.meta_available
+    if not result['meta_available'] and screener.uses_meta(filters, sort):
+        result['message'] = '行业/地区信息暂不可用（stock_basic_info 加载失败），请稍后重试'
+        return result
+
+    total, rows = universe.screen(filters, sort, limit, offset)
+    result['status'] = 'ok'
+    result['message'] = f'共 {total} 只股票符合条件'
+    result['total'] = total
+    result['snapshot_age'] = market_snapshot.spot_em_snapshot.age
+    result['data'] = rows
+    return result
+
+
+def start_market_snapshot_warmup() -> None:
+    """应用启动时调用：后台导入 akshare 并预先加载全市场快照，不阻塞启动，选股接口首个请求即可命中。"""
+    market_snapshot.spot_em_snapshot.refresh_in_background()
 
 
-def _load_trade_dates() -> List[str]:
-    global _trade_dates_cache
-    if _trade_dates_cache is not None:
-        return _trade_dates_cache
+def _is_trading_session() -> bool:
+    """当前是否处于 A 股交易时段（含集合竞价，前后各留几分钟余量）。"""
+    now = datetime.now()
+    today = now.strftime('%Y%m%d')
+    cal = _get_calendar()
+    # 日历未覆盖今天（如跨年后尚未刷新）时不据此判断
+    if cal and today <= cal.last and not cal.is_open(today):
+        return False
+    hm = now.strftime('%H:%M')
+    return '09:10' <= hm <= '11:35' or '12:55' <= hm <= '15:05'
+
+
+_quote_broadcaster = quote_stream.QuoteBroadcaster(
+    market_snapshot.spot_em_snapshot,
+    interval=quote_stream.QUOTE_PUSH_INTERVAL,
+    idle_interval=quote_stream.QUOTE_PUSH_IDLE_INTERVAL,
+    is_active=_is_trading_session,
+)
+
+
+def subscribe_quotes(codes: List[str]) -> quote_stream.QuoteSubscription:
+    """订阅一组代码的行情推送（需在事件循环中调用）；代码为空或超过上限时抛出 ValueError。"""
+    codes_clean = list(dict.fromkeys(history_store.normalize_code(c) for c in codes if str(c).strip()))
+    if not codes_clean:
+        raise ValueError('股票代码列表不能为空')
+    if len(codes_clean) > quote_stream.QUOTE_STREAM_MAX_CODES:
+        raise ValueError(f'单个连接最多订阅 {quote_stream.QUOTE_STREAM_MAX_CODES} 只股票')
+    # 不能用 `if not ak`：会在事件循环上同步导入 akshare，或等待后台预热持有的导入锁；尚未导入时由轮询线程加载
+    if ak.failed:
+        raise ValueError('akshare 未安装，无法推送行情')
+    return _quote_broadcaster.subscribe(codes_clean)
+
+
+def unsubscribe_quotes(sub: quote_stream.QuoteSubscription) -> None:
+    _quote_broadcaster.unsubscribe(sub)
+
+
+def get_quote_stream_stats() -> Dict[str, Any]:
+    """行情推送的订阅数、轮询次数与推送批次数。"""
+    return _quote_broadcaster.stats()
+
+
+def _fetch_trade_dates() -> List[str]:
+    """从新浪接口拉取交易日历（YYYYMMDD 列表）；失败时返回空列表，由 TradeCalendarProvider 负责重试。"""
     try:
-        if ak is None:
-            _trade_dates_cache = []
-            return _trade_dates_cache
+        if not ak:
+            return []
         df = ak.tool_trade_date_hist_sina()
         if df is None or df.empty:
-            _trade_dates_cache = []
-            return _trade_dates_cache
-        if 'trade_date' in df.columns:
-            df['trade_date'] = pd.to_datetime(df['trade_date']).dt.strftime('%Y%m%d')
-            _trade_dates_cache = df['trade_date'].tolist()
-        else:
-            col = df.columns[0]
-            df[col] = pd.to_datetime(df[col]).dt.strftime('%Y%m%d')
-            _trade_dates_cache = df[col].tolist()
-        return _trade_dates_cache
+            return []
+        col = 'trade_date' if 'trade_date' in df.columns else df.columns[0]
+        return pd.to_datetime(df[col]).dt.strftime('%Y%m%d').tolist()
     except Exception as e:
         print(f"Error loading trade dates: {e}")
-        _trade_dates_cache = []
-        return _trade_dates_cache
+        return []
+
+
+# 日历持久化到本地文件，各 worker 共享；后台定期刷新，失败时指数退避
+_calendar_provider = trade_calendar.TradeCalendarProvider(
+    _fetch_trade_dates,
+    path=os.getenv("TRADE_CALENDAR_FILE") or os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data', 'trade_calendar.json'),
+    refresh_seconds=float(os.getenv("TRADE_CALENDAR_REFRESH_SECONDS", str(12 * 3600))),
+)
+
+
+def _get_calendar() -> trade_calendar.TradeCalendar:
+    return _calendar_provider.get()
+
+
+def _has_trading_days(start: str, end: str) -> Optional[bool]:
+    """[start, end]（YYYYMMDD）内是否有交易日；日历为空或未覆盖该区间时返回 None（未知）。"""
+    cal = _get_calendar()
+    if not cal or start < cal.dates[0] or end > cal.last:
+        return None
+    return bool(cal.between(start, end))
+
+
+def _load_trade_dates() -> List[str]:
+    return _get_calendar().dates
+
+
+def start_trade_calendar_refresh() -> None:
+    """应用启动时调用：从磁盘加载日历并启动后台刷新线程，不阻塞启动。"""
+    _calendar_provider.start()
 
 
 def get_trade_dates() -> List[str]:
@@ -247,55 +331,26 @@ def get_trade_dates_with_status() -> List[Dict[str, Any]]:
 
     注意：status 'open' 表示该日为交易日（理论上有数据），'holiday' 表示非交易日，'future' 表示日期在今天之后。
     """
-    dates = _load_trade_dates()
-    out: List[Dict[str, Any]] = []
-    if not dates:
-        return out
+    return _get_calendar().status_list()
 
-    # build a contiguous calendar between min and max available trade date
-    try:
-        min_d = min(dates)
-        max_d = max(dates)
-        start_dt = datetime.strptime(min_d, '%Y%m%d')
-        end_dt = datetime.strptime(max_d, '%Y%m%d')
-    except Exception:
-        # fallback: just mark known trade dates
-        today = datetime.now().strftime('%Y%m%d')
-        for d in dates:
-            st = 'open' if d <= today else 'future'
-            out.append({'date': d, 'status': st})
-        return out
-
-    date_set = set(dates)
-    today_dt = datetime.now()
-    cur = start_dt
-    while cur <= end_dt:
-        ds = cur.strftime('%Y%m%d')
-        if cur.date() > today_dt.date():
-            st = 'future'
-        else:
-            st = 'open' if ds in date_set else 'holiday'
-        out.append({'date': ds, 'status': st})
-        cur = cur + timedelta(days=1)
 
-    return out
+def get_trade_dates_with_status_json() -> bytes:
+    """get_trade_dates_with_status 的 JSON 字节串，按自然日缓存，跨日后才重新生成。"""
+    return _get_calendar().status_json()
 
 
 def get_last_open_date(before: Optional[str] = None) -> Optional[str]:
     """返回最后一个已开市的交易日。若提供 before（YYYYMMDD），则返回 strictly < before 的最后开市日；
     否则返回严格 < today 的最后开市日。如果没有找到则返回 None。
     """
-    dates = _load_trade_dates()
-    if not dates:
+    cal = _get_calendar()
+    if not cal:
         return None
     pivot = before or datetime.now().strftime('%Y%m%d')
-    for d in reversed(dates):
-        try:
-            if d < pivot:
-                return d
-        except Exception:
-            continue
-    return None
+    try:
+        return cal.prev_open(pivot)
+    except ValueError:
+        return None
 
 
 def get_sse_daily_summary(date_str: Optional[str] = None) -> Dict[str, Any]:
@@ -303,11 +358,13 @@ def get_sse_daily_summary(date_str: Optional[str] = None) -> Dict[str, Any]:
 
     如果未传入 date_str，则使用交易日历选择最近一次不晚于今天的交易日作为默认查询日期。
     返回结构：{date: str, data: List[Dict], holiday: bool, message: str}
+
+    早于最近开市日的数据已最终确认，成功获取后永久缓存（见 sse_summary_cache），之后不再回源。
     """
     result: Dict[str, Any] = {"date": date_str or "", "data": [], "holiday": False, "message": ""}
 
-    trade_dates = _load_trade_dates()
-    if not trade_dates:
+    cal = _get_calendar()
+    if not cal:
         result['message'] = '无法获取交易日历'
         return result
 
@@ -319,7 +376,7 @@ def get_sse_daily_summary(date_str: Optional[str] = None) -> Dict[str, Any]:
             result['date'] = date_str
         else:
             # fallback to latest available
-            date_str = trade_dates[-1]
+            date_str = cal.last
             result['date'] = date_str
 
     # annotate last_open_date in result for caller convenience
@@ -333,7 +390,7 @@ def get_sse_daily_summary(date_str: Optional[str] = None) -> Dict[str, Any]:
         return result
 
     # if the requested date is not a trade date, mark as holiday and return message
-    if date_str not in trade_dates:
+    if not cal.is_open(date_str):
         result['holiday'] = True
         result['message'] = f"{date_str} 为休市日"
         result['status'] = 'holiday'
@@ -347,9 +404,18 @@ def get_sse_daily_summary(date_str: Optional[str] = None) -> Dict[str, Any]:
         result['holiday'] = False
         return result
 
+    finalized = _is_finalized_summary_date(date_str)
+    if finalized:
+        cached = sse_summary_cache.sse_summary_cache.get(date_str)
+        if cached is not None:
+            result['data'] = cached
+            result['message'] = '成功'
+            result['status'] = 'ok'
+            return result
+
     # fetch data via akshare if available
     try:
-        if ak is None:
+        if not ak:
             result['message'] = 'akshare 未安装，无法查询'
             return result
 
@@ -358,15 +424,16 @@ def get_sse_daily_summary(date_str: Optional[str] = None) -> Dict[str, Any]:
             result['message'] = '查询到空数据，可能交易所尚未统计完成'
             return result
 
-        # coerce to DataFrame if needed and clean
-        df = _clean_dataframe(raw if isinstance(raw, (pd.DataFrame, pd.Series)) else pd.DataFrame(raw))
-        if df.empty:
+        # coerce to DataFrame if needed; NaN/inf and numpy types are converted column-wise
+        records = dataframe_to_records(raw if isinstance(raw, (pd.DataFrame, pd.Series)) else pd.DataFrame(raw))
+        if not records:
             result['message'] = '查询到空数据'
             return result
 
-        # replace any remaining NaN/inf and convert to records
-        records = df.to_dict(orient='records')
-        result['data'] = _to_json_safe(records)
+        if finalized:
+            sse_summary_cache.sse_summary_cache.put(date_str, records)
+
+        result['data'] = records
         result['message'] = '成功'
         result['status'] = 'ok'
         return result
@@ -375,6 +442,39 @@ def get_sse_daily_summary(date_str: Optional[str] = None) -> Dict[str, Any]:
         return result
 
 
+def _is_finalized_summary_date(date_str: str) -> bool:
+    """早于最近一个已开市日（严格早于今天）的交易日视为数据已最终确认，可以永久缓存。"""
+    last_open = get_last_open_date()
+    return bool(last_open) and date_str < last_open
+
+
+def prewarm_sse_daily_summaries(start_date: str, end_date: Optional[str] = None, delay: float = 0.5) -> Dict[str, Any]:
+    """批量预热 [start_date, end_date] 内已最终确认交易日的上交所概况缓存。
+
+    已缓存的日期直接跳过；每次回源之间间隔 delay 秒，避免触发上游限流。
+    返回 {'cached': 已存在数量, 'fetched': 新获取数量, 'failed': [失败日期...]}
+    """
+    report: Dict[str, Any] = {'cached': 0, 'fetched': 0, 'failed': []}
+    cal = _get_calendar()
+    last_open = get_last_open_date()
+    if not cal or not last_open:
+        return report
+    end = min(end_date or last_open, last_open)
+    for d in cal.between(start_date, end):
+        if not _is_finalized_summary_date(d):
+            continue
+        if d in sse_summary_cache.sse_summary_cache:
+            report['cached'] += 1
+            continue
+        res = get_sse_daily_summary(d)
+        if res.get('status') == 'ok':
+            report['fetched'] += 1
+        else:
+            report['failed'].append(d)
+        time.sleep(delay)
+    return report
+
+
 def _standardize_history_columns(df: pd.DataFrame, code: str) -> pd.DataFrame:
     """简化版列名标准化，输出主要列名为中文，以匹配前端表格字段。"""
     if df is None or df.empty:
@@ -424,6 +524,20 @@ def _standardize_history_columns(df: pd.DataFrame, code: str) -> pd.DataFrame:
     return df
 
 
+def search_stocks(query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """搜索股票（按代码、名称或拼音首字母匹配）。
+
+    基于进程内索引（见 symbol_search），索引在后台定期刷新；返回格式: [{ 'code': '600519', 'name': '贵州茅台' }, ...]
+    """
+    try:
+        if not query:
+            return []
+        return symbol_search.search(query, limit=limit)
+    except Exception as e:
+        print(f"search_stocks error: {e}")
+        return []
+
+
 def get_stock_history_data(code: str, start_date: Optional[str] = None, end_date: Optional[str] = None, adjust: str = "", source: str = 'eastmoney') -> List[Dict[str, Any]]:
     """从多个来源获取 A 股历史日线并返回 JSON-safe 的记录列表。
 
@@ -432,133 +546,436 @@ def get_stock_history_data(code: str, start_date: Optional[str] = None, end_date
     - start_date,end_date: YYYYMMDD 格式，可选
     - adjust: '' | 'qfq' | 'hfq'
     - source: 'eastmoney' | 'sina' | 'tencent'（默认 eastmoney）
+
+    已落盘的日期区间直接读取本地存储（见 history_store），只对缺失区间回源。
     """
     try:
         if not code:
             return []
 
 
-        def search_stocks(query: str, limit: int = 20) -> List[Dict[str, Any]]:
-            """搜索股票（按代码或名称模糊匹配）。
+        code_str = str(code)
+        if not ak:
+            return []
 
-            若环境中安装并可用 akshare，会尝试从常见的 A 股列表中搜索；否则返回空列表。
-            返回格式: [{ 'code': '600519', 'name': '贵州茅台' }, ...]
-            """
-            try:
-                if not query:
-                    return []
-                q = str(query).strip()
-                if ak is None:
-                    return []
-
-                # Try to load a list of A-share codes/names and filter
-                # ak.stock_zh_a_spot provides real-time snapshot; fallback to other available methods
-                df = None
-                if hasattr(ak, 'stock_zh_a_spot'):
-                    try:
-                        df = ak.stock_zh_a_spot()
-                    except Exception:
-                        df = None
-
-                # If df is available, try to extract code/name columns
-                results: List[Dict[str, Any]] = []
-                if df is not None:
-                    # normalise columns
-                    cols = [c.lower() for c in df.columns]
-                    # try to find code and name columns
-                    code_col = None
-                    name_col = None
-                    for c in df.columns:
-                        lc = str(c).lower()
-                        if 'code' in lc or '股票代码' in lc or '代码' in lc:
-                            code_col = c
-                        if 'name' in lc or '股票名称' in lc or '名称' in lc:
-                            name_col = c
-                    if code_col is None and '代码' in df.columns:
-                        code_col = '代码'
-                    if name_col is None and '名称' in df.columns:
-                        name_col = '名称'
-
-                    if code_col is None or name_col is None:
-                        # try common keys
-                        for c in df.columns:
-                            if str(c).lower() in ('code', 'symbol') and code_col is None:
-                                code_col = c
-                            if str(c).lower() in ('name', 'stock_name') and name_col is None:
-                                name_col = c
-
-                    # fallback: use first two columns
-                    if code_col is None:
-                        code_col = df.columns[0]
-                    if name_col is None and len(df.columns) > 1:
-                        name_col = df.columns[1]
-
-                    # do case-insensitive contains filter on code or name
-                    for _, row in df.iterrows():
-                        try:
-                            code_val = str(row.get(code_col, '')).strip()
-                            name_val = str(row.get(name_col, '')).strip()
-                            if q in code_val or q in name_val:
-                                results.append({'code': code_val, 'name': name_val})
-                                if len(results) >= limit:
-                                    break
-                        except Exception:
-                            continue
-
-                return results
-            except Exception as e:
-                print(f"search_stocks error: {e}")
-                return []
+        df = get_stock_history_frame(code_str, start_date=start_date, end_date=end_date, adjust=adjust, source=source)
+        if df is None or df.empty:
+            return []
 
-        code_str = str(code)
+        return dataframe_to_records(df)
+    except Exception as e:
+        print(f"Error in get_stock_history_data: {e}")
+        return []
 
-        # 构造不同源可能需要的符号
-        def to_exchange_prefixed(sym: str) -> str:
-            s = sym.lower()
-            if s.startswith('sh') or s.startswith('sz'):
-                return s
-            if s.startswith('6'):
-                return 'sh' + s
-            return 'sz' + s
 
-        sina_symbol = to_exchange_prefixed(code_str)
-        tencent_symbol = sina_symbol
-        east_symbol = code_str[-6:] if len(code_str) >= 6 else code_str
+def get_stock_history_json(code: str, start_date: Optional[str] = None, end_date: Optional[str] = None, adjust: str = "", source: str = 'eastmoney') -> bytes:
+    """与 get_stock_history_data 相同的数据，但直接序列化为 JSON 字节串，跳过中间的记录列表。"""
+    return get_stock_history_bytes(code, start_date=start_date, end_date=end_date, adjust=adjust, source=source, fmt='records')
 
-        if ak is None:
-            return []
 
-        df = None
-        if source == 'sina':
-            if hasattr(ak, 'stock_zh_a_daily'):
-                df = ak.stock_zh_a_daily(symbol=sina_symbol, start_date=start_date, end_date=end_date, adjust=adjust)
-        elif source == 'tencent':
-            if hasattr(ak, 'stock_zh_a_hist_tx'):
-                df = ak.stock_zh_a_hist_tx(symbol=tencent_symbol, start_date=start_date, end_date=end_date, adjust=adjust)
-        else:
-            # eastmoney
-            if hasattr(ak, 'stock_zh_a_hist'):
-                df = ak.stock_zh_a_hist(symbol=east_symbol, period='daily', start_date=start_date, end_date=end_date, adjust=adjust)
+def get_stock_history_frame_or_empty(code: str, start_date: Optional[str] = None, end_date: Optional[str] = None, adjust: str = "", source: str = 'eastmoney') -> pd.DataFrame:
+    """与 get_stock_history_frame 相同，但出错时返回空 DataFrame，供各序列化格式与流式响应使用。"""
+    try:
+        if not code or not ak:
+            return pd.DataFrame()
+        return get_stock_history_frame(str(code), start_date=start_date, end_date=end_date, adjust=adjust, source=source)
+    except Exception as e:
+        print(f"Error in get_stock_history_frame_or_empty: {e}")
+        return pd.DataFrame()
 
-        if df is None or (isinstance(df, pd.DataFrame) and df.empty):
-            return []
 
-        # 标准化列并清洗
-        if isinstance(df, pd.DataFrame):
-            df2 = _standardize_history_columns(df, code_str)
+# /history 支持的输出格式：records（默认，记录数组） | columnar（按列 JSON） | arrow（Arrow IPC 流）
+HISTORY_FORMATS = ('records', 'columnar', 'arrow')
+HISTORY_ADJUSTS = history_store.HISTORY_ADJUSTS
+
+
+def check_history_params(source: Optional[str], adjust: Optional[str]) -> Tuple[str, str]:
+    """校验并返回 (source, adjust)；空值取默认（eastmoney / 不复权），不支持的取值抛出 ValueError。"""
+    source = source or 'eastmoney'
+    adjust = adjust or ''
+    if source not in source_router.history_router.sources:
+        raise ValueError(f"source 仅支持 {' / '.join(source_router.history_router.sources)}")
+    if adjust not in HISTORY_ADJUSTS:
+        raise ValueError("adjust 仅支持 ''（不复权） / qfq / hfq")
+    return source, adjust
+
+
+def encode_history_frame(df: Optional[pd.DataFrame], fmt: str = 'records') -> bytes:
+    """按 HISTORY_FORMATS 之一序列化日线；股票代码整列相同，在紧凑格式中只出现一次。"""
+    if fmt == 'columnar':
+        return dataframe_to_columnar_json(df, constant_columns=('股票代码',))
+    if fmt == 'arrow':
+        return dataframe_to_arrow_ipc(df, dictionary_columns=('股票代码',))
+    return dataframe_to_json_bytes(df)
+
+
+def get_stock_history_bytes(code: str, start_date: Optional[str] = None, end_date: Optional[str] = None, adjust: str = "", source: str = 'eastmoney', fmt: str = 'records') -> bytes:
+    """按指定格式序列化的历史日线；出错时返回对应格式的空结果。"""
+    df = get_stock_history_frame_or_empty(code, start_date=start_date, end_date=end_date, adjust=adjust, source=source)
+    return encode_history_frame(df, fmt)
+
+
+# 批量历史行情：单次请求的股票数量上限，以及单只股票（含排队等待上游并发名额）的超时
+HISTORY_BATCH_MAX_CODES = int(os.getenv("HISTORY_BATCH_MAX_CODES", "200"))
+HISTORY_BATCH_TIMEOUT_SECONDS = float(os.getenv("HISTORY_BATCH_TIMEOUT_SECONDS", "120"))
+
+
+def history_batch_error_line(code: str, message: str) -> bytes:
+    return json.dumps({'code': code, 'status': 'error', 'message': message}, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+def get_stock_history_batch_frame(code: str, start_date: Optional[str] = None, end_date: Optional[str] = None, adjust: str = "", source: str = 'eastmoney'):
+    """批量接口中单只股票的日线，返回 (是否成功, DataFrame 或错误信息)。"""
+    code = str(code).strip()
+    try:
+        if not ak:
+            return False, 'akshare 未安装，无法查询'
+        return True, get_stock_history_frame(code, start_date=start_date, end_date=end_date, adjust=adjust, source=source)
+    except Exception as e:
+        print(f"Error in get_stock_history_batch_frame({code}): {e}")
+        return False, f'请求数据失败: {e}'
+
+
+def get_stock_history_batch_line(code: str, start_date: Optional[str] = None, end_date: Optional[str] = None, adjust: str = "", source: str = 'eastmoney', fmt: str = 'records'):
+    """批量接口中单只股票的一行 NDJSON，返回 (是否成功, 行字节串)。
+
+    成功: {"code": "000001", "status": "ok", "count": N, "data": [...]}（fmt='columnar' 时 data 为按列组织的对象）
+    失败: {"code": "000001", "status": "error", "message": "..."}
+    """
+    code = str(code).strip()
+    ok, df = get_stock_history_batch_frame(code, start_date=start_date, end_date=end_date, adjust=adjust, source=source)
+    if not ok:
+        return False, history_batch_error_line(code, df)
+    head = json.dumps({'code': code, 'status': 'ok', 'count': 0 if df is None else len(df)}, ensure_ascii=False)
+    # 数据部分直接拼接 DataFrame 的 JSON 序列化结果，不经过记录列表
+    return True, head[:-1].encode('utf-8') + b', "data": ' + encode_history_frame(df, fmt) + b'}\n'
+
+
+def history_frames_to_arrow(frames: List[pd.DataFrame]) -> bytes:
+    """多只股票的日线合并为一个 Arrow IPC 流（以 股票代码 列区分）。"""
+    frames = [f for f in frames if f is not None and not f.empty]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return dataframe_to_arrow_ipc(df, dictionary_columns=('股票代码',))
+
+
+def _fetch_history_frame(code_str: str, start_date: Optional[str], end_date: Optional[str], adjust: str, source: str) -> pd.DataFrame:
+    """经数据源路由获取日线（见 source_router）：source 为首选数据源，异常时自动转移到其他数据源，
+    慢请求可对冲到第二个数据源；所有数据源都失败时抛出最后一个异常。
+
+    备用数据源的结果同样经 _standardize_history_columns 标准化，列名与首选数据源一致（个别数据源缺少的列为空）。
+    """
+    return _fetch_history_frame_routed(code_str, start_date, end_date, adjust, source)[1]
+
+
+def _fetch_history_frame_routed(code_str: str, start_date: Optional[str], end_date: Optional[str], adjust: str, source: str) -> Tuple[str, pd.DataFrame]:
+    """同 _fetch_history_frame，另返回实际应答的数据源；本地存储据此只保存首选数据源自身的数据。
+
+    区间内有交易日（或无法确认）时空结果视为无效，由路由转移到其他数据源。
+    """
+    return source_router.history_router.fetch(
+        source,
+        lambda s: _fetch_history_frame_from(code_str, start_date, end_date, adjust, s),
+        valid=lambda df: not df.empty or _history_range_closed(start_date, end_date),
+    )
+
+
+def _history_range_closed(start_date: Optional[str], end_date: Optional[str]) -> bool:
+    """交易日历确认 [start_date, end_date] 内没有交易日（此时空结果是正常结果）。"""
+    if not start_date or not end_date:
+        return False
+    start, end = str(start_date).replace('-', '')[:8], str(end_date).replace('-', '')[:8]
+    return start > end or _has_trading_days(start, end) is False
+
+
+def get_history_source_stats() -> Dict[str, Any]:
+    """各数据源最近请求的耗时分位数、错误率，以及对冲 / 故障转移次数。"""
+    return source_router.history_router.snapshot()
+
+
+def get_upstream_stats() -> Dict[str, Any]:
+    """上游访问层按服务商统计的请求数、合并次数、限流等待与熔断状态。"""
+    return upstream.upstream_layer.stats()
+
+
+def _fetch_history_frame_from(code_str: str, start_date: Optional[str], end_date: Optional[str], adjust: str, source: str) -> pd.DataFrame:
+    """直接从指定数据源获取日线并标准化列名；上游异常向上抛出，由调用方决定如何处理。"""
+    # 构造不同源可能需要的符号
+    def to_exchange_prefixed(sym: str) -> str:
+        s = sym.lower()
+        if s.startswith('sh') or s.startswith('sz'):
+            return s
+        if s.startswith('6'):
+            return 'sh' + s
+        return 'sz' + s
+
+    sina_symbol = to_exchange_prefixed(code_str)
+    tencent_symbol = sina_symbol
+    east_symbol = code_str[-6:] if len(code_str) >= 6 else code_str
+
+    df = None
+    if source == 'sina':
+        if hasattr(ak, 'stock_zh_a_daily'):
+            df = ak.stock_zh_a_daily(symbol=sina_symbol, start_date=start_date, end_date=end_date, adjust=adjust)
+    elif source == 'tencent':
+        if hasattr(ak, 'stock_zh_a_hist_tx'):
+            df = ak.stock_zh_a_hist_tx(symbol=tencent_symbol, start_date=start_date, end_date=end_date, adjust=adjust)
+    else:
+        # eastmoney
+        if hasattr(ak, 'stock_zh_a_hist'):
+            df = ak.stock_zh_a_hist(symbol=east_symbol, period='daily', start_date=start_date, end_date=end_date, adjust=adjust)
+
+    if df is None or (isinstance(df, pd.DataFrame) and df.empty):
+        return pd.DataFrame()
+
+    # 标准化列
+    if not isinstance(df, pd.DataFrame):
+        df = pd.DataFrame(df)
+    return _standardize_history_columns(df, code_str)
+
+
+def get_stock_history_frame(code: str, start_date: Optional[str] = None, end_date: Optional[str] = None, adjust: str = "", source: str = 'eastmoney') -> pd.DataFrame:
+    """返回标准化后的历史日线 DataFrame（未做 JSON 清洗）。
+
+    启用本地存储时从 history_store 读取，仅缺失的日期区间回源；否则直接请求上游。
+    """
+    code_str = str(code)
+    if not history_store.is_enabled():
+        return _fetch_history_frame(code_str, start_date, end_date, adjust, source)
+
+    def fetcher(s: str, e: str) -> Tuple[str, pd.DataFrame]:
+        return _fetch_history_frame_routed(code_str, s, e, adjust, source)
+
+    df = history_store.history_store.read(code_str, source, adjust, start_date, end_date, fetcher, has_trading_days=_has_trading_days)
+    if df.empty:
+        return df
+    df = df.copy()
+    df['股票代码'] = code_str
+    return df
+
+
+def get_stock_indicators_json(code: str, indicator_spec: str, start_date: Optional[str] = None, end_date: Optional[str] = None, adjust: str = "", source: str = 'eastmoney') -> bytes:
+    """计算技术指标并序列化为 JSON 数组：[{日期, MA5, MACD12_26_9_DIF, ...}, ...]。
+
+    指标始终基于 end_date 之前的全部历史计算（保证 EMA / RSI 等的预热期），再截取 [start_date, end_date] 返回；
+    结果按 (code, adjust, source, 指标) 缓存，新增 K 线只计算尾部（见 indicators.IndicatorCache）。
+    indicator_spec 无法识别时抛出 ValueError。
+    """
+    items = indicators.parse_indicators(indicator_spec)
+    if not code or not ak:
+        return b'[]'
+    try:
+        df = get_stock_history_frame(str(code), start_date=None, end_date=end_date, adjust=adjust, source=source)
+        if df is None or df.empty or '收盘' not in df.columns or '日期' not in df.columns:
+            return b'[]'
+        df = df.sort_values('日期', kind='stable').reset_index(drop=True)
+        key = (history_store.normalize_code(code), adjust or '', source, tuple(items))
+        result = indicators.indicator_cache.compute(key, df, items)
+        if start_date:
+            result = result.loc[result['日期'] >= pd.to_datetime(start_date).strftime('%Y-%m-%d')]
+        return dataframe_to_json_bytes(result)
+    except Exception as e:
+        print(f"Error in get_stock_indicators_json: {e}")
+        return b'[]'
+
+
+def run_stock_backtest(codes: List[str], strategy: str, params: Optional[Dict[str, Any]] = None, sweep: Optional[Dict[str, List[Any]]] = None,
+                       start_date: Optional[str] = None, end_date: Optional[str] = None, adjust: str = 'qfq', source: str = 'eastmoney',
+                       cost: float = 0.001) -> Dict[str, Any]:
+    """多股票向量化回测（见 backtest）。
+
+    - 股票池日线经 get_stock_history_frame 并发加载（本地存储优先），对齐为 日期 × 股票 面板；
+    - 传入 sweep（参数网格）时在进程池中并行回测每组参数，返回按夏普比率排序的指标；否则返回单次回测的指标与净值曲线。
+    策略或参数不合法时抛出 ValueError。
+    返回:
+    {
+        'status': 'ok' | 'error',
+        'message': str,
+        'symbols': int,            # 成功加载的股票数
+        'missing': [code, ...],    # 加载失败的股票
+        'metrics': {...}, 'curve': [{日期, equity, drawdown, turnover}, ...]   # 单次回测
+        'results': [{params, metrics}, ...]                                  # 参数扫描
+    }
+    """
+    result: Dict[str, Any] = {
+        'status': 'error',
+        'message': '',
+        'symbols': 0,
+        'missing': [],
+    }
+
+    if strategy not in backtest.STRATEGIES:
+        raise ValueError(f"不支持的策略: {strategy}（可选 {' / '.join(backtest.STRATEGIES)}）")
+    codes = list(dict.fromkeys(history_store.normalize_code(c) for c in (codes or []) if str(c).strip()))
+    if not codes:
+        result['message'] = '股票代码列表不能为空'
+        return result
+    if len(codes) > backtest.BACKTEST_MAX_SYMBOLS:
+        raise ValueError(f"股票数量超过上限 {backtest.BACKTEST_MAX_SYMBOLS}")
+    if not ak and not history_store.is_enabled():
+        result['message'] = 'akshare 未安装，无法查询'
+        return result
+
+    def loader(code: str) -> pd.DataFrame:
+        return get_stock_history_frame(code, start_date=start_date, end_date=end_date, adjust=adjust, source=source)
+
+    close, volume, missing = backtest.load_panels(codes, loader)
+    result['missing'] = missing
+    result['symbols'] = close.shape[1]
+    if close.empty:
+        result['message'] = '未能加载任何股票的历史数据'
+        return result
+
+    if sweep:
+        result['results'] = backtest.run_sweep(close, volume, strategy, params, sweep, cost=cost)
+        result['message'] = f'完成 {len(result["results"])} 组参数回测'
+    else:
+        run = backtest.run_backtest(close, volume, strategy, params, cost=cost)
+        result['params'] = run['params']
+        result['metrics'] = run['metrics']
+        result['curve'] = dataframe_to_records(run['curve'])
+        result['message'] = '回测完成'
+    result['status'] = 'ok'
+    return result
+
+
+# 公司搜索：优先使用 stock_basic_info 上的 ngram 全文索引（见 migrations/add_stock_basic_info_fulltext.sql），
+# 索引不存在或关键词短于 ngram_token_size 时退化为 LIKE 扫描。
+COMPANY_SEARCH_FULLTEXT = os.getenv("COMPANY_SEARCH_FULLTEXT", "1").lower() not in ("0", "false", "no")
+COMPANY_SEARCH_COUNT_TTL = float(os.getenv("COMPANY_SEARCH_COUNT_TTL", "300"))
+NGRAM_TOKEN_SIZE = int(os.getenv("NGRAM_TOKEN_SIZE", "2"))
+
+_COMPANY_SEARCH_COLUMNS = 'stock_code, company_name, a_stock_abbr, eastmoney_industry, regulatory_industry'
+_COMPANY_INDUSTRY_COLUMNS = 'eastmoney_industry, regulatory_industry'
+
+# 公司列表查询字段（优化显示内容）
+_COMPANY_LIST_COLUMNS = [
+    'stock_code',              # 股票代码
+    'a_stock_abbr',            # 股票简称
+    'company_name',            # 公司名称
+    'security_category',       # 证券类型
+    'chairman',                # 董事长
+    'legal_representative',    # 法人
+    'region',                  # 区域
+    'registered_capital',      # 注册资本（元）
+    'eastmoney_industry',      # 东财行业（保留用于筛选）
+    'regulatory_industry',     # 证监会行业（保留用于筛选）
+    'listing_exchange'         # 交易所
+]
+
+# 运行时检测到全文索引缺失后置为 False，本进程后续请求直接走 LIKE
+_fulltext_available = True
+
+# (stock_basic_info 表版本, q, industry) -> (total, 写入时间)；翻页时复用，避免每页重复 COUNT。
+# 表版本与公司资料缓存共用（company_profiles.profile_cache.table_version），导入脚本改表后旧计数不再命中
+_count_cache: Dict[tuple, tuple] = {}
+_COUNT_CACHE_MAX = 1024
+
+
+def _fulltext_phrase(term: str) -> str:
+    """构造 BOOLEAN MODE 的短语查询，ngram 解析器下等价于连续子串匹配。"""
+    return '"' + term.replace('"', ' ') + '"'
+
+
+def _can_use_fulltext(*terms: str) -> bool:
+    return COMPANY_SEARCH_FULLTEXT and _fulltext_available and all(len(t) >= NGRAM_TOKEN_SIZE for t in terms)
+
+
+def _company_search_where(q: str, industries: List[str], use_fulltext: bool):
+    """返回 (where 子句, 参数, 匹配档位表达式, 全文相关度表达式)。"""
+    where_conditions = []
+    params: Dict[str, Any] = {}
+    relevance = None
+
+    # 关键字搜索
+    if q:
+        params['q'] = q
+        params['likeq'] = f"%{q}%"
+        params['prefixq'] = f"{q}%"
+        if use_fulltext:
+            params['ftq'] = _fulltext_phrase(q)
+            relevance = f"MATCH({_COMPANY_SEARCH_COLUMNS}) AGAINST(:ftq IN BOOLEAN MODE)"
+            where_conditions.append(relevance)
+        else:
+            where_conditions.append("""
+                (stock_code LIKE :likeq 
+                OR company_name LIKE :likeq 
+                OR a_stock_abbr LIKE :likeq
+                OR eastmoney_industry LIKE :likeq 
+                OR regulatory_industry LIKE :likeq)
+            """)
+
+    # 行业筛选（OR 条件）
+    if industries:
+        if use_fulltext:
+            # BOOLEAN MODE 下不带运算符的多个短语为“任一匹配”
+            params['ftind'] = ' '.join(_fulltext_phrase(ind) for ind in industries)
+            where_conditions.append(f"MATCH({_COMPANY_INDUSTRY_COLUMNS}) AGAINST(:ftind IN BOOLEAN MODE)")
         else:
-            try:
-                df2 = pd.DataFrame(df)
-                df2 = _standardize_history_columns(df2, code_str)
-            except Exception:
-                return []
-
-        cleaned = _clean_dataframe(df2)
-        records = cleaned.to_dict(orient='records')
-        return _to_json_safe(records)
+            industry_or_conditions = []
+            for i, ind in enumerate(industries):
+                key_east = f'ind_east_{i}'
+                key_reg = f'ind_reg_{i}'
+                industry_or_conditions.append(f"""
+                    (eastmoney_industry LIKE :{key_east} OR regulatory_industry LIKE :{key_reg})
+                """)
+                params[key_east] = f"%{ind}%"
+                params[key_reg] = f"%{ind}%"
+            where_conditions.append(f"({' OR '.join(industry_or_conditions)})")
+
+    where_clause = ' AND '.join(where_conditions) if where_conditions else '1=1'
+
+    # 匹配档位：代码精确 > 代码前缀 > 简称/名称前缀 > 行业 > 其他；仅按行业筛选时所有行同档
+    if q:
+        rank_expr = """
+            CASE 
+                WHEN stock_code = :q THEN 1
+                WHEN stock_code LIKE :prefixq THEN 2
+                WHEN a_stock_abbr LIKE :prefixq OR company_name LIKE :prefixq THEN 3
+                WHEN eastmoney_industry LIKE :likeq OR regulatory_industry LIKE :likeq THEN 4
+                ELSE 5
+            END
+        """
+    else:
+        rank_expr = "0"
+    return where_clause, params, rank_expr, relevance
+
+
+def _is_missing_fulltext_error(e: Exception) -> bool:
+    # MySQL 1191: Can't find FULLTEXT index matching the column list
+    msg = str(e)
+    return '1191' in msg or 'FULLTEXT' in msg.upper()
+
+
+def _cached_count(key: tuple) -> Optional[int]:
+    hit = _count_cache.get(key)
+    if hit and time.monotonic() - hit[1] < COMPANY_SEARCH_COUNT_TTL:
+        return hit[0]
+    return None
+
+
+def _store_count(key: tuple, total: int) -> None:
+    if len(_count_cache) >= _COUNT_CACHE_MAX:
+        _count_cache.clear()
+    _count_cache[key] = (total, time.monotonic())
+
+
+def _split_industries(industry: Optional[str]) -> List[str]:
+    return [ind.strip() for ind in (industry or '').split(',') if ind.strip()]
+
+
+def _with_fulltext_fallback(db, q: str, industries: List[str], run):
+    """run(use_fulltext) 执行查询；全文索引缺失时标记并改用 LIKE 重试一次。"""
+    global _fulltext_available
+    use_fulltext = _can_use_fulltext(*([q] if q else []), *industries)
+    try:
+        return run(use_fulltext)
     except Exception as e:
-        print(f"Error in get_stock_history_data: {e}")
-        return []
+        if not (use_fulltext and _is_missing_fulltext_error(e)):
+            raise
+        print("company search: FULLTEXT index not found, falling back to LIKE")
+        _fulltext_available = False
+        db.rollback()
+        return run(False)
 
 
 def search_companies_by_industry(db, q: str, page: int = 1, page_size: int = 50, industry: str = None) -> Dict[str, Any]:
@@ -571,6 +988,8 @@ def search_companies_by_industry(db, q: str, page: int = 1, page_size: int = 50,
     - page_size: 每页数量（默认50）
     - industry: 行业筛选（逗号分隔，支持多个），如 "电子,计算机,通信"
 
+    匹配走 ngram 全文索引并按相关度排序；总数按 (表版本, q, industry) 缓存 COMPANY_SEARCH_COUNT_TTL 秒，翻页不再重复 COUNT，表被改写后随版本失效。
+
     返回:
     {
         'total': 总数量,
@@ -585,169 +1004,323 @@ def search_companies_by_industry(db, q: str, page: int = 1, page_size: int = 50,
         if not q and not industry:
             return {'total': 0, 'page': 1, 'page_size': page_size, 'total_pages': 0, 'data': []}
 
-        # 查询字段（优化显示内容）
-        cols = [
-            'stock_code',              # 股票代码
-            'a_stock_abbr',            # 股票简称
-            'company_name',            # 公司名称
-            'security_category',       # 证券类型
-            'chairman',                # 董事长
-            'legal_representative',    # 法人
-            'region',                  # 区域
-            'registered_capital',      # 注册资本（元）
-            'eastmoney_industry',      # 东财行业（保留用于筛选）
-            'regulatory_industry',     # 证监会行业（保留用于筛选）
-            'listing_exchange'         # 交易所
-        ]
-        cols_sql = ', '.join(cols)
-
-        # 构建 WHERE 条件
-        where_conditions = []
-        params = {}
-
-        # 关键字搜索（原有逻辑）
-        if q:
-            likeq = f"%{q}%"
-            where_conditions.append("""
-                (stock_code LIKE :likeq 
-                OR company_name LIKE :likeq 
-                OR a_stock_abbr LIKE :likeq
-                OR eastmoney_industry LIKE :likeq 
-                OR regulatory_industry LIKE :likeq)
-            """)
-            params['likeq'] = likeq
-            params['q'] = q
-
-        # 行业筛选（新增逻辑 - OR 条件）
-        if industry:
-            industries = [ind.strip() for ind in industry.split(',') if ind.strip()]
-            if industries:
-                industry_or_conditions = []
-                for i, ind in enumerate(industries):
-                    key_east = f'ind_east_{i}'
-                    key_reg = f'ind_reg_{i}'
-                    industry_or_conditions.append(f"""
-                        (eastmoney_industry LIKE :{key_east} OR regulatory_industry LIKE :{key_reg})
-                    """)
-                    params[key_east] = f"%{ind}%"
-                    params[key_reg] = f"%{ind}%"
-                
-                if industry_or_conditions:
-                    where_conditions.append(f"({' OR '.join(industry_or_conditions)})")
-
-        # 组合 WHERE 子句
-        where_clause = ' AND '.join(where_conditions) if where_conditions else '1=1'
-
-        with db.begin():
+        industries = _split_industries(industry)
+        return _with_fulltext_fallback(db, q, industries, lambda use_fulltext: _search_companies(db, q, industries, page, page_size, use_fulltext))
+
+    except Exception as e:
+        print(f"search_companies_by_industry error: {e}")
+        traceback.print_exc()
+        return {'total': 0, 'page': 1, 'page_size': page_size, 'total_pages': 0, 'data': [], 'error': str(e)}
+
+
+def _search_companies(db, q: str, industries: List[str], page: int, page_size: int, use_fulltext: bool) -> Dict[str, Any]:
+    cols_sql = ', '.join(_COMPANY_LIST_COLUMNS)
+
+    where_clause, params, rank_expr, relevance = _company_search_where(q, industries, use_fulltext)
+    # 同档内按全文相关度、代码排序
+    order_parts = [rank_expr] if q else []
+    if relevance:
+        order_parts.append(f"{relevance} DESC")
+    order_parts.append('stock_code')
+
+    with db.begin():
+        count_key = (company_profiles.profile_cache.table_version(db), q, tuple(industries))
+        total = _cached_count(count_key)
+        if total is None:
             # 使用 DISTINCT 去重（防止同一公司因多个行业匹配而重复）
             count_sql = f"""
                 SELECT COUNT(DISTINCT stock_code) as total FROM stock_basic_info 
                 WHERE {where_clause}
             """
-            
             count_result = db.execute(text(count_sql), params).fetchone()
             total = count_result[0] if count_result else 0
+            _store_count(count_key, total)
 
-            if total == 0:
-                return {'total': 0, 'page': page, 'page_size': page_size, 'total_pages': 0, 'data': []}
+        if total == 0:
+            return {'total': 0, 'page': page, 'page_size': page_size, 'total_pages': 0, 'data': []}
 
-            # 计算总页数
-            total_pages = (total + page_size - 1) // page_size
-            
-            # 确保页码有效
-            if page < 1:
-                page = 1
-            if page > total_pages:
-                page = total_pages
-
-            # 计算偏移量
-            offset = (page - 1) * page_size
-
-            # 查询数据（使用 DISTINCT 去重，按优先级排序）
-            order_clause = ""
-            if q:
-                order_clause = f"""
-                    ORDER BY 
-                        CASE 
-                            WHEN stock_code = :q THEN 1
-                            WHEN stock_code LIKE :likeq THEN 2
-                            WHEN eastmoney_industry LIKE :likeq THEN 3
-                            WHEN regulatory_industry LIKE :likeq THEN 4
-                            ELSE 5
-                        END,
-                        stock_code
-                """
-            else:
-                order_clause = "ORDER BY stock_code"
-
-            data_sql = f"""
-                SELECT DISTINCT {cols_sql} FROM stock_basic_info 
-                WHERE {where_clause}
-                {order_clause}
-                LIMIT :limit OFFSET :offset
-            """
-            
-            params['limit'] = page_size
-            params['offset'] = offset
-            
-            results = db.execute(text(data_sql), params).mappings().fetchall()
+        # 计算总页数
+        total_pages = (total + page_size - 1) // page_size
+
+        # 确保页码有效
+        if page < 1:
+            page = 1
+        if page > total_pages:
+            page = total_pages
+
+        # 计算偏移量
+        offset = (page - 1) * page_size
 
-            data = [dict(r) for r in results]
+        # 查询数据（使用 DISTINCT 去重，按优先级排序）
+        data_sql = f"""
+            SELECT DISTINCT {cols_sql} FROM stock_basic_info 
+            WHERE {where_clause}
+            ORDER BY {', '.join(order_parts)}
+            LIMIT :limit OFFSET :offset
+        """
 
-            return {
-                'total': total,
-                'page': page,
-                'page_size': page_size,
-                'total_pages': total_pages,
-                'data': data
-            }
+        params['limit'] = page_size
+        params['offset'] = offset
 
+        results = db.execute(text(data_sql), params).mappings().fetchall()
+
+        data = [dict(r) for r in results]
+
+        return {
+            'total': total,
+            'page': page,
+            'page_size': page_size,
+            'total_pages': total_pages,
+            'data': data
+        }
+
+
+def _encode_cursor(rank: int, stock_code: str) -> str:
+    raw = json.dumps([rank, stock_code], ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        rank, stock_code = json.loads(raw.decode('utf-8'))
+        return int(rank), str(stock_code)
+    except Exception:
+        raise ValueError('无效的分页游标 cursor')
+
+
+def search_companies_keyset(db, q: str, page_size: int = 50, industry: str = None, cursor: Optional[str] = None, with_total: bool = False) -> Dict[str, Any]:
+    """按关键词和/或行业搜索公司列表（游标分页）
+
+    与 search_companies_by_industry 的匹配条件相同，但按 (匹配档位, stock_code) 做 keyset 分页，
+    不再用 OFFSET 扫过并丢弃前面的所有行；默认不执行 COUNT，with_total=True 时才返回 total。
+
+    代价随查询方式不同：
+    - 仅按行业筛选：档位恒为 0，按 stock_code > 游标续读，是 stock_code 索引上的范围扫描；
+    - 带关键词 q：档位是现算的表达式，续读条件作用在派生表上，每页都要重新找出全部匹配行并排序，
+      代价与匹配行数成正比（与页码无关），不是索引范围扫描。
+
+    参数:
+    - cursor: 上一页返回的 next_cursor，不传表示第一页；无法解析时抛出 ValueError
+
+    返回:
+    {
+        'page_size': 每页大小,
+        'next_cursor': 下一页游标（没有更多数据时为 None）,
+        'total': 总数量（仅 with_total=True 时返回）,
+        'data': [...]
+    }
+    """
+    try:
+        if not q and not industry:
+            return {'page_size': page_size, 'next_cursor': None, 'data': []}
+
+        industries = _split_industries(industry)
+        after = _decode_cursor(cursor) if cursor else None
+        return _with_fulltext_fallback(db, q, industries, lambda use_fulltext: _search_companies_keyset(db, q, industries, page_size, after, with_total, use_fulltext))
+
+    except ValueError:
+        # 无效游标属于调用方错误，交给路由层返回 400
+        raise
     except Exception as e:
-        print(f"search_companies_by_industry error: {e}")
+        print(f"search_companies_keyset error: {e}")
         traceback.print_exc()
-        return {'total': 0, 'page': 1, 'page_size': page_size, 'total_pages': 0, 'data': [], 'error': str(e)}
+        return {'page_size': page_size, 'next_cursor': None, 'data': [], 'error': str(e)}
+
+
+def _search_companies_keyset(db, q: str, industries: List[str], page_size: int, after, with_total: bool, use_fulltext: bool) -> Dict[str, Any]:
+    cols_sql = ', '.join(_COMPANY_LIST_COLUMNS)
+    where_clause, params, rank_expr, _ = _company_search_where(q, industries, use_fulltext)
+
+    seek_clause = ''
+    if after is not None:
+        params['after_rank'], params['after_code'] = after
+        # 仅按行业筛选时档位恒为 0，直接按 stock_code 续读
+        seek_clause = 'WHERE (search_rank, stock_code) > (:after_rank, :after_code)' if q else 'WHERE stock_code > :after_code'
+
+    with db.begin():
+        result: Dict[str, Any] = {'page_size': page_size}
+        if with_total:
+            count_key = (company_profiles.profile_cache.table_version(db), q, tuple(industries))
+            total = _cached_count(count_key)
+            if total is None:
+                count_sql = f"SELECT COUNT(DISTINCT stock_code) FROM stock_basic_info WHERE {where_clause}"
+                row = db.execute(text(count_sql), params).fetchone()
+                total = row[0] if row else 0
+                _store_count(count_key, total)
+            result['total'] = total
+
+        # 多取一行用于判断是否还有下一页
+        data_sql = f"""
+            SELECT DISTINCT {cols_sql}, search_rank FROM (
+                SELECT {cols_sql}, {rank_expr} AS search_rank
+                FROM stock_basic_info
+                WHERE {where_clause}
+            ) matched
+            {seek_clause}
+            ORDER BY search_rank, stock_code
+            LIMIT :limit
+        """
+        params['limit'] = page_size + 1
+        rows = [dict(r) for r in db.execute(text(data_sql), params).mappings().fetchall()]
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        next_cursor = None
+        if has_more and rows:
+            next_cursor = _encode_cursor(rows[-1]['search_rank'], rows[-1]['stock_code'])
+        for r in rows:
+            r.pop('search_rank', None)
+
+        result['next_cursor'] = next_cursor
+        result['data'] = rows
+        return result
+
+
+# 公司资料返回的字段（保持字段名与顺序稳定，前端依赖）
+# 排除字段: extended_abbr, b_stock_code, h_stock_code, b_stock_abbr, h_stock_abbr
+COMPANY_PROFILE_COLUMNS = [
+    'stock_code', 'company_name', 'english_name',
+    'a_stock_code', 'a_stock_abbr', 'former_name',
+    'security_category', 'eastmoney_industry', 'listing_exchange', 'regulatory_industry',
+    'general_manager', 'legal_representative', 'board_secretary', 'chairman',
+    'securities_representative', 'independent_directors',
+    'contact_phone', 'email', 'fax', 'website',
+    'office_address', 'registered_address', 'region', 'postal_code',
+    'registered_capital', 'business_registration', 'employee_count', 'management_count',
+    'law_firm', 'accounting_firm', 'company_intro', 'business_scope'
+]
 
 
 def get_company_profile(db, q: str) -> Optional[Dict[str, Any]]:
-    """从数据库中查询公司基本资料，q 可以是股票代码或公司名称（模糊匹配）
+    """从数据库中查询公司基本资料，q 可以是股票代码（'SZ000001' / '000001' / '000001.SZ'）或公司名称（全称、简称、曾用名，支持部分匹配）
 
-    返回单条记录的字典或 None。
+    返回单条记录的字典或 None。q 先经别名索引解析为 stock_code，再按代码读进程内缓存，未命中才查库；
+    别名索引不可用时退回原来的 精确匹配 + LIKE 模糊匹配 查询。
+    本函数不访问 Redis：共享缓存由调用方在前后以 prefetch_company_profiles / flush_company_profile_cache 读写。
     """
     try:
+        q = str(q or '').strip()
         if not q:
             return None
 
-        # explicit columns to return (keep stable ordering and field names for frontend)
-        # 排除字段: extended_abbr, b_stock_code, h_stock_code, b_stock_abbr, h_stock_abbr
-        cols = [
-            'stock_code', 'company_name', 'english_name', 
-            'a_stock_code', 'a_stock_abbr', 'former_name',
-            'security_category', 'eastmoney_industry', 'listing_exchange', 'regulatory_industry',
-            'general_manager', 'legal_representative', 'board_secretary', 'chairman',
-            'securities_representative', 'independent_directors',
-            'contact_phone', 'email', 'fax', 'website',
-            'office_address', 'registered_address', 'region', 'postal_code',
-            'registered_capital', 'business_registration', 'employee_count', 'management_count',
-            'law_firm', 'accounting_firm', 'company_intro', 'business_scope'
-        ]
-        cols_sql = ', '.join(cols)
+        cache = company_profiles.profile_cache
+        cache.check_version(db)
+        cols_sql = ', '.join(COMPANY_PROFILE_COLUMNS)
+
+        resolved, code = cache.resolve(db, q)
+        if resolved:
+            if code is None:
+                return None
+            cached = cache.get(code)
+            if cached is not None:
+                return cached
+            generation = cache.generation()
+            res = db.execute(text(f"SELECT {cols_sql} FROM stock_basic_info WHERE stock_code = :q LIMIT 1"), {"q": code}).mappings().fetchone()
+            if not res:
+                return None
+            profile = dict(res)
+            cache.put(code, profile, generation)
+            return profile
 
         # 使用 SQL 进行模糊匹配，优先尝试按 stock_code 精确匹配
         sql_exact = f"SELECT {cols_sql} FROM stock_basic_info WHERE stock_code = :q LIMIT 1"
-        with db.begin():
-            # use mappings() to get a dict-like result across SQLAlchemy versions
-            res = db.execute(text(sql_exact), {"q": q}).mappings().fetchone()
-            if res:
-                return dict(res)
-
-            # 模糊匹配 company_name 或 a_stock_code 或 a_stock_abbr
-            sql_like = f"SELECT {cols_sql} FROM stock_basic_info WHERE company_name LIKE :likeq OR a_stock_code LIKE :likeq OR a_stock_abbr LIKE :likeq LIMIT 1"
-            likeq = f"%{q}%"
-            res2 = db.execute(text(sql_like), {"likeq": likeq}).mappings().fetchone()
-            if res2:
-                return dict(res2)
+        # use mappings() to get a dict-like result across SQLAlchemy versions
+        res = db.execute(text(sql_exact), {"q": company_profiles.normalize_stock_code(q) or q}).mappings().fetchone()
+        if res:
+            return dict(res)
+
+        # 模糊匹配 company_name 或 a_stock_code 或 a_stock_abbr
+        sql_like = f"SELECT {cols_sql} FROM stock_basic_info WHERE company_name LIKE :likeq OR a_stock_code LIKE :likeq OR a_stock_abbr LIKE :likeq LIMIT 1"
+        likeq = f"%{q}%"
+        res2 = db.execute(text(sql_like), {"likeq": likeq}).mappings().fetchone()
+        if res2:
+            return dict(res2)
 
         return None
     except Exception as e:
         print(f"get_company_profile error: {e}")
         return None
+
+
+COMPANY_PROFILE_BATCH_MAX_CODES = int(os.getenv("COMPANY_PROFILE_BATCH_MAX_CODES", "500"))
+
+
+def get_company_profiles(db, codes: List[str], fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """批量查询公司基本资料，一次 IN 查询取回所有未命中缓存的代码。
+
+    - codes: 股票代码（与单条接口相同的写法，也可以是公司名称），去重后按原样作为返回结果的键
+    - fields: 需要返回的字段，默认全部（COMPANY_PROFILE_COLUMNS）；列表页通常不需要 company_intro / business_scope 这类大文本列
+    - 完整资料先读缓存；指定了字段时未命中部分只查所需列，且不写入缓存（缓存中只保存完整资料）
+
+    返回 {'data': {code: profile}, 'not_found': [code, ...], 'fields': [...]}；参数不合法时抛出 ValueError。
+    """
+    codes = list(dict.fromkeys(str(c).strip() for c in (codes or []) if str(c).strip()))
+    if not codes:
+        raise ValueError('股票代码列表不能为空')
+    if len(codes) > COMPANY_PROFILE_BATCH_MAX_CODES:
+        raise ValueError(f'股票数量超过上限 {COMPANY_PROFILE_BATCH_MAX_CODES}')
+
+    if fields:
+        unknown = [f for f in fields if f not in COMPANY_PROFILE_COLUMNS]
+        if unknown:
+            raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+        # stock_code 始终返回，用于与请求对应
+        columns = ['stock_code'] + [c for c in COMPANY_PROFILE_COLUMNS if c in fields and c != 'stock_code']
+    else:
+        columns = list(COMPANY_PROFILE_COLUMNS)
+    full = len(columns) == len(COMPANY_PROFILE_COLUMNS)
+
+    cache = company_profiles.profile_cache
+    cache.check_version(db)
+    index = cache.aliases(db)
+    if index is not None:
+        targets = {c: index.resolve(c) for c in codes}
+    else:
+        targets = {c: company_profiles.normalize_stock_code(c) or c for c in codes}
+    wanted = list(dict.fromkeys(t for t in targets.values() if t))
+
+    profiles = cache.get_many(wanted)
+    missing = [c for c in wanted if c not in profiles]
+    if missing:
+        generation = cache.generation()
+        sql = text(f"SELECT {', '.join(columns)} FROM stock_basic_info WHERE stock_code IN :codes").bindparams(
+            bindparam('codes', expanding=True)
+        )
+        loaded = {r['stock_code']: dict(r) for r in db.execute(sql, {'codes': missing}).mappings()}
+        if full and loaded:
+            cache.put_many(loaded, generation)
+        profiles.update(loaded)
+
+    data: Dict[str, Dict[str, Any]] = {}
+    not_found: List[str] = []
+    for c in codes:
+        profile = profiles.get(targets[c]) if targets[c] else None
+        if profile is None:
+            not_found.append(c)
+        else:
+            data[c] = profile if full else {k: profile.get(k) for k in columns}
+    return {'data': data, 'not_found': not_found, 'fields': columns}
+
+
+def prefetch_company_profiles(queries: List[str]) -> None:
+    """阻塞（Redis IO），在线程池中执行：把 queries 对应的资料从共享缓存读入进程内缓存。"""
+    company_profiles.profile_cache.prefetch_shared(queries)
+
+
+def flush_company_profile_cache() -> None:
+    """阻塞（Redis IO），在线程池中执行：把本进程新查到的资料写入共享缓存。"""
+    company_profiles.profile_cache.flush_shared()
+
+
+def company_profile_shared_cache_enabled() -> bool:
+    return company_profiles.profile_cache.shared_enabled()
+
+
+def company_profile_cache_has_pending() -> bool:
+    return company_profiles.profile_cache.has_pending_shared()
+
+
+def get_company_profile_cache_stats() -> Dict[str, Any]:
+    """公司资料缓存的命中率、条目数、别名索引规模与当前表版本。"""
+    return company_profiles.profile_cache.stats()
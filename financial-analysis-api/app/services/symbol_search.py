@@ -0,0 +1,246 @@
+"""股票代码/名称联想搜索
+
+特性：
+- 进程内索引：代码、简称、公司全称、拼音首字母（安装 pypinyin 时）。
+- 数据来源优先 stock_basic_info 表，不可用时退化为 ak.stock_info_a_code_name() 的代码列表。
+- 前缀查询走有序数组 + bisect，子串查询在预先拼接好的小写文本上用 str.find 扫描；5000 只股票规模下均为亚毫秒级。
+- 排序：代码完全匹配 > 代码前缀 > 拼音首字母前缀 > 名称前缀 > 子串匹配。
+- 索引在后台线程按 SYMBOL_INDEX_REFRESH_SECONDS 定期重建，重建完成后整体替换，查询不加锁。
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from app.core.upstream import ak
+
+load_dotenv()
+
+SYMBOL_INDEX_REFRESH_SECONDS = float(os.getenv("SYMBOL_INDEX_REFRESH_SECONDS", str(6 * 3600)))
+
+# 排序权重，数值越小越靠前
+RANK_EXACT = 0
+RANK_CODE_PREFIX = 1
+RANK_PINYIN_PREFIX = 2
+RANK_NAME_PREFIX = 3
+RANK_SUBSTRING = 4
+
+
+_pinyin = None
+
+
+def _load_pinyin():
+    """延迟导入 pypinyin：载入拼音词典约需 0.5 秒，只在（后台）构建索引时才需要；未安装时返回 False。"""
+    global _pinyin
+    if _pinyin is None:
+        try:
+            from pypinyin import lazy_pinyin, Style
+            _pinyin = (lazy_pinyin, Style.FIRST_LETTER)
+        except Exception:
+            _pinyin = False
+    return _pinyin
+
+
+def _pinyin_initials(name: str) -> str:
+    pinyin = _load_pinyin()
+    if not pinyin or not name:
+        return ''
+    lazy_pinyin, first_letter = pinyin
+    try:
+        return ''.join(lazy_pinyin(name, style=first_letter)).lower()
+    except Exception:
+        return ''
+
+
+class _PrefixTable:
+    """有序 (key, entry_id) 数组，支持按前缀取出前若干条。"""
+
+    def __init__(self, pairs: List[Tuple[str, int]]):
+        pairs.sort()
+        self.keys = [k for k, _ in pairs]
+        self.ids = [i for _, i in pairs]
+
+    def scan(self, prefix: str):
+        pos = bisect_left(self.keys, prefix)
+        keys, ids = self.keys, self.ids
+        while pos < len(keys) and keys[pos].startswith(prefix):
+            yield ids[pos]
+            pos += 1
+
+
+class SymbolIndex:
+    """不可变的搜索索引，由 build_index 构造，刷新时整体替换。"""
+
+    def __init__(self, rows: List[Dict[str, str]]):
+        # 按代码排序，子串扫描按顺序提前结束时即为代码序
+        rows = sorted(rows, key=lambda r: r['code'])
+        self.entries = [{'code': r['code'], 'name': r['name']} for r in rows]
+        self.code_to_id = {r['code']: i for i, r in enumerate(rows)}
+
+        code_pairs, pinyin_pairs, name_pairs = [], [], []
+        haystack: List[str] = []
+        for i, r in enumerate(rows):
+            code_pairs.append((r['code'], i))
+            names = [n.lower() for n in (r['name'], r.get('full_name') or '') if n]
+            for n in names:
+                name_pairs.append((n, i))
+            py = _pinyin_initials(r['name'])
+            if py:
+                pinyin_pairs.append((py, i))
+            haystack.append('\x00'.join([r['code']] + names + ([py] if py else [])))
+
+        # 所有可搜索文本拼成一个大字符串，子串查询用 str.find 在 C 层扫描；offsets[i] 为第 i 条的起始位置
+        self.text = '\n'.join(haystack)
+        self.offsets: List[int] = []
+        pos = 0
+        for h in haystack:
+            self.offsets.append(pos)
+            pos += len(h) + 1
+
+        self.codes = _PrefixTable(code_pairs)
+        self.pinyin = _PrefixTable(pinyin_pairs)
+        self.names = _PrefixTable(name_pairs)
+        self.built_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _substring_ids(self, q: str):
+        text, offsets = self.text, self.offsets
+        pos = text.find(q)
+        while pos != -1:
+            i = bisect_right(offsets, pos) - 1
+            yield i
+            # 跳到下一条，避免同一条重复命中
+            nxt = offsets[i + 1] if i + 1 < len(offsets) else len(text)
+            pos = text.find(q, nxt)
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        q = str(query).strip().lower()
+        if not q or limit <= 0:
+            return []
+        # 兼容 'sh600000' / 'SZ000001' 这类带交易所前缀的输入
+        if q[:2] in ('sh', 'sz', 'bj') and q[2:].isdigit():
+            q = q[2:]
+
+        seen: Dict[int, int] = {}
+
+        def take(ids, rank: int) -> bool:
+            for i in ids:
+                if i not in seen:
+                    seen[i] = rank
+                    if len(seen) >= limit:
+                        return True
+            return False
+
+        exact = self.code_to_id.get(q)
+        done = take([exact] if exact is not None else [], RANK_EXACT)
+        done = done or take(self.codes.scan(q), RANK_CODE_PREFIX)
+        done = done or take(self.pinyin.scan(q), RANK_PINYIN_PREFIX)
+        done = done or take(self.names.scan(q), RANK_NAME_PREFIX)
+        if not done:
+            take(self._substring_ids(q), RANK_SUBSTRING)
+
+        return [self.entries[i] for i in seen]
+
+
+def _load_from_db() -> List[Dict[str, str]]:
+    # 延迟导入：app.core.database 在导入时会连接数据库
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        sql = text(
+            """
+            SELECT a_stock_code, a_stock_abbr, company_name
+            FROM stock_basic_info
+            WHERE a_stock_code IS NOT NULL AND a_stock_code <> ''
+            """
+        )
+        rows = db.execute(sql).mappings().fetchall()
+        return [
+            {
+                'code': str(r['a_stock_code']).strip(),
+                'name': str(r['a_stock_abbr'] or r['company_name'] or '').strip(),
+                'full_name': str(r['company_name'] or '').strip(),
+            }
+            for r in rows
+        ]
+    finally:
+        db.close()
+
+
+def _load_from_akshare() -> List[Dict[str, str]]:
+    if not ak:
+        return []
+    df = ak.stock_info_a_code_name()
+    if df is None or df.empty:
+        return []
+    return [{'code': str(c).strip(), 'name': str(n).strip()} for c, n in zip(df['code'], df['name'])]
+
+
+def build_index() -> Optional[SymbolIndex]:
+    for loader in (_load_from_db, _load_from_akshare):
+        try:
+            rows = loader()
+            if rows:
+                return SymbolIndex(rows)
+        except Exception as e:
+            print(f"symbol index: {loader.__name__} failed: {e}")
+    return None
+
+
+# 数据源全部不可用时，两次同步构建之间的最小间隔（秒）
+_RETRY_INTERVAL = 60.0
+
+_index: Optional[SymbolIndex] = None
+_build_lock = threading.Lock()
+_refresher: Optional[threading.Thread] = None
+_last_attempt = -_RETRY_INTERVAL
+
+
+def refresh_index() -> Optional[SymbolIndex]:
+    """重建索引；失败时保留旧索引。"""
+    global _index
+    new_index = build_index()
+    if new_index is not None:
+        _index = new_index
+    return _index
+
+
+def _refresh_loop() -> None:
+    while True:
+        time.sleep(SYMBOL_INDEX_REFRESH_SECONDS)
+        refresh_index()
+
+
+def get_index() -> Optional[SymbolIndex]:
+    """返回当前索引；首次调用时同步构建并启动后台刷新线程。"""
+    global _refresher, _last_attempt
+    if _index is not None:
+        return _index
+    with _build_lock:
+        if _index is None and time.monotonic() - _last_attempt >= _RETRY_INTERVAL:
+            _last_attempt = time.monotonic()
+            refresh_index()
+        if _refresher is None:
+            _refresher = threading.Thread(target=_refresh_loop, name='symbol-index-refresh', daemon=True)
+            _refresher.start()
+    return _index
+
+
+def get_index_if_ready() -> Optional[SymbolIndex]:
+    """索引已构建时返回之，否则返回 None（不触发构建）。"""
+    return _index
+
+
+def search(query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    index = get_index()
+    if index is None:
+        return []
+    return index.search(query, limit=limit)
@@ -0,0 +1,281 @@
+"""交易日历索引
+
+将交易日列表预处理为：
+- 有序整数数组（YYYYMMDD -> int），前后开市日查询走 bisect，O(log n)；
+- 字符串集合，是否开市 O(1)；
+- 自首个交易日至最后一个交易日的逐日开市标记（numpy 布尔数组），/trade_dates_with_status
+  的结果按“今天”整列计算后序列化一次，跨日才重新生成。
+
+TradeCalendarProvider 负责日历的本地持久化、后台定期刷新与多 worker 共享。
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def _today() -> str:
+    return datetime.now().strftime('%Y%m%d')
+
+
+class TradeCalendar:
+    """不可变的交易日历索引，交易日列表变化时整体重建。"""
+
+    def __init__(self, dates: List[str]):
+        self.dates: List[str] = sorted(set(str(d) for d in dates))
+        self._ints: List[int] = [int(d) for d in self.dates]
+        self._set = set(self.dates)
+
+        if self.dates:
+            days = pd.date_range(self.dates[0], self.dates[-1], freq='D')
+            self._days = days.strftime('%Y%m%d').to_numpy(dtype=object)
+            self._day_ints = days.year.to_numpy() * 10000 + days.month.to_numpy() * 100 + days.day.to_numpy()
+            self._open_mask = np.isin(self._day_ints, np.asarray(self._ints))
+        else:
+            self._days = np.array([], dtype=object)
+            self._day_ints = np.array([], dtype=np.int64)
+            self._open_mask = np.array([], dtype=bool)
+
+        self._status_cache: Optional[Tuple[str, bytes]] = None
+        self._status_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __bool__(self) -> bool:
+        return bool(self.dates)
+
+    @property
+    def last(self) -> Optional[str]:
+        return self.dates[-1] if self.dates else None
+
+    def is_open(self, date_str: str) -> bool:
+        return date_str in self._set
+
+    def prev_open(self, before: str) -> Optional[str]:
+        """严格早于 before 的最后一个开市日。"""
+        i = bisect_left(self._ints, int(before)) - 1
+        return self.dates[i] if i >= 0 else None
+
+    def next_open(self, after: str) -> Optional[str]:
+        """严格晚于 after 的第一个开市日。"""
+        i = bisect_right(self._ints, int(after))
+        return self.dates[i] if i < len(self.dates) else None
+
+    def between(self, start: str, end: str) -> List[str]:
+        """[start, end] 闭区间内的开市日。"""
+        lo = bisect_left(self._ints, int(start))
+        hi = bisect_right(self._ints, int(end))
+        return self.dates[lo:hi]
+
+    def _status_array(self, today: str) -> np.ndarray:
+        status = np.where(self._open_mask, 'open', 'holiday').astype(object)
+        status[self._day_ints > int(today)] = 'future'
+        return status
+
+    def status_list(self, today: Optional[str] = None) -> List[Dict[str, Any]]:
+        """[{date: 'YYYYMMDD', status: 'open'|'holiday'|'future'}]，覆盖首末交易日之间的每一天。"""
+        status = self._status_array(today or _today())
+        return [{'date': d, 'status': s} for d, s in zip(self._days.tolist(), status.tolist())]
+
+    def status_json(self, today: Optional[str] = None) -> bytes:
+        """status_list 的 JSON 序列化结果，同一天内只生成一次。"""
+        today = today or _today()
+        cached = self._status_cache
+        if cached is not None and cached[0] == today:
+            return cached[1]
+        with self._status_lock:
+            cached = self._status_cache
+            if cached is not None and cached[0] == today:
+                return cached[1]
+            body = json.dumps(self.status_list(today), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            self._status_cache = (today, body)
+            return body
+
+
+class TradeCalendarProvider:
+    """交易日历的持久化与后台刷新。
+
+    - 日历保存在本地 JSON 文件（TRADE_CALENDAR_FILE），启动时优先从磁盘加载，冷启动无需访问上游；
+    - 后台线程按 TRADE_CALENDAR_REFRESH_SECONDS 定期刷新，失败时指数退避重试，刷新失败不会覆盖已有日历；
+      请求线程在日历为空时的同步回源与后台线程共用同一退避状态，上游故障期间不会随请求量放大；
+    - 多个 worker 共享同一文件：通过锁文件保证同一时刻只有一个进程回源，其余进程发现文件更新后重新加载。
+    """
+
+    def __init__(self, fetcher: Callable[[], List[str]], path: str, refresh_seconds: float,
+                 retry_min_seconds: float = 60.0, retry_max_seconds: float = 3600.0):
+        self._fetcher = fetcher
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.retry_min_seconds = retry_min_seconds
+        self.retry_max_seconds = retry_max_seconds
+
+        self._calendar = TradeCalendar([])
+        self._fetched_at = 0.0   # 当前日历的获取时间（epoch 秒，来自文件）
+        self._mtime = 0.0        # 最近一次加载的文件 mtime
+        self._checked_at = 0.0   # 最近一次检查文件变化的时间
+        self._retry_at = 0.0     # 下一次允许回源的时间（monotonic），失败后按退避推迟
+        self._retry_delay = retry_min_seconds
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+
+    # ---- 磁盘读写 ----
+
+    def _load_from_disk(self) -> bool:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+            dates = payload.get('dates') or []
+            if not dates:
+                return False
+            self._calendar = TradeCalendar(dates)
+            self._fetched_at = float(payload.get('fetched_at') or mtime)
+            self._mtime = mtime
+            return True
+        except Exception as e:
+            print(f"trade calendar: failed to load {self.path}: {e}")
+            return False
+
+    def _save_to_disk(self, dates: List[str]) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': time.time(), 'dates': dates}, f)
+        os.replace(tmp, self.path)
+
+    @contextmanager
+    def _refresh_lock(self):
+        """跨进程互斥：创建锁文件成功者负责回源；锁文件超过 10 分钟视为残留并清理。"""
+        lock_path = self.path + '.lock'
+        try:
+            os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+            if time.time() - os.path.getmtime(lock_path) > 600:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            yield False
+            return
+        except OSError:
+            # 目录不可写等情况下退化为进程内刷新
+            yield True
+            return
+        try:
+            os.close(fd)
+            yield True
+        finally:
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+    # ---- 刷新 ----
+
+    def refresh(self) -> bool:
+        """从上游拉取日历并落盘；失败或拿到空列表时保留现有日历并返回 False。"""
+        with self._fetch_lock:
+            # 等锁期间可能已由本进程其他线程刷新完成
+            with self._lock:
+                self._load_from_disk()
+            if self._calendar and not self._is_stale():
+                return True
+            with self._refresh_lock() as acquired:
+                if not acquired:
+                    # 其他 worker 正在刷新，稍后从磁盘读取其结果
+                    with self._lock:
+                        return self._load_from_disk()
+                dates = self._fetcher()
+                if not dates:
+                    print("trade calendar: upstream returned no dates, keeping current calendar")
+                    return False
+                self._save_to_disk(dates)
+            with self._lock:
+                self._mtime = 0.0
+                return self._load_from_disk()
+
+    def _is_stale(self) -> bool:
+        return time.time() - self._fetched_at >= self.refresh_seconds
+
+    def _claim_attempt(self) -> bool:
+        """退避期已过时占用本次回源机会（并先按当前退避间隔预约下一次），否则返回 False。"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._retry_at:
+                return False
+            self._retry_at = now + self._retry_delay
+            return True
+
+    def _record_attempt(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self._retry_delay = self.retry_min_seconds
+                self._retry_at = 0.0
+            else:
+                self._retry_at = time.monotonic() + self._retry_delay
+                self._retry_delay = min(self._retry_delay * 2, self.retry_max_seconds)
+
+    def _attempt_refresh(self) -> Optional[bool]:
+        """受退避限制的一次刷新；退避期内不回源并返回 None。"""
+        if not self._claim_attempt():
+            return None
+        try:
+            ok = self.refresh()
+        except Exception as e:
+            print(f"trade calendar refresh error: {e}")
+            ok = False
+        ok = ok and bool(self._calendar)
+        self._record_attempt(ok)
+        return ok
+
+    def _refresh_loop(self) -> None:
+        while True:
+            ok: Optional[bool] = True
+            with self._lock:
+                self._load_from_disk()
+            if not self._calendar or self._is_stale():
+                ok = self._attempt_refresh()
+            if ok is not False and self._calendar and not self._is_stale():
+                wait = max(self.retry_min_seconds, self.refresh_seconds - (time.time() - self._fetched_at))
+            else:
+                wait = max(1.0, self._retry_at - time.monotonic())
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+    def start(self) -> None:
+        """启动后台刷新线程（幂等）。"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refresh_loop, name='trade-calendar-refresh', daemon=True)
+                self._thread.start()
+
+    def get(self) -> TradeCalendar:
+        """返回当前日历。内存为空时先读磁盘，磁盘也没有且不在退避期内时同步回源一次（否则直接返回空日历）；
+        同时确保后台刷新已启动。"""
+        if self._calendar and time.monotonic() - self._checked_at < 5:
+            return self._calendar
+        with self._lock:
+            self._checked_at = time.monotonic()
+            # 其他 worker 刷新后文件 mtime 变化，重新加载
+            self._load_from_disk()
+        if not self._calendar:
+            self._attempt_refresh()
+        self.start()
+        return self._calendar
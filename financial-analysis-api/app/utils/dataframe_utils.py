@@ -0,0 +1,172 @@
+"""DataFrame 序列化工具
+
+以整列运算完成 JSON 清洗，替代逐单元格的 Python 循环：
+- NaN / inf / NaT -> null
+- numpy 标量 -> Python 原生类型
+- 日期时间列 -> 'YYYY-MM-DD' 字符串
+
+iter_dataframe_json 按行块增量序列化，供流式响应使用，不需要一次性生成完整的响应体。
+dataframe_to_columnar_json / dataframe_to_arrow_ipc 为紧凑格式：按列输出，列名只出现一次。
+
+浮点数精度：JSON 输出统一保留小数点后 JSON_DOUBLE_PRECISION（10）位，这是 pandas 的默认值，也是小数位数而非有效数字：
+- 行情价格、涨跌幅、成交额等（2~4 位小数）原样输出，如 1234.56 不会变成 1234.559999999999945（double_precision=15 时的问题）；
+- 绝对值小于 5e-11 的数输出为 0.0，小数第 10 位之后的数字被舍去（如 3.14159265358979 -> 3.1415926536）；
+- 整数部分较大时可能带出二进制尾数（如 123456789012.34 -> 123456789012.3399963379），但解析后与原 double 相同。
+需要完整精度的数据请用 Arrow 格式（dataframe_to_arrow_ipc 原样保存 float64）。
+"""
+
+import json
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except Exception:
+    pa = None
+
+DATE_FORMAT = '%Y-%m-%d'
+# 流式序列化时每块的行数
+STREAM_CHUNK_ROWS = 2000
+ARROW_STREAM_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+# JSON 中浮点数保留的小数位数（见模块说明）
+JSON_DOUBLE_PRECISION = 10
+
+
+def _format_dates(df: pd.DataFrame) -> pd.DataFrame:
+    """把日期时间列（包括存放 date/datetime 对象的 object 列）整列格式化为字符串。"""
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            df[col] = s.dt.strftime(DATE_FORMAT)
+        elif s.dtype == object and pd.api.types.infer_dtype(s, skipna=True) in ('date', 'datetime'):
+            df[col] = pd.to_datetime(s, errors='coerce').dt.strftime(DATE_FORMAT)
+    return df
+
+
+def _native(v: Any) -> Any:
+    if isinstance(v, np.generic):
+        v = v.item()
+    if isinstance(v, float) and not np.isfinite(v):
+        return None
+    return v
+
+
+def _prepare(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    if df is None:
+        return pd.DataFrame()
+    if isinstance(df, pd.Series):
+        df = df.to_frame().T
+    df = _format_dates(df.copy())
+    num_cols = df.select_dtypes(include=[np.floating]).columns
+    if len(num_cols):
+        df[num_cols] = df[num_cols].replace([np.inf, -np.inf], np.nan)
+    return df
+
+
+def sanitize_dataframe(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """返回 object 类型的副本：缺失值统一为 None，数值为 Python 原生 int/float。"""
+    df = _prepare(df)
+    if df.empty:
+        return df
+    # 数值列在 astype(object) 时已整列转为原生类型；只有混合类型的 object 列需要逐值处理
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object and pd.api.types.infer_dtype(s, skipna=True) not in ('string', 'empty', 'boolean'):
+            df[col] = s.map(_native, na_action='ignore')
+    out = df.astype(object)
+    return out.where(df.notna(), None)
+
+
+def dataframe_to_records(df: Optional[pd.DataFrame]) -> List[Dict[str, Any]]:
+    """DataFrame -> JSON-safe 的记录列表（可直接交给 json.dumps）。"""
+    df = sanitize_dataframe(df)
+    if df.empty:
+        return []
+    return df.to_dict(orient='records')
+
+
+def dataframe_to_json_bytes(df: Optional[pd.DataFrame]) -> bytes:
+    """DataFrame -> UTF-8 JSON 数组（records 格式），全程在 pandas 的 C 序列化器中完成。"""
+    df = _prepare(df)
+    if df.empty:
+        return b'[]'
+    return df.to_json(orient='records', force_ascii=False, double_precision=JSON_DOUBLE_PRECISION, default_handler=str).encode('utf-8')
+
+
+def iter_dataframe_json(df: Optional[pd.DataFrame], fmt: str = 'ndjson', chunk_rows: int = STREAM_CHUNK_ROWS,
+                        open_bracket: bool = True) -> Iterator[bytes]:
+    """逐块序列化 DataFrame。
+
+    - fmt='ndjson'：每行一个 JSON 对象，以换行分隔；
+    - fmt='array'：标准 JSON 数组，按块输出；open_bracket=False 时调用方已自行输出 '['。
+    每块单独做 JSON 清洗，内存中同时只存在一个块的副本。
+    """
+    array = fmt == 'array'
+    if array and open_bracket:
+        yield b'['
+    first = True
+    total = 0 if df is None else len(df)
+    for start in range(0, total, chunk_rows):
+        chunk = _prepare(df.iloc[start:start + chunk_rows])
+        if array:
+            body = chunk.to_json(orient='records', force_ascii=False, double_precision=JSON_DOUBLE_PRECISION, default_handler=str)
+            # 去掉块自身的 '[' 和 ']'，块之间以逗号连接
+            yield (body[1:-1] if first else ',' + body[1:-1]).encode('utf-8')
+        else:
+            body = chunk.to_json(orient='records', lines=True, force_ascii=False, double_precision=JSON_DOUBLE_PRECISION, default_handler=str)
+            yield body.encode('utf-8') if body.endswith('\n') else (body + '\n').encode('utf-8')
+        first = False
+    if array:
+        yield b']'
+
+
+def _split_constants(df: pd.DataFrame, candidates: Sequence[str]) -> Dict[str, Any]:
+    """candidates 中整列取值相同的列，返回 {列名: 值}。"""
+    constants: Dict[str, Any] = {}
+    for col in candidates:
+        if col in df.columns and len(df) and df[col].nunique(dropna=False) == 1:
+            constants[col] = _native(df[col].iloc[0])
+    return constants
+
+
+def dataframe_to_columnar_json(df: Optional[pd.DataFrame], constant_columns: Sequence[str] = ()) -> bytes:
+    """DataFrame -> 按列组织的 JSON：
+
+    {"count": N, "columns": [...], "data": {"日期": [...], "收盘": [...]}, "constants": {"股票代码": "000001"}}
+
+    constant_columns 中整列取值相同的列（如股票代码）提到 constants 中只出现一次。每列由 pandas 的 C 序列化器直接输出数组。
+    """
+    df = _prepare(df)
+    constants = _split_constants(df, constant_columns)
+    columns = [c for c in df.columns if c not in constants]
+    parts = [
+        b'{"count":', str(len(df)).encode('utf-8'),
+        b',"columns":', json.dumps([str(c) for c in columns], ensure_ascii=False).encode('utf-8'),
+        b',"data":{',
+    ]
+    for i, col in enumerate(columns):
+        values = df[col].to_json(orient='values', force_ascii=False, double_precision=JSON_DOUBLE_PRECISION, default_handler=str)
+        parts.append((b',' if i else b'') + json.dumps(str(col), ensure_ascii=False).encode('utf-8') + b':' + values.encode('utf-8'))
+    parts.append(b'},"constants":' + json.dumps(constants, ensure_ascii=False).encode('utf-8') + b'}')
+    return b''.join(parts)
+
+
+def dataframe_to_arrow_ipc(df: Optional[pd.DataFrame], dictionary_columns: Sequence[str] = ()) -> bytes:
+    """DataFrame -> Arrow IPC 流格式字节串（需要 pyarrow）；日期列为 'YYYY-MM-DD' 字符串。
+
+    dictionary_columns 中的列（如重复的股票代码）以字典编码存储。
+    """
+    if pa is None:
+        raise RuntimeError('pyarrow 未安装，无法输出 Arrow 格式')
+    df = _prepare(df)
+    table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+    for col in dictionary_columns:
+        if col in table.column_names:
+            i = table.column_names.index(col)
+            table = table.set_column(i, col, table.column(i).dictionary_encode())
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -1,3 +1,4 @@
+from app.core import startup  # 最先导入：启动计时起点
 from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
@@ -6,19 +7,25 @@ from starlette.middleware.cors import CORSMiddleware
 from app.apis import auth as auth_router
 from app.apis import user as user_router
 from app.apis import stock as stock_router
+from app.services import stock_service
+import os
 import traceback
 
-from app.core.database import engine, Base
+from app.core.database import provision_database
 # ... (other imports)
 
-def create_db_and_tables():
-    Base.metadata.create_all(bind=engine)
+startup.mark('imports')
 
 def create_app():
     """
     启动项目
+
+    建库建表不在这里执行（每个 worker 都会运行，且 MySQL 暂时不可用时会导致启动失败），
+    改为部署时执行 migrations/provision_database.py；本地开发可设置 DB_PROVISION_ON_STARTUP=1。
     """
-    create_db_and_tables()  # 在应用启动时创建表
+    if os.getenv("DB_PROVISION_ON_STARTUP", "0").lower() in ("1", "true", "yes"):
+        provision_database()
+        startup.mark('provision_database')
 
     app = FastAPI(
         title="Financial Analysis",
@@ -63,6 +70,13 @@ def create_app():
             content={"detail": "服务器内部错误，请查看后端控制台日志"},
         )
 
+    app.add_event_handler("startup", lambda: startup.mark('server_boot'))
+    # 启动时从本地文件加载交易日历，并在后台定期刷新
+    app.add_event_handler("startup", stock_service.start_trade_calendar_refresh)
+    # 后台导入 akshare 并预热全市场行情快照（条件选股不在请求中访问上游）
+    app.add_event_handler("startup", stock_service.start_market_snapshot_warmup)
+    app.add_event_handler("startup", startup.ready)
+
     # 引入应用中的路由
     app.include_router(auth_router.router, prefix="/api/auth", tags=["认证"])
     app.include_router(user_router.router, prefix="/api/users", tags=["用户"])
@@ -71,6 +85,7 @@ def create_app():
     return app
 
 app = create_app()
+startup.mark('create_app')
 
 if __name__ == '__main__':
     uvicorn.run(app, host='0.0.0.0', port=8000)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+stock_basic_info 全文索引迁移脚本
+添加 ft_company_search、ft_company_industry 两个 ngram 全文索引，供 search_companies_by_industry 使用
+"""
+import pymysql
+import os
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 数据库连接信息
+DB_CONFIG = {
+    'host': os.getenv('DATABASE_HOST', 'localhost'),
+    'user': os.getenv('DATABASE_USER', 'root'),
+    'password': os.getenv('DATABASE_PASSWORD', ''),
+    'database': os.getenv('DATABASE_NAME', 'financial_analysis_db'),
+    'charset': 'utf8mb4'
+}
+
+# SQL语句列表（InnoDB 一条 ALTER 只能新建一个全文索引，分开执行）
+SQL_STATEMENTS = [
+    "ALTER TABLE stock_basic_info ADD FULLTEXT INDEX ft_company_search "
+    "(stock_code, company_name, a_stock_abbr, eastmoney_industry, regulatory_industry) WITH PARSER ngram",
+    "ALTER TABLE stock_basic_info ADD FULLTEXT INDEX ft_company_industry "
+    "(eastmoney_industry, regulatory_industry) WITH PARSER ngram",
+]
+
+def main():
+    try:
+        print("连接数据库...")
+        conn = pymysql.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        
+        print("开始执行迁移...")
+        for sql in SQL_STATEMENTS:
+            try:
+                print(f"执行: {sql}")
+                cursor.execute(sql)
+                print("✓ 成功")
+            except pymysql.err.OperationalError as e:
+                if "Duplicate key name" in str(e):
+                    print(f"⚠ 索引已存在，跳过")
+                else:
+                    raise
+        
+        conn.commit()
+        print("\n✅ 数据库迁移完成！")
+        
+        # 验证结果
+        cursor.execute("SHOW INDEX FROM stock_basic_info WHERE Index_type = 'FULLTEXT'")
+        rows = cursor.fetchall()
+        print("\n当前全文索引:")
+        for row in rows:
+            print(f"  - {row[2]}: {row[4]}")
+        
+        cursor.close()
+        conn.close()
+        
+    except Exception as e:
+        print(f"\n❌ 迁移失败: {e}")
+        return 1
+    
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
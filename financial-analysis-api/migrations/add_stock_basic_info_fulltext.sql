@@ -0,0 +1,11 @@
+-- 为 stock_basic_info 添加 ngram 全文索引（公司搜索 / 行业筛选）
+-- 执行时间: 2026-10-18
+-- 说明: ngram 解析器默认 ngram_token_size=2，短于 2 个字符的关键词由应用层退化为 LIKE 查询
+
+-- InnoDB 一条 ALTER 只能新建一个全文索引，分两条执行
+
+ALTER TABLE stock_basic_info
+ADD FULLTEXT INDEX ft_company_search (stock_code, company_name, a_stock_abbr, eastmoney_industry, regulatory_industry) WITH PARSER ngram;
+
+ALTER TABLE stock_basic_info
+ADD FULLTEXT INDEX ft_company_industry (eastmoney_industry, regulatory_industry) WITH PARSER ngram;
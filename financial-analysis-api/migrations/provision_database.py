@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库初始化脚本
+创建数据库（若不存在）及所有 ORM 模型对应的表。部署时执行一次，应用启动时不再建库建表。
+用法：
+  cd financial-analysis-api
+  python migrations/provision_database.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import DATABASE_NAME, provision_database  # noqa: E402
+
+
+def main():
+    try:
+        print(f"初始化数据库 {DATABASE_NAME} ...")
+        started = time.perf_counter()
+        provision_database()
+        print(f"\n✅ 数据库初始化完成（{time.perf_counter() - started:.2f}s）")
+    except Exception as e:
+        print(f"\n❌ 初始化失败: {e}")
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
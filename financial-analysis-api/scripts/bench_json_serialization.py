@@ -0,0 +1,167 @@
+"""
+脚本：bench_json_serialization.py
+用途：对比旧的逐单元格清洗路径（_clean_dataframe + _to_json_safe + jsonable_encoder）与
+      app/utils/dataframe_utils 中整列向量化序列化路径在 5000 行日线上的耗时。
+用法示例：
+  cd financial-analysis-api
+  python scripts/bench_json_serialization.py --rows 5000 --repeat 20
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.dataframe_utils import dataframe_to_json_bytes, dataframe_to_records  # noqa: E402
+
+
+# ---- 旧实现（从 stock_service 原样保留，仅用于对比） ----
+
+def _safe_number(x: Any) -> Any:
+    try:
+        if x is None:
+            return None
+        if isinstance(x, (np.integer,)):
+            return int(x)
+        if isinstance(x, (np.floating,)):
+            if np.isnan(x) or np.isinf(x):
+                return None
+            return float(x)
+        if pd.isna(x):
+            return None
+        return x
+    except Exception:
+        return None
+
+
+def _clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    df2 = df.copy()
+    for col in df2.columns:
+        df2[col] = df2[col].apply(_safe_number)
+    for col in df2.select_dtypes(include=['datetime64[ns]']).columns:
+        df2[col] = df2[col].dt.strftime('%Y-%m-%d')
+    return df2
+
+
+def _to_json_safe(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    out = []
+    for r in records:
+        nr = {}
+        for k, v in r.items():
+            if v is None:
+                nr[k] = None
+            elif isinstance(v, (np.integer,)):
+                nr[k] = int(v)
+            elif isinstance(v, (np.floating, float)):
+                if np.isnan(v) or np.isinf(v):
+                    nr[k] = None
+                else:
+                    nr[k] = float(v)
+            elif isinstance(v, (int, str, bool)):
+                nr[k] = v
+            else:
+                try:
+                    nr[k] = str(v)
+                except Exception:
+                    nr[k] = None
+        out.append(nr)
+    return out
+
+
+def make_history(rows: int) -> pd.DataFrame:
+    """构造与 ak.stock_zh_a_hist 标准化后结构一致的日线数据，并掺入少量 NaN/inf。"""
+    rng = np.random.default_rng(0)
+    close = 10 + rng.standard_normal(rows).cumsum() * 0.1
+    df = pd.DataFrame({
+        '日期': pd.bdate_range('2005-01-04', periods=rows).strftime('%Y-%m-%d'),
+        '股票代码': '000001',
+        '开盘': close + rng.standard_normal(rows) * 0.05,
+        '收盘': close,
+        '最高': close + 0.2,
+        '最低': close - 0.2,
+        '成交量': rng.integers(1_000, 2_000_000, rows),
+        '成交额': rng.random(rows) * 1e9,
+        '振幅': rng.random(rows) * 5,
+        '涨跌幅': rng.standard_normal(rows),
+        '涨跌额': rng.standard_normal(rows) * 0.1,
+        '换手率': rng.random(rows),
+    })
+    df.loc[df.sample(frac=0.01, random_state=1).index, '换手率'] = np.nan
+    df.loc[df.sample(frac=0.001, random_state=2).index, '涨跌幅'] = np.inf
+    return df
+
+
+def same_records(a: List[Dict[str, Any]], b: List[Dict[str, Any]]) -> bool:
+    """逐值比较；浮点数允许末位差异（to_json 最多保留 15 位小数）。"""
+    if len(a) != len(b):
+        return False
+    for ra, rb in zip(a, b):
+        if ra.keys() != rb.keys():
+            return False
+        for k, va in ra.items():
+            vb = rb[k]
+            if isinstance(va, float) and isinstance(vb, float):
+                if not math.isclose(va, vb, rel_tol=1e-12, abs_tol=1e-15):
+                    return False
+            elif va != vb:
+                return False
+    return True
+
+
+def bench(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark DataFrame -> JSON serialization paths.')
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    df = make_history(args.rows)
+
+    try:
+        from fastapi.encoders import jsonable_encoder
+    except Exception:
+        jsonable_encoder = None
+
+    def legacy():
+        records = _to_json_safe(_clean_dataframe(df).to_dict(orient='records'))
+        if jsonable_encoder is not None:
+            records = jsonable_encoder(records)
+        return json.dumps(records, ensure_ascii=False).encode('utf-8')
+
+    def vector_records():
+        return json.dumps(dataframe_to_records(df), ensure_ascii=False).encode('utf-8')
+
+    def vector_bytes():
+        return dataframe_to_json_bytes(df)
+
+    # 结果一致性校验
+    expected = json.loads(legacy())
+    assert same_records(json.loads(vector_records()), expected)
+    assert same_records(json.loads(vector_bytes()), expected)
+
+    t_legacy = bench(legacy, args.repeat)
+    print(f"rows={args.rows} repeat={args.repeat} (best of)")
+    print(f"  legacy  (_clean_dataframe + _to_json_safe{' + jsonable_encoder' if jsonable_encoder else ''}): {t_legacy:8.2f} ms")
+    for name, fn in (('dataframe_to_records + json.dumps', vector_records), ('dataframe_to_json_bytes', vector_bytes)):
+        t = bench(fn, args.repeat)
+        print(f"  {name:<40}: {t:8.2f} ms  ({t_legacy / t:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
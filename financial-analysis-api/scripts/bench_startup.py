@@ -0,0 +1,83 @@
+"""
+脚本：bench_startup.py
+用途：测量应用冷启动时间——从启动 uvicorn 进程到第一个请求成功返回的耗时，并收集应用打印的各启动阶段耗时
+      （见 app/core/startup.py）。每轮都新起一个进程，结果接近 gunicorn 新 worker 的启动时间。
+用法示例：
+  cd financial-analysis-api
+  python scripts/bench_startup.py --runs 5
+  python scripts/bench_startup.py --runs 3 --path /api/stocks/trade_dates --port 8765
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Optional, Tuple
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _wait_first_response(url: str, proc: subprocess.Popen, timeout: float) -> Optional[int]:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            return None
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                return resp.status
+        except urllib.error.HTTPError as e:
+            # 服务已在处理请求（业务错误也算已就绪）
+            return e.code
+        except Exception:
+            time.sleep(0.02)
+    return None
+
+
+def run_once(port: int, path: str, timeout: float) -> Tuple[Optional[float], Optional[int], str]:
+    """返回 (首个请求返回耗时, HTTP 状态码, 应用打印的启动汇总行)。"""
+    cmd = [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=PROJECT_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        status = _wait_first_response(f'http://127.0.0.1:{port}{path}', proc, timeout)
+        elapsed = time.perf_counter() - started if status is not None else None
+    finally:
+        proc.terminate()
+        try:
+            output, _ = proc.communicate(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            output, _ = proc.communicate()
+    summary = next((line for line in output.splitlines() if line.startswith('startup: ready')), '')
+    if elapsed is None:
+        print(output[-2000:], file=sys.stderr)
+    return elapsed, status, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure time from process start to first request served.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--path', default='/api/stocks/trade_dates', help='首个请求的路径')
+    parser.add_argument('--timeout', type=float, default=60.0, help='单轮最长等待秒数')
+    args = parser.parse_args()
+
+    times = []
+    for i in range(args.runs):
+        elapsed, status, summary = run_once(args.port, args.path, args.timeout)
+        if elapsed is None:
+            print(f"run {i + 1}: 启动失败或超时")
+            continue
+        times.append(elapsed)
+        print(f"run {i + 1}: first response {status} after {elapsed * 1000:.0f} ms  {summary}")
+
+    if times:
+        print(f"\nruns={len(times)}  min={min(times) * 1000:.0f} ms  median={statistics.median(times) * 1000:.0f} ms  max={max(times) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
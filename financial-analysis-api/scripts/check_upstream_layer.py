@@ -0,0 +1,109 @@
+"""
+脚本：check_upstream_layer.py
+用途：在本地桩服务器上验证上游访问层（app/core/upstream.py）的限流、连接复用、请求合并与熔断行为，不访问真实上游。
+用法示例：
+  cd financial-analysis-api
+  python scripts/check_upstream_layer.py
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 需在导入 upstream 之前设置，使桩服务器地址使用较小的限流与熔断参数
+os.environ['UPSTREAM_HTTP_ENABLED'] = '1'
+os.environ['UPSTREAM_RATE_LIMITS'] = '127.0.0.1=20/5'
+os.environ['UPSTREAM_BREAKER_FAILURES'] = '3'
+os.environ['UPSTREAM_BREAKER_COOLDOWN'] = '1'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from app.core import upstream  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头与响应体合并发送，避免 keep-alive 下的延迟确认拖慢每个请求，干扰限流计时
+    wbufsize = 64 * 1024
+    hits = {}
+    client_ports = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        with self.lock:
+            StubHandler.hits[path] = StubHandler.hits.get(path, 0) + 1
+            StubHandler.client_ports.add(self.client_address[1])
+        if path == '/slow':
+            time.sleep(0.3)
+        status = 500 if path == '/fail' else 200
+        body = json.dumps({'path': self.path}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def check(name: str, ok: bool, detail: str) -> bool:
+    print(f"[{'PASS' if ok else 'FAIL'}] {name}: {detail}")
+    return ok
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    upstream.install()
+    results = []
+
+    # 1. 限流 + 连接复用：桶容量 5、每秒 20 个，25 个顺序请求至少需要 (25 - 5) / 20 = 1 秒，且只用一条连接
+    started = time.monotonic()
+    for i in range(25):
+        requests.get(f'{base}/ok', params={'i': i}).raise_for_status()
+    elapsed = time.monotonic() - started
+    throttled = upstream.upstream_layer.stats()['hosts']['127.0.0.1']['throttled_seconds']
+    results.append(check('rate limit', elapsed >= 0.95 and throttled >= 0.5,
+                         f'25 requests took {elapsed:.2f}s, {throttled:.2f}s throttled (expect >= 1.0s)'))
+    results.append(check('keep-alive', len(StubHandler.client_ports) == 1,
+                         f'{len(StubHandler.client_ports)} client connection(s) for 25 requests'))
+
+    # 2. 合并：10 个并发的相同请求只到达桩服务器一次
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        bodies = list(pool.map(lambda _: requests.get(f'{base}/slow', params={'x': 1}).json(), range(10)))
+    hits = StubHandler.hits.get('/slow', 0)
+    results.append(check('coalescing', hits == 1 and len({json.dumps(b) for b in bodies}) == 1,
+                         f'10 concurrent identical requests -> {hits} upstream hit(s)'))
+
+    # 3. 熔断：连续 3 次 5xx 后熔断，期间请求不再到达上游；冷却后试探成功即恢复
+    for _ in range(3):
+        requests.get(f'{base}/fail')
+    before = sum(StubHandler.hits.values())
+    try:
+        requests.get(f'{base}/ok')
+        rejected = False
+    except upstream.UpstreamCircuitOpen:
+        rejected = True
+    results.append(check('breaker open', rejected and sum(StubHandler.hits.values()) == before,
+                         f"state={upstream.upstream_layer.stats()['hosts']['127.0.0.1']['breaker']}"))
+    time.sleep(1.1)
+    requests.get(f'{base}/ok').raise_for_status()
+    state = upstream.upstream_layer.stats()['hosts']['127.0.0.1']['breaker']
+    results.append(check('breaker recovery', state == 'closed', f'state after probe={state}'))
+
+    print(json.dumps(upstream.upstream_layer.stats(), ensure_ascii=False, indent=2))
+    server.shutdown()
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+"""
+脚本：load_stock_basic_info.py
+用途：全市场装载/更新 stock_basic_info（公司基本资料）。
+  1) universe：取全部 A 股代码（ak.stock_info_a_code_name）；
+  2) fetch：并发抓取东方财富 F10 公司概况（CompanySurvey），经 app.core.upstream 的连接池与限流（eastmoney.com 的速率见 UPSTREAM_RATE_LIMITS），
+     每抓到一家即追加写入检查点文件；
+  3) load：一次读出表中现有数据；
+  4) diff：逐行比较，只保留新增和有变化的公司（接口未返回的字段沿用表中原值）；
+  5) apply：多行 INSERT ... ON DUPLICATE KEY UPDATE，按 --chunk-size 行一个事务提交。
+  结束时打印各阶段耗时。
+
+中断后加 --resume 重新运行：已抓取的公司从检查点读取，只抓剩余部分；diff 基于表的当前内容重新计算，已提交的块不会重复写入。
+全部成功后删除检查点。表数据变化后，API 进程的公司资料缓存会在 COMPANY_PROFILE_VERSION_CHECK_SECONDS 内自动失效。
+
+用法示例：
+  cd financial-analysis-api
+  python scripts/load_stock_basic_info.py
+  python scripts/load_stock_basic_info.py --resume --workers 8 --chunk-size 500
+  python scripts/load_stock_basic_info.py --codes 000001,600000 --dry-run
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymysql  # noqa: E402
+import requests  # noqa: E402
+from dotenv import load_dotenv  # noqa: E402
+
+from app.core import upstream  # noqa: E402
+from app.core.upstream import ak  # noqa: E402
+from app.services.company_profiles import normalize_stock_code  # noqa: E402
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host': os.getenv('DATABASE_HOST', 'localhost'),
+    'port': int(os.getenv('DATABASE_PORT') or 3306),
+    'user': os.getenv('DATABASE_USER', 'root'),
+    'password': os.getenv('DATABASE_PASSWORD', ''),
+    'database': os.getenv('DATABASE_NAME', 'financial_analysis_db'),
+    'charset': 'utf8mb4'
+}
+
+SURVEY_URL = 'https://emweb.securities.eastmoney.com/PC_HSF10/CompanySurvey/PageAjax'
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'etl', 'stock_basic_info.jsonl')
+
+# F10 公司概况（jbzl）字段 -> stock_basic_info 列
+FIELD_MAP = {
+    'ORG_NAME': 'company_name',
+    'ORG_NAME_EN': 'english_name',
+    'FORMERNAME': 'former_name',
+    'STR_CODEA': 'a_stock_code',
+    'STR_NAMEA': 'a_stock_abbr',
+    'EXPAND_NAME_ABBR': 'extended_abbr',
+    'STR_CODEB': 'b_stock_code',
+    'STR_NAMEB': 'b_stock_abbr',
+    'STR_CODEH': 'h_stock_code',
+    'STR_NAMEH': 'h_stock_abbr',
+    'SECURITY_TYPE': 'security_category',
+    'EM2016': 'eastmoney_industry',
+    'TRADE_MARKET': 'listing_exchange',
+    'INDUSTRYCSRC1': 'regulatory_industry',
+    'PRESIDENT': 'general_manager',
+    'LEGAL_PERSON': 'legal_representative',
+    'SECRETARY': 'board_secretary',
+    'CHAIRMAN': 'chairman',
+    'SECPRESENT': 'securities_representative',
+    'INDEDIRECTORS': 'independent_directors',
+    'ORG_TEL': 'contact_phone',
+    'ORG_EMAIL': 'email',
+    'ORG_FAX': 'fax',
+    'ORG_WEB': 'website',
+    'ADDRESS': 'office_address',
+    'REG_ADDRESS': 'registered_address',
+    'PROVINCE': 'region',
+    'ADDRESS_POSTCODE': 'postal_code',
+    'REG_CAPITAL': 'registered_capital',
+    'REG_NUM': 'business_registration',
+    'EMP_NUM': 'employee_count',
+    'TATOLNUMBER': 'management_count',
+    'LAW_FIRM': 'law_firm',
+    'ACCOUNTFIRM_NAME': 'accounting_firm',
+    'ORG_PROFILE': 'company_intro',
+    'BUSINESS_SCOPE': 'business_scope',
+}
+COLUMNS = ['stock_code'] + list(FIELD_MAP.values())
+
+_DECIMAL_RE = re.compile(r'^-?\d+\.\d+$')
+
+
+# ---- 计时 ----
+
+class PhaseTimer:
+    def __init__(self):
+        self.phases: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        print(f"[{name}] ...")
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.phases.append((name, elapsed))
+            print(f"[{name}] {elapsed:.2f}s")
+
+    def report(self) -> None:
+        total = sum(s for _, s in self.phases)
+        print("\n阶段耗时：")
+        for name, seconds in self.phases:
+            print(f"  {name:10} {seconds:8.2f}s  {seconds / total * 100 if total else 0:5.1f}%")
+        print(f"  {'total':10} {total:8.2f}s")
+
+
+# ---- universe / fetch ----
+
+def load_universe(codes_arg: Optional[str]) -> List[str]:
+    if codes_arg:
+        raw = [c for c in codes_arg.split(',') if c.strip()]
+    else:
+        if not ak:
+            raise RuntimeError('akshare 未安装，无法获取全市场代码列表；可用 --codes 指定')
+        df = ak.stock_info_a_code_name()
+        raw = [] if df is None or df.empty else list(df['code'])
+    codes = []
+    for c in raw:
+        code = normalize_stock_code(str(c))
+        if code is None:
+            print(f"  跳过无法识别的代码: {c}")
+        else:
+            codes.append(code)
+    return list(dict.fromkeys(codes))
+
+
+def _clean(value: Any) -> Any:
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def fetch_survey(code: str, retries: int) -> Dict[str, Any]:
+    """抓取单家公司的 F10 概况并映射为表字段；只包含接口实际返回的字段。"""
+    last_error: Optional[Exception] = None
+    for attempt in range(retries + 1):
+        try:
+            resp = requests.get(SURVEY_URL, params={'code': code})
+            resp.raise_for_status()
+            rows = (resp.json() or {}).get('jbzl') or []
+            if not rows:
+                raise ValueError('empty jbzl')
+            src = rows[0]
+            record = {'stock_code': code}
+            for key, column in FIELD_MAP.items():
+                if key in src:
+                    record[column] = _clean(src[key])
+            return record
+        except (requests.RequestException, ValueError) as e:
+            last_error = e
+            if attempt < retries:
+                time.sleep(1.0 * (attempt + 1))
+    raise RuntimeError(f"{code}: {last_error}")
+
+
+def read_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    records: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 中断时可能留下半行，忽略
+                continue
+            records[record['stock_code']] = record
+    return records
+
+
+def fetch_all(codes: List[str], checkpoint: str, resume: bool, workers: int, retries: int) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    os.makedirs(os.path.dirname(checkpoint), exist_ok=True)
+    wanted = set(codes)
+    records = {c: r for c, r in read_checkpoint(checkpoint).items() if c in wanted} if resume else {}
+    todo = [c for c in codes if c not in records]
+    if resume:
+        print(f"  检查点中已有 {len(records)} 家，待抓取 {len(todo)} 家")
+
+    failed: List[str] = []
+    with open(checkpoint, 'a' if resume else 'w', encoding='utf-8') as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_survey, c, retries): c for c in todo}
+        for i, fut in enumerate(as_completed(futures), 1):
+            code = futures[fut]
+            try:
+                record = fut.result()
+            except Exception as e:
+                failed.append(code)
+                print(f"  ✗ {e}")
+                continue
+            records[code] = record
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            out.flush()
+            if i % 200 == 0:
+                print(f"  {i}/{len(todo)}")
+    return records, failed
+
+
+# ---- load / diff ----
+
+def load_existing(conn, codes: List[str]) -> Dict[str, Dict[str, Any]]:
+    with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+        cursor.execute(f"SELECT {', '.join(COLUMNS)} FROM stock_basic_info")
+        rows = cursor.fetchall()
+    wanted = set(codes)
+    return {r['stock_code']: r for r in rows if r['stock_code'] in wanted}
+
+
+def _comparable(value: Any) -> Optional[str]:
+    """比较用的规范形式：空串视同 NULL，数值按十进制规范化（1.50 与 1.5 相等）。"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)) or (isinstance(value, str) and _DECIMAL_RE.match(value.strip())):
+        try:
+            return format(Decimal(str(value).strip()).normalize(), 'f')
+        except InvalidOperation:
+            pass
+    s = str(value).strip()
+    return s or None
+
+
+def diff(records: Dict[str, Dict[str, Any]], existing: Dict[str, Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+    """返回 (新增行, 变化行, 未变化数)；行中包含全部列，接口未返回的列沿用表中原值。"""
+    inserts, updates, unchanged = [], [], 0
+    for code, record in records.items():
+        old = existing.get(code)
+        if old is None:
+            inserts.append({c: record.get(c) for c in COLUMNS})
+            continue
+        merged = {c: record[c] if c in record else old.get(c) for c in COLUMNS}
+        if any(_comparable(merged[c]) != _comparable(old.get(c)) for c in COLUMNS):
+            updates.append(merged)
+        else:
+            unchanged += 1
+    return inserts, updates, unchanged
+
+
+# ---- apply ----
+
+def _upsert_sql(n_rows: int) -> str:
+    placeholders = '(' + ', '.join(['%s'] * len(COLUMNS)) + ')'
+    assignments = ', '.join(f"{c} = VALUES({c})" for c in COLUMNS if c != 'stock_code')
+    return (
+        f"INSERT INTO stock_basic_info ({', '.join(COLUMNS)}) VALUES "
+        + ', '.join([placeholders] * n_rows)
+        + f" ON DUPLICATE KEY UPDATE {assignments}"
+    )
+
+
+def apply_rows(conn, rows: List[Dict[str, Any]], chunk_size: int, batch_size: int) -> int:
+    """按 chunk_size 行一个事务、batch_size 行一条多行 INSERT 写入；某块失败时回滚该块并抛出。"""
+    written = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            with conn.cursor() as cursor:
+                for b in range(0, len(chunk), batch_size):
+                    batch = chunk[b:b + batch_size]
+                    params = [row[c] for row in batch for c in COLUMNS]
+                    cursor.execute(_upsert_sql(len(batch)), params)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            print(f"  第 {start + 1}-{start + len(chunk)} 行所在事务失败，已回滚")
+            raise
+        written += len(chunk)
+        print(f"  已提交 {written}/{len(rows)}")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk load company master data into stock_basic_info.')
+    parser.add_argument('--codes', help='只装载指定代码（逗号分隔），默认全市场')
+    parser.add_argument('--resume', action='store_true', help='从检查点继续：跳过已抓取的公司')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='抓取结果检查点文件（JSON Lines）')
+    parser.add_argument('--workers', type=int, default=8, help='并发抓取线程数（实际速率受 UPSTREAM_RATE_LIMITS 限制）')
+    parser.add_argument('--retries', type=int, default=2, help='单家公司抓取失败的重试次数')
+    parser.add_argument('--chunk-size', type=int, default=500, help='每个事务写入的行数')
+    parser.add_argument('--batch-size', type=int, default=100, help='每条多行 INSERT 的行数')
+    parser.add_argument('--dry-run', action='store_true', help='只抓取和比较，不写库')
+    args = parser.parse_args()
+
+    upstream.install()
+    timer = PhaseTimer()
+    conn = None
+    try:
+        with timer.phase('universe'):
+            codes = load_universe(args.codes)
+            print(f"  共 {len(codes)} 只股票")
+
+        with timer.phase('fetch'):
+            records, failed = fetch_all(codes, args.checkpoint, args.resume, args.workers, args.retries)
+            print(f"  抓取成功 {len(records)} 家，失败 {len(failed)} 家")
+
+        conn = pymysql.connect(**DB_CONFIG)
+        with timer.phase('load'):
+            existing = load_existing(conn, codes)
+            print(f"  表中已有 {len(existing)} 家")
+
+        with timer.phase('diff'):
+            inserts, updates, unchanged = diff(records, existing)
+            print(f"  新增 {len(inserts)}，变化 {len(updates)}，未变化 {unchanged}")
+
+        if args.dry_run:
+            print("\n--dry-run：未写入数据库")
+        else:
+            with timer.phase('apply'):
+                apply_rows(conn, inserts + updates, max(1, args.chunk_size), max(1, args.batch_size))
+    except Exception as e:
+        print(f"\n❌ 装载失败: {e}")
+        print(f"   已抓取的数据保存在 {args.checkpoint}，修复后加 --resume 重新运行")
+        timer.report()
+        return 1
+    finally:
+        if conn is not None:
+            conn.close()
+
+    timer.report()
+    if failed:
+        print(f"\n⚠ {len(failed)} 家抓取失败（{', '.join(failed[:20])}{' ...' if len(failed) > 20 else ''}），加 --resume 重新运行可只补抓这些")
+        return 1
+    if not args.dry_run and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    print("\n✅ 装载完成")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
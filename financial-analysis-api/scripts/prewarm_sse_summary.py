@@ -0,0 +1,31 @@
+"""
+脚本：prewarm_sse_summary.py
+用途：批量预热上交所每日概况缓存（仅已最终确认的交易日），MarketSummary 页面切换日期时即可直接命中本地缓存。
+用法示例（PowerShell）：
+  conda activate financial-analysis; python .\scripts\prewarm_sse_summary.py --start 20240101
+  conda activate financial-analysis; python .\scripts\prewarm_sse_summary.py --start 20240101 --end 20241231 --delay 1
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import stock_service  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prewarm the SSE daily summary cache for a date range.')
+    parser.add_argument('--start', dest='start', required=True, help='开始日期 YYYYMMDD')
+    parser.add_argument('--end', dest='end', required=False, help='结束日期 YYYYMMDD，默认最近一个已开市日')
+    parser.add_argument('--delay', dest='delay', type=float, default=0.5, help='两次回源之间的间隔秒数')
+    args = parser.parse_args()
+
+    report = stock_service.prewarm_sse_daily_summaries(args.start, args.end, delay=args.delay)
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()